@@ -1,23 +1,29 @@
-import pandas as pd
-from surrealdb import Surreal
+import asyncio
+import time
+
+from surrealdb import AsyncSurreal, RecordID
 import tqdm
 import os
 
-from graph_examples.helpers.constants import * 
-from graph_examples.helpers import loggers   
+from graph_examples.helpers.constants import *
+from graph_examples.helpers import loggers
 from graph_examples.helpers.params import DatabaseParams, SurrealParams
 
 # Initialize database and model parameters, and argument loader
 db_params = DatabaseParams()
 args_loader = ArgsLoader("Input FastText embeddings model",db_params)
 
+"""
+Inserts a batch of word embeddings with a native array INSERT. Words that are already in the
+table are updated, so a load without -ow True refreshes the model instead of failing.
+
+Args:
+    $embeddings (list): The firm_name_embedding_model records, each with an id, word and embedding.
+"""
 INSERT_EMBEDDINGS = """
-    FOR $row IN $embeddings {
-        CREATE type::thing("firm_name_embedding_model",$row.word)  CONTENT {
-        word : $row.word,
-        embedding: $row.embedding
-        } RETURN NONE;
-    };
+    INSERT INTO firm_name_embedding_model $embeddings
+        ON DUPLICATE KEY UPDATE embedding = $input.embedding
+        RETURN NONE;
 """
 
 DELETE_EMBEDDINGS = """
@@ -31,77 +37,139 @@ The number of embedding vectors to insert in each batch. This can be adjusted to
 performance based on the database server's capabilities and network conditions.
 """
 
-def surreal_model_insert(model_path,overwrite,logger):
-    """
-    Inserts word embeddings from a model file into SurrealDB.
+CONCURRENCY = 4
+"""
+The number of batches inserted at once, each on its own connection.
+"""
 
-    This function reads a word embedding model file, creates a DataFrame from the word-vector pairs,
-    and then inserts the embeddings into SurrealDB in batches. It also updates the embedding model
-    definition in the database.
+
+def read_embedding_batches(model_path):
+    """
+    Streams a FastText text model file as batches of firm_name_embedding_model records,
+    so the model is never held in memory as a whole.
 
     Args:
-        model_trainer (str): Name of the training algorithm (e.g., 'GLOVE', 'FASTTEXT').
-        model_version (str): Version of the model (e.g., '300d', 'custom wiki').
         model_path (str): Path to the model file.
-        description (str): Description of the embedding model.
-        corpus (str): Description of the training data.
-        logger (logging.Logger): Logger instance.
-    """
 
-    word_dictionary = {}
+    Yields:
+        list[dict]: Up to CHUNK_SIZE records.
+    """
+    batch = []
     with open(model_path, 'r', encoding='utf-8') as f:
         for line in f:
             values = line.split()
-            word = values[0]
-            vector = np.asarray(values[1:], "float32")
-            word_dictionary[word] = vector
-
-
-    with Surreal(db_params.DB_PARAMS.url) as connection:
+            if len(values) < 2:
+                continue
+            word = unescape_token_text_for_txt_file(values[0])
+            batch.append({
+                "id": RecordID("firm_name_embedding_model", word),
+                "word": word,
+                "embedding": [float(value) for value in values[1:]],
+            })
+            if len(batch) >= CHUNK_SIZE:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+async def connect():
+    connection = AsyncSurreal(db_params.DB_PARAMS.url)
+    await connection.signin({"username": db_params.DB_PARAMS.username, "password": db_params.DB_PARAMS.password})
+    await connection.use(db_params.DB_PARAMS.namespace, db_params.DB_PARAMS.database)
+    return connection
+
+
+async def insert_embeddings(model_path, concurrency):
+    """
+    Inserts the batches of the model file with `concurrency` connections writing at once.
+    The file is read while the batches are written, with at most two batches per connection waiting.
 
+    Args:
+        model_path (str): Path to the model file.
+        concurrency (int): The number of connections writing batches.
 
-        connection.signin({"username": db_params.DB_PARAMS.username, "password": db_params.DB_PARAMS.password})
-        connection.use(db_params.DB_PARAMS.namespace, db_params.DB_PARAMS.database)
-        logger.info("Connected to SurrealDB")
+    Returns:
+        int: The number of words inserted.
+    """
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    word_count = 0
+    errors = []
+
+    async def write_batches(connection, pbar):
+        # after a failure the remaining batches are drained without being written
+        nonlocal word_count
+        while True:
+            batch = await queue.get()
+            try:
+                if batch is None:
+                    return
+                if not errors:
+                    SurrealParams.ParseResponseForErrors(await connection.query_raw(
+                        INSERT_EMBEDDINGS, params={"embeddings": batch}
+                    ))
+                    word_count += len(batch)
+                    pbar.update(len(batch))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                queue.task_done()
+
+    connections = []
+    try:
+        # opened one at a time, so the ones already open are closed if a later one fails
+        for _ in range(concurrency):
+            connections.append(await connect())
+        with tqdm.tqdm(desc="Inserting", unit="words") as pbar:
+            writers = [asyncio.create_task(write_batches(connection, pbar)) for connection in connections]
+            for batch in read_embedding_batches(model_path):
+                # stop reading as soon as a batch fails
+                if errors:
+                    break
+                await queue.put(batch)
+            for _ in writers:
+                await queue.put(None)
+            await asyncio.gather(*writers)
+        if errors:
+            raise errors[0]
+    finally:
+        for connection in connections:
+            await connection.close()
+    return word_count
+
+
+def surreal_model_insert(model_path,overwrite,logger,concurrency = CONCURRENCY):
+    """
+    Inserts word embeddings from a model file into SurrealDB.
 
+    This function streams the word-vector pairs of a word embedding model file into the
+    firm_name_embedding_model table in batches, written by several connections at once,
+    and logs the words/sec.
 
-        logger.info(f"Reading model")
-        # Load the embedding model
-        # Create DataFrame from model data.
-        embeddings_df = pd.DataFrame({'word': word_dictionary.keys(), 'embedding': word_dictionary.values()})
-        # Calculate number of chunks for batch processing.
-        total_rows = len(embeddings_df)
-        total_chunks = (total_rows + CHUNK_SIZE - 1) // CHUNK_SIZE  # Calculate number of chunks for batch processing
+    Args:
+        model_path (str): Path to the model file.
+        overwrite (bool): Delete the existing embeddings first.
+        logger (logging.Logger): Logger instance.
+        concurrency (int, optional): The number of batches inserted at once. Defaults to CONCURRENCY.
+    """
 
+    if overwrite:
+        async def delete_embeddings():
+            connection = await connect()
+            try:
+                SurrealParams.ParseResponseForErrors(await connection.query_raw(DELETE_EMBEDDINGS))
+            finally:
+                await connection.close()
 
         logger.info(f"Deleting any rows from model")
+        # Delete existing embeddings for this particular model
+        asyncio.run(delete_embeddings())
 
-        if overwrite:
-            # Delete existing embeddings for this particular model
-            SurrealParams.ParseResponseForErrors(connection.query_raw(DELETE_EMBEDDINGS))
-            logger.info("Inserting rows into SurrealDB")
-
-        with tqdm.tqdm(total=total_chunks, desc="Inserting") as pbar:
-            # Iterate through chunks of data.
-            for i in range(0, total_rows, CHUNK_SIZE):
-                # Get a chunk of data.
-                chunk = embeddings_df.iloc[i:i + CHUNK_SIZE]
-
-                # create an array of dicts to bulk load into surreal
-                formatted_rows = [
-                    {
-                        "word": unescape_token_text_for_txt_file(str(row["word"])),
-                        "embedding":row["embedding"].tolist()
-                    }
-                    for _, row in chunk.iterrows()
-                ]
-
-                # Insert the chunk.
-                SurrealParams.ParseResponseForErrors(connection.query_raw(
-                    INSERT_EMBEDDINGS, params={"embeddings": formatted_rows}
-                ))
-                # Update progress bar.
-                pbar.update(1)
+    logger.info(f"Inserting rows into SurrealDB with {concurrency} concurrent batches")
+    start = time.perf_counter()
+    word_count = asyncio.run(insert_embeddings(model_path, concurrency))
+    seconds = time.perf_counter() - start
+    logger.info(f"Inserted {word_count} words in {seconds:.1f}s ({word_count / max(seconds, 1e-9):.0f} words/sec)")
 
 
 
@@ -112,23 +180,25 @@ def insert_firm_ft_model() -> None:
     logger = loggers.setup_logger("SurrealEmbeddingsInsert")
     overwrite = True
     # Add command-line arguments specific to embedding insertion.
-    args_loader.AddArg("overwrite","ow","overwrite","If true delete the model and re-upload. Else exit if model and data exists. (default{0})",overwrite)
+    args_loader.AddArg("overwrite","ow","overwrite","If true delete the model and re-upload. Else update the words already loaded. (default{0})",overwrite)
+    args_loader.AddArg("concurrency","con","concurrency","The number of batches to insert concurrently, each on its own connection. (default{0})",CONCURRENCY)
     # Parse command-line arguments.
     args_loader.LoadArgs()
 
-  
+
     if args_loader.AdditionalArgs["overwrite"]["value"]:
         overwrite = str(args_loader.AdditionalArgs["overwrite"]["value"]).lower()in ("true","yes","1")
+    concurrency = int(args_loader.AdditionalArgs["concurrency"]["value"])
 
 
     # Log the parsed arguments.
     logger.info(args_loader.string_to_print())
 
-    
+
     # Insert the embedding model.
-    surreal_model_insert(os.path.join(FAST_TEXT_DIR, 'model.txt'),overwrite,logger)
+    surreal_model_insert(os.path.join(FAST_TEXT_DIR, 'model.txt'),overwrite,logger,concurrency)
 
     logger.info(f"Model loaded!")
 
 if __name__ == "__main__":
-    insert_firm_ft_model()
\ No newline at end of file
+    insert_firm_ft_model()
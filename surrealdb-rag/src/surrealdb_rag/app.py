@@ -1,5 +1,6 @@
 """Backend for SurrealDB chat interface."""
 
+import asyncio
 import contextlib
 import datetime
 from collections.abc import AsyncGenerator
@@ -11,8 +12,10 @@ from fastapi.exceptions import RequestValidationError
 
 import uvicorn
 import ast
+import time
 from urllib.parse import urlencode
 
+from surrealdb_rag.helpers import loggers
 from surrealdb_rag.helpers.constants import ArgsLoader
 from surrealdb_rag.helpers.params import DatabaseParams, ModelParams, SurrealParams
 
@@ -24,6 +27,11 @@ from surrealdb_rag.helpers.corpus_data_handler import CorpusTableListHandler,Cor
 
 from surrealdb_rag.helpers.chat_handler import ChatHandler
 
+from surrealdb_rag.helpers.chat_cache import (
+    DEFAULT_RESPONSE_CACHE_SIMILARITY, DEFAULT_RESPONSE_CACHE_SIZE, DEFAULT_RESPONSE_CACHE_TTL, LLMResponseCache,
+    DEFAULT_RETRIEVAL_CACHE_SIZE, DEFAULT_RETRIEVAL_CACHE_TTL, RetrievalCache
+)
+
 from fastapi.responses import JSONResponse
 from starlette.exceptions import HTTPException
 
@@ -32,10 +40,29 @@ from starlette.exceptions import HTTPException
 db_params = DatabaseParams()
 model_params = ModelParams()
 args_loader = ArgsLoader("LLM Model Handler",db_params,model_params)
+args_loader.AddArg("stream_responses","st","stream_responses","Stream the LLM's answers into the chat as they are generated. (default{0})",True)
+args_loader.AddArg("response_cache_size","rcs","response_cache_size","The most LLM answers to cache, 0 for none. (default{0})",DEFAULT_RESPONSE_CACHE_SIZE)
+args_loader.AddArg("response_cache_ttl","rct","response_cache_ttl","The seconds an LLM answer is served from the cache. (default{0})",DEFAULT_RESPONSE_CACHE_TTL)
+args_loader.AddArg("response_cache_similarity","rcsim","response_cache_similarity","The lowest cosine similarity of a near-identical question's embedding to serve its cached answer, above 1 for identical questions only. (default{0})",DEFAULT_RESPONSE_CACHE_SIMILARITY)
+args_loader.AddArg("retrieval_cache_size","rtcs","retrieval_cache_size","The most user messages' retrieved documents and knowledge graphs to cache, 0 for none. (default{0})",DEFAULT_RETRIEVAL_CACHE_SIZE)
+args_loader.AddArg("retrieval_cache_ttl","rtct","retrieval_cache_ttl","The seconds a user message's retrieved documents and knowledge graph are served from the cache. (default{0})",DEFAULT_RETRIEVAL_CACHE_TTL)
 args_loader.LoadArgs()
 
+STREAM_RESPONSES = str(args_loader.AdditionalArgs["stream_responses"]["value"]).lower() in ("true", "yes", "1")
+"""
+When True a user message is answered through /chats/{chat_id}/stream-system-message, otherwise
+through /chats/{chat_id}/send-system-message once the whole answer is saved.
+"""
+
 GRAPH_SIZE_LIMIT = 1000
 
+CORPUS_LOAD_CHECK_SECONDS = 30
+"""
+How often the app checks the corpus tables' `loaded_at` to drop what it has cached for a reloaded corpus.
+"""
+
+logger = loggers.setup_logger("SurrealDBRAGApp")
+
 
 
 
@@ -66,11 +93,43 @@ async def lifespan(_: fastapi.FastAPI) -> AsyncGenerator:
     life_span["llm_models"] = await model_list.available_llm_models()
     life_span["corpus_tables"] = await corpus_list.available_corpus_tables()
 
+    life_span["response_cache"] = LLMResponseCache(
+        int(args_loader.AdditionalArgs["response_cache_size"]["value"]),
+        float(args_loader.AdditionalArgs["response_cache_ttl"]["value"]),
+        float(args_loader.AdditionalArgs["response_cache_similarity"]["value"]))
+    life_span["retrieval_cache"] = RetrievalCache(
+        int(args_loader.AdditionalArgs["retrieval_cache_size"]["value"]),
+        float(args_loader.AdditionalArgs["retrieval_cache_ttl"]["value"]))
+    life_span["title_tasks"] = {}
+    corpus_load_watcher = asyncio.create_task(watch_corpus_loads(connection))
 
     yield
+    corpus_load_watcher.cancel()
+    for title_task in life_span["title_tasks"].values():
+        title_task.cancel()
     life_span.clear()
 
 
+async def watch_corpus_loads(connection: AsyncSurreal) -> None:
+    """Every CORPUS_LOAD_CHECK_SECONDS, drops the cached answers and retrievals built on a corpus table whose
+    `loaded_at` has changed since the last check, as the ingestion scripts set it when they load rows."""
+    loaded_at = {}
+    while True:
+        try:
+            corpus_tables = await connection.query("SELECT table_name, loaded_at FROM corpus_table;")
+            for corpus_table in corpus_tables:
+                table_name = corpus_table["table_name"]
+                table_loaded_at = str(corpus_table.get("loaded_at"))
+                if table_name in loaded_at and loaded_at[table_name] != table_loaded_at:
+                    dropped_answers = life_span["response_cache"].invalidate_corpus(table_name)
+                    dropped_retrievals = life_span["retrieval_cache"].invalidate_corpus(table_name)
+                    logger.info(f"{table_name} was reloaded at {table_loaded_at}, dropped {dropped_answers} cached answers and {dropped_retrievals} cached retrievals")
+                loaded_at[table_name] = table_loaded_at
+        except Exception:
+            logger.exception("Checking the corpus tables for reloads failed")
+        await asyncio.sleep(CORPUS_LOAD_CHECK_SECONDS)
+
+
 # Initialize FastAPI application
 app = fastapi.FastAPI(lifespan=lifespan)
 app.mount("/static", staticfiles.StaticFiles(directory="static"), name="static")
@@ -280,7 +339,7 @@ async def send_user_message(
     """Send user message. The UX will post then call a send_system_message to query the LLM."""
 
     embed_model = ast.literal_eval(embed_model)
-    chat_handler = ChatHandler(life_span["surrealdb"])
+    chat_handler = ChatHandler(life_span["surrealdb"], retrieval_cache = life_span["retrieval_cache"])
   
     if not graph_mode:
         graph_mode = ""
@@ -296,12 +355,52 @@ async def send_user_message(
             "request": request,
             "chat_id": chat_id,
             "new_message": True,
+            "stream_responses": STREAM_RESPONSES,
             "message" : message["message"]
         },
     )
 
 
 
+def start_chat_title_task(chat_id: str, llm_handler: RAGChatHandler) -> asyncio.Task:
+    """Starts generating a chat's title in the background, unless it is already being generated, see
+    ChatHandler.generate_chat_title. The task is kept in life_span["title_tasks"] until it is done.
+
+    Returns:
+        asyncio.Task: The task, whose result is the new title or "" if the chat already had one.
+    """
+    title_tasks = life_span["title_tasks"]
+    if chat_id in title_tasks:
+        return title_tasks[chat_id]
+
+    async def generate_title():
+        start = time.perf_counter()
+        try:
+            new_title = await ChatHandler(life_span["surrealdb"]).generate_chat_title(chat_id, llm_handler)
+            if new_title:
+                logger.info(f"{chat_id}: titled '{new_title}' in {time.perf_counter() - start:.2f}s")
+            return new_title
+        except Exception:
+            logger.exception(f"{chat_id}: generating the title failed")
+            return ""
+        finally:
+            title_tasks.pop(chat_id, None)
+
+    title_tasks[chat_id] = asyncio.create_task(generate_title())
+    return title_tasks[chat_id]
+
+
+@app.get("/chats/{chat_id}/pending-title")
+async def pending_title(chat_id: str) -> JSONResponse:
+    """Return the title of a chat once the title being generated in the background, if any, is saved, so the
+    UI can show it without the answer waiting for it."""
+    title_task = life_span["title_tasks"].get(chat_id)
+    if title_task:
+        # shielded, so a closed request doesn't cancel the title
+        await asyncio.shield(title_task)
+    return JSONResponse({"title": await ChatHandler(life_span["surrealdb"]).get_chat_title(chat_id)})
+
+
 @app.post(
     "/chats/{chat_id}/send-system-message",
     response_class=responses.HTMLResponse,
@@ -316,7 +415,7 @@ async def send_system_message(
     """Send system message. This queries the LLM with the relevant context and inputs"""
 
     
-    chat_handler = ChatHandler(life_span["surrealdb"])
+    chat_handler = ChatHandler(life_span["surrealdb"], life_span["response_cache"])
 
     model_data = life_span["llm_models"].get(llm_model)
     if not model_data:
@@ -326,11 +425,11 @@ async def send_system_message(
 
     message = await chat_handler.create_system_message(
         chat_id, llm_model, prompt_template, number_of_chats,llm_handler)
+    start_chat_title_task(chat_id, llm_handler)
     return templates.TemplateResponse(
         "message.html",
         {
             "request": request,
-            "new_title": message["new_title"],
             "chat_id": chat_id,
             "new_message": True,
             "message": message["message"]
@@ -339,7 +438,95 @@ async def send_system_message(
 
 
 
-                                                                   
+
+@app.post("/chats/{chat_id}/stream-system-message")
+async def stream_system_message(
+    request: fastapi.Request, 
+    chat_id: str,
+    llm_model: str = fastapi.Form(...),
+    prompt_template: str = fastapi.Form(...),
+    number_of_chats: int = fastapi.Form(...)
+) -> responses.StreamingResponse:
+    """Stream the system message as server-sent events: a `token` event with each chunk of text as the LLM
+    generates it, then once the answer is saved through fn::create_system_message a `message` event with the
+    rendered message. The stream stays open for the chat's title, generated in the background once the answer
+    is saved, and sends a `title` event if the chat was given one. An `error` event ends a failed stream, and
+    a stream that ends without any text, which is not saved.
+    A cached answer is sent as a single `token` event."""
+
+    response_cache = life_span["response_cache"]
+    chat_handler = ChatHandler(life_span["surrealdb"], response_cache)
+
+    model_data = life_span["llm_models"].get(llm_model)
+    if not model_data:
+            raise SystemError(f"Error in outcome: Invalid model {llm_model}") 
+    
+    llm_handler = RAGChatHandler(model_data,model_params,life_span["surrealdb"])
+
+    async def events():
+        start = time.perf_counter()
+        first_token_seconds = None
+        chunks = []
+        try:
+            prompt = await chat_handler.get_system_message_prompt(chat_id, prompt_template, number_of_chats)
+            prompt_seconds = time.perf_counter() - start
+            cached_response = response_cache.get(model_data["model_version"], prompt)
+            if cached_response is not None:
+                logger.info(f"{chat_id} {llm_model}: answered from the response cache after {prompt_seconds:.2f}s")
+                chunks.append(cached_response)
+                yield format_server_sent_event("token", cached_response)
+            else:
+                async for chunk in llm_handler.stream_chat_response(prompt["prompt_text"], prompt["content"]):
+                    if not chunk:
+                        continue
+                    if first_token_seconds is None:
+                        first_token_seconds = time.perf_counter() - start
+                        logger.info(f"{chat_id} {llm_model}: time to first token {first_token_seconds:.2f}s ({prompt_seconds:.2f}s building the prompt)")
+                    chunks.append(chunk)
+                    yield format_server_sent_event("token", chunk)
+                response_cache.put(model_data["model_version"], prompt, "".join(chunks), time.perf_counter() - start - prompt_seconds)
+            generate_seconds = time.perf_counter() - start
+
+            full_text = "".join(chunks)
+            if not full_text:
+                # eg the provider timed out mid-stream; like the response cache, an empty answer isn't kept
+                logger.error(f"{chat_id} {llm_model}: the stream ended without any text after {generate_seconds:.2f}s")
+                yield format_server_sent_event("error", f"{llm_model} returned an empty answer, please try again")
+                return
+
+            message = await chat_handler.save_system_message(chat_id, llm_model, prompt["prompt_text"], full_text)
+            title_task = start_chat_title_task(chat_id, llm_handler)
+            logger.info(f"{chat_id} {llm_model}: {len(chunks)} chunks generated in {generate_seconds:.2f}s, saved after {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logger.exception(f"{chat_id} {llm_model}: streaming failed after {len(chunks)} chunks")
+            yield format_server_sent_event("error", str(e))
+            return
+
+        yield format_server_sent_event("message", templates.get_template("message.html").render({
+            "request": request,
+            "chat_id": chat_id,
+            "message": message["message"]
+        }))
+
+        # shielded, so a closed stream doesn't cancel the title
+        new_title = await asyncio.shield(title_task)
+        if new_title:
+            yield format_server_sent_event("title", new_title)
+
+    # no-cache and no proxy buffering, so each event reaches the browser as it is sent
+    return responses.StreamingResponse(events(), media_type="text/event-stream",
+                                       headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/metrics")
+async def metrics() -> JSONResponse:
+    """Return the app's metrics: the LLM response cache's size, hits, misses, hit rate and the LLM seconds it saved,
+    and the retrieval cache's size, hits, misses and hit rate."""
+    return JSONResponse({
+        "llm_response_cache": life_span["response_cache"].stats(),
+        "retrieval_cache": life_span["retrieval_cache"].stats()
+    })
+
 
 @app.get("/relation_detail", response_class=responses.HTMLResponse)
 async def load_relation_detail(
@@ -0,0 +1,236 @@
+"""Benchmark the FOR loop inserts of SurrealDML against the native array INSERT forms."""
+
+import asyncio
+import random
+import time
+
+from surrealdb import AsyncSurreal
+
+from surrealdb_rag.helpers import loggers
+import surrealdb_rag.helpers.constants as constants
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams, SurrealParams
+from surrealdb_rag.helpers.surreal_dml import SurrealDML, bulk_corpus_records, bulk_graph_entity_records, bulk_graph_relation_records
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Benchmark bulk inserts",db_params,model_params)
+
+BENCHMARK_URL = "mem://"
+"""
+The database the benchmark runs against unless a url is passed with -url. The benchmark drops its
+tables, so it never uses the url from the environment. Every mem:// connection is a separate
+database, so the benchmark runs everything on one connection.
+"""
+
+TABLE_NAME = "benchmark_corpus"
+"""
+The corpus table the benchmark creates, the graph tables get the usual _entity, _relation and _source_document suffixes.
+"""
+
+GLOVE_DIMENSIONS = 300
+FASTTEXT_DIMENSIONS = 100
+
+
+def random_vector(rng:random.Random, dimensions:int) -> list[float]:
+    return [rng.uniform(-1, 1) for _ in range(dimensions)]
+
+
+def build_rows(row_count:int, entities_per_document:int) -> tuple[list[dict], list[dict], list[dict]]:
+    """
+    Builds rows shaped like the ones the insert scripts send: corpus rows, graph entity rows and
+    graph relation rows between consecutive entities of a document. The openai vectors are None,
+    as they are for EDGAR, so the None handling of both forms is exercised.
+
+    Args:
+        row_count (int): The number of rows of each kind.
+        entities_per_document (int): The number of entities that share a source document.
+
+    Returns:
+        tuple: The corpus rows, entity rows and relation rows.
+    """
+    rng = random.Random(42)
+    corpus_rows = []
+    entity_rows = []
+    relation_rows = []
+    for i in range(row_count):
+        url = f"https://example.com/document/{i}"
+        corpus_rows.append({
+            "url": url,
+            "title": f"Document {i}",
+            "text": " ".join(rng.choices(["revenue", "risk", "company", "market", "growth", "debt"], k=200)),
+            "content_glove_vector": random_vector(rng, GLOVE_DIMENSIONS),
+            "content_openai_vector": None,
+            "content_fasttext_vector": random_vector(rng, FASTTEXT_DIMENSIONS),
+            "additional_data": {"form": "10-K", "cik": i},
+        })
+
+        document_url = f"https://example.com/document/{i // entities_per_document}"
+        entity_rows.append({
+            "full_id": [document_url, "company", str(i)],
+            "url": document_url,
+            "entity_type": "company",
+            "identifier": str(i),
+            "name": f"Company {i}",
+            "contexts": [f"Company {i} reported growth."],
+            "content_glove_vector": random_vector(rng, GLOVE_DIMENSIONS),
+            "content_openai_vector": None,
+            "content_fasttext_vector": random_vector(rng, FASTTEXT_DIMENSIONS),
+            "additional_data": {"form": "10-K"},
+        })
+
+        if i % entities_per_document:
+            relation_rows.append({
+                "entity1": [document_url, "company", str(i - 1)],
+                "entity2": [document_url, "company", str(i)],
+                "url": document_url,
+                "confidence": 3,
+                "relationship": "supplier",
+                "contexts": [f"Company {i - 1} supplies Company {i}."],
+                "content_glove_vector": random_vector(rng, GLOVE_DIMENSIONS),
+                "content_openai_vector": None,
+                "content_fasttext_vector": random_vector(rng, FASTTEXT_DIMENSIONS),
+            })
+    return corpus_rows, entity_rows, relation_rows
+
+
+async def execute_ddl(connection:AsyncSurreal, ddl_files:list[str]) -> None:
+    """
+    Runs the schema files with the benchmark table name, dropping and recreating the tables.
+
+    Args:
+        connection (AsyncSurreal): The benchmark connection.
+        ddl_files (list[str]): The schema files to run.
+    """
+    for ddl_file in ddl_files:
+        with open(ddl_file) as f:
+            SurrealParams.ParseResponseForErrors(await connection.query_raw(f.read().format(corpus_table = TABLE_NAME)))
+
+
+async def count_records(connection:AsyncSurreal, table_name:str) -> int:
+    result = await connection.query(f"SELECT count() FROM {table_name} GROUP ALL;")
+    return result[0]["count"] if result else 0
+
+
+async def time_load(connection:AsyncSurreal, surql:str, rows:list[dict], batch_size:int, to_records = None) -> float:
+    """
+    Loads the rows one batch at a time and returns the seconds it took, including building the bulk records.
+
+    Args:
+        connection (AsyncSurreal): The benchmark connection.
+        surql (str): The query to run for each batch.
+        rows (list[dict]): The rows to load.
+        batch_size (int): The number of rows in each batch.
+        to_records (callable, optional): Builds the records of a batch from its rows. Defaults to None, send the rows.
+
+    Returns:
+        float: The seconds the load took.
+    """
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        SurrealParams.ParseResponseForErrors(await connection.query_raw(surql, params={"records": to_records(batch) if to_records else batch}))
+    return time.perf_counter() - start
+
+
+async def run_benchmark(logger, row_count:int, batch_size:int, entities_per_document:int) -> None:
+    """
+    Times each insert query in its FOR loop and native array form on the same rows and
+    logs the rows/sec and the record counts of both.
+
+    Args:
+        logger (logging.Logger): The logger for the results.
+        row_count (int): The number of rows of each kind.
+        batch_size (int): The number of rows in each batch.
+        entities_per_document (int): The number of entities that share a source document.
+    """
+    corpus_rows, entity_rows, relation_rows = build_rows(row_count, entities_per_document)
+    source_document_table_name = f"{TABLE_NAME}_source_document"
+    entity_table_name = f"{TABLE_NAME}_entity"
+    relation_table_name = f"{TABLE_NAME}_relation"
+
+    connection = AsyncSurreal(db_params.DB_PARAMS.url)
+    if db_params.DB_PARAMS.username:
+        await connection.signin({"username": db_params.DB_PARAMS.username, "password": db_params.DB_PARAMS.password})
+    await connection.use(db_params.DB_PARAMS.namespace, db_params.DB_PARAMS.database)
+    with open(constants.COMMON_TABLES_DDL) as f:
+        SurrealParams.ParseResponseForErrors(await connection.query_raw(f.read()))
+
+    async def fill_corpus():
+        await time_load(connection, SurrealDML.INSERT_RECORDS(TABLE_NAME), corpus_rows, batch_size)
+
+    async def fill_entities():
+        await time_load(connection, SurrealDML.INSERT_GRAPH_ENTITY_RECORDS(entity_table_name, source_document_table_name), entity_rows, batch_size)
+
+    # name, table, rows, FOR query, array query, record builder, schema files that reset the tables, setup before each run
+    cases = [
+        ("corpus insert", TABLE_NAME, corpus_rows,
+            SurrealDML.INSERT_RECORDS(TABLE_NAME),
+            SurrealDML.BULK_INSERT_RECORDS(TABLE_NAME),
+            lambda rows: bulk_corpus_records(TABLE_NAME, rows),
+            [constants.CORPUS_TABLE_DDL], None),
+        ("corpus upsert (existing)", TABLE_NAME, corpus_rows,
+            SurrealDML.UPSERT_RECORDS(TABLE_NAME),
+            SurrealDML.BULK_UPSERT_RECORDS(TABLE_NAME),
+            lambda rows: bulk_corpus_records(TABLE_NAME, rows),
+            [constants.CORPUS_TABLE_DDL], fill_corpus),
+        ("entity insert", entity_table_name, entity_rows,
+            SurrealDML.INSERT_GRAPH_ENTITY_RECORDS(entity_table_name, source_document_table_name),
+            SurrealDML.BULK_INSERT_GRAPH_ENTITY_RECORDS(entity_table_name),
+            lambda rows: bulk_graph_entity_records(entity_table_name, source_document_table_name, rows),
+            [constants.CORPUS_GRAPH_TABLE_DDL], None),
+        ("relation insert", relation_table_name, relation_rows,
+            SurrealDML.INSERT_GRAPH_RELATION_RECORDS(entity_table_name, relation_table_name, source_document_table_name),
+            SurrealDML.BULK_INSERT_GRAPH_RELATION_RECORDS(relation_table_name),
+            lambda rows: bulk_graph_relation_records(entity_table_name, source_document_table_name, rows),
+            [constants.CORPUS_GRAPH_TABLE_DDL], fill_entities),
+    ]
+
+    for name, table_name, rows, for_surql, bulk_surql, to_records, ddl_files, setup in cases:
+        results = {}
+        for form, surql, builder in [("FOR loop", for_surql, None), ("array INSERT", bulk_surql, to_records)]:
+            await execute_ddl(connection, ddl_files)
+            if setup:
+                await setup()
+            seconds = await time_load(connection, surql, rows, batch_size, builder)
+            results[form] = seconds
+            logger.info(f"{name:26} {form:13} {len(rows) / seconds:10.1f} rows/sec ({seconds:.3f}s, {await count_records(connection, table_name)} records)")
+        logger.info(f"{name:26} array INSERT speedup: {results['FOR loop'] / results['array INSERT']:.2f}x")
+
+    await connection.close()
+
+
+def benchmark_bulk_insert() -> None:
+    """
+    Compares rows/sec of the FOR loop queries of SurrealDML with their native array INSERT forms
+    for the corpus, graph entity and graph relation tables, using the real table schemas.
+    """
+    row_count = 2000
+    batch_size = 100
+    entities_per_document = 10
+
+    args_loader.AddArg("row_count","rc","row_count","The number of rows of each kind to insert. (default{0})",row_count)
+    args_loader.AddArg("batch_size","bs","batch_size","The number of rows in each batch. (default{0})",batch_size)
+    args_loader.AddArg("entities_per_document","epd","entities_per_document","The number of graph entities sharing a source document. (default{0})",entities_per_document)
+    args_loader.LoadArgs()
+
+    row_count = int(args_loader.AdditionalArgs["row_count"]["value"])
+    batch_size = int(args_loader.AdditionalArgs["batch_size"]["value"])
+    entities_per_document = int(args_loader.AdditionalArgs["entities_per_document"]["value"])
+
+    if not args_loader.args.url:
+        db_params.DB_PARAMS.url = BENCHMARK_URL
+        db_params.DB_PARAMS.username = None
+    db_params.DB_PARAMS.namespace = db_params.DB_PARAMS.namespace or "benchmark"
+    db_params.DB_PARAMS.database = db_params.DB_PARAMS.database or "benchmark"
+
+    logger = loggers.setup_logger("BenchmarkBulkInsert")
+    logger.info(f"Inserting {row_count} rows of each kind in batches of {batch_size} into {db_params.DB_PARAMS.url}")
+
+    asyncio.run(run_benchmark(logger, row_count, batch_size, entities_per_document))
+
+
+if __name__ == "__main__":
+    benchmark_bulk_insert()
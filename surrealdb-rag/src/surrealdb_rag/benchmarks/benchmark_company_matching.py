@@ -0,0 +1,151 @@
+"""Benchmark fuzzy company matching through the company name index against a scan of every company."""
+
+import random
+import sys
+import time
+
+from fuzzywuzzy import fuzz
+
+from surrealdb_rag.helpers import loggers
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams
+from surrealdb_rag.data_processing.name_matching import CompanyNameIndex
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Benchmark fuzzy company matching",db_params,model_params)
+
+NAME_WORDS = ["American", "Global", "United", "National", "First", "Pacific", "Atlantic", "General", "Advanced", "Applied",
+              "Apex", "Summit", "Pioneer", "Frontier", "Liberty", "Eagle", "Northern", "Southern", "Western", "Eastern",
+              "Bio", "Micro", "Quantum", "Digital", "Energy", "Capital", "Health", "Medical", "Software", "Systems",
+              "Technologies", "Pharmaceuticals", "Holdings", "Financial", "Resources", "Industries", "Networks", "Semiconductor",
+              "Therapeutics", "Logistics", "Insurance", "Bancorp", "Realty", "Minerals", "Solutions", "Dynamics", "Partners"]
+SUFFIXES = ["Inc", "Inc.", "Corp", "Corporation", "Co", "LLC", "Ltd", "Group", "Trust", "plc", "LP", "Holdings Inc"]
+
+
+def legacy_match_company(company_name:str, company_metadata_lookup:dict, threshold:int = 80) -> int:
+    """
+    The fuzzy matching of fuzzy_match_company without a company name index: every company name is
+    scored with fuzzywuzzy and the first with the highest score wins.
+
+    Args:
+        company_name (str): The ORG mention.
+        company_metadata_lookup (dict): Maps each CIK to its metadata, with a "company_name".
+        threshold (int, optional): The lowest token set score of a match. Defaults to 80.
+
+    Returns:
+        int: The CIK of the best match, or None.
+    """
+    best_match = None
+    best_score = 0
+    for cik, metadata in company_metadata_lookup.items():
+        name = metadata["company_name"]
+        if isinstance(name, str):
+            score = fuzz.token_set_ratio(company_name.lower(), name.lower())
+            if score > best_score:
+                best_score = score
+                best_match = cik
+    return best_match if best_score >= threshold else None
+
+
+def build_companies(company_count:int, seed:int = 42) -> dict:
+    """
+    Builds the metadata lookup of synthetic public companies with two or three word names and a suffix.
+
+    Args:
+        company_count (int): The number of companies.
+        seed (int, optional): The random seed. Defaults to 42.
+
+    Returns:
+        dict: Maps each CIK to {"company_name": ...}.
+    """
+    rng = random.Random(seed)
+    return {cik: {"company_name": " ".join(rng.sample(NAME_WORDS, rng.choice([1, 2, 3])) + [rng.choice(SUFFIXES)])}
+            for cik in range(1, company_count + 1)}
+
+
+def build_queries(company_metadata_lookup:dict, query_count:int, seed:int = 7) -> list[str]:
+    """
+    Builds the ORG mentions to match: company names without their suffix, with a typo, with words
+    reordered or dropped, and names of companies that are not listed.
+
+    Args:
+        company_metadata_lookup (dict): The companies.
+        query_count (int): The number of mentions.
+        seed (int, optional): The random seed. Defaults to 7.
+
+    Returns:
+        list[str]: The mentions.
+    """
+    rng = random.Random(seed)
+    names = [metadata["company_name"] for metadata in company_metadata_lookup.values()]
+    queries = []
+    for _ in range(query_count):
+        words = rng.choice(names).split()
+        form = rng.random()
+        if form < 0.3:
+            words = words[:-1]
+        elif form < 0.5:
+            position = rng.randrange(len(words[0]))
+            words[0] = f"{words[0][:position]}{rng.choice('aeiou')}{words[0][position + 1:]}"
+        elif form < 0.7:
+            rng.shuffle(words)
+        elif form < 0.85 and len(words) > 2:
+            del words[rng.randrange(len(words) - 1)]
+        else:
+            words = rng.sample(NAME_WORDS, 2) + ["Ventures"]
+        queries.append(" ".join(words))
+    return queries
+
+
+def benchmark_company_matching() -> None:
+    """
+    Matches the same ORG mentions by scanning every company, as fuzzy_match_company did before the
+    company name index, and through the index, logs the per-mention latency of both and the share
+    of mentions matched to the same company. Exits with status 1 if fewer agree than the minimum.
+    """
+    company_count = 10000
+    query_count = 200
+    min_agreement = 0.99
+
+    args_loader.AddArg("company_count","cc","company_count","The number of synthetic companies. (default{0})",company_count)
+    args_loader.AddArg("query_count","qc","query_count","The number of ORG mentions to match. (default{0})",query_count)
+    args_loader.AddArg("min_agreement","ma","min_agreement","The lowest share of mentions both paths must match to the same company. (default{0})",min_agreement)
+    args_loader.LoadArgs()
+
+    company_count = int(args_loader.AdditionalArgs["company_count"]["value"])
+    query_count = int(args_loader.AdditionalArgs["query_count"]["value"])
+    min_agreement = float(args_loader.AdditionalArgs["min_agreement"]["value"])
+
+    logger = loggers.setup_logger("BenchmarkCompanyMatching")
+
+    company_metadata_lookup = build_companies(company_count)
+
+    start = time.perf_counter()
+    company_name_index = CompanyNameIndex([(cik, metadata["company_name"]) for cik, metadata in company_metadata_lookup.items()])
+    logger.info(f"Indexed {len(company_metadata_lookup)} companies in {time.perf_counter() - start:.2f}s")
+
+    queries = build_queries(company_metadata_lookup, query_count)
+
+    start = time.perf_counter()
+    scanned = [legacy_match_company(query, company_metadata_lookup) for query in queries]
+    scan_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = [company_name_index.best_match(query) for query in queries]
+    index_seconds = time.perf_counter() - start
+
+    agreement = sum(a == b for a, b in zip(scanned, indexed)) / len(queries)
+    logger.info(f"{len(queries)} mentions: scan {1000 * scan_seconds / len(queries):.2f}ms/mention, "
+                f"index {1000 * index_seconds / len(queries):.3f}ms/mention, speedup {scan_seconds / index_seconds:.1f}x, "
+                f"{sum(cik is not None for cik in scanned)} matched, {agreement:.2%} same company")
+
+    if agreement < min_agreement:
+        logger.error(f"Only {agreement:.2%} of the mentions matched the same company, below {min_agreement:.2%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    benchmark_company_matching()
@@ -0,0 +1,139 @@
+"""Benchmark concurrent chat answers with the blocking provider calls and with the async clients."""
+
+import asyncio
+import time
+
+import google.generativeai as genai
+import openai
+from ollama import generate
+
+from surrealdb_rag.helpers import loggers
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams
+from surrealdb_rag.helpers.llm_handler import LLM_PROVIDER_LIMITS, ModelListHandler, RAGChatHandler
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Benchmark concurrent chat answers",db_params,model_params)
+
+PROMPT = "You are a helpful assistant. Answer in one short paragraph."
+"""
+The system prompt of every request.
+"""
+
+TICK_SECONDS = 0.01
+"""
+How often the event loop monitor wakes up. The longest it oversleeps is the longest the loop was blocked.
+"""
+
+
+async def legacy_chat_response(model_data:dict, prompt_with_context:str, input:str) -> str:
+    """
+    The API and Ollama calls of RAGChatHandler.get_chat_response as they were before the async
+    clients: synchronous SDK calls made from the event loop.
+    """
+    match model_data["platform"]:
+        case "OPENAI":
+            openai.api_key = model_params.openai_token
+            response = openai.chat.completions.create(
+                model=model_data["model_version"],
+                messages=[{"role": "system", "content": prompt_with_context}, {"role": "user", "content": input}],
+                temperature=model_data["temperature"]
+            )
+            return response.choices[0].message.content
+        case "GOOGLE":
+            genai.configure(api_key=model_params.gemini_token)
+            return genai.GenerativeModel(model_data["model_version"]).generate_content([{"text": prompt_with_context}, {"text": input}]).text
+        case _:
+            messages = [{"role": "system", "content": prompt_with_context}, {"role": "user", "content": input}]
+            return generate(model=model_data["model_version"], prompt=str(messages)).response
+
+
+async def monitor_event_loop(stop:asyncio.Event) -> float:
+    """
+    Sleeps TICK_SECONDS at a time until stopped.
+
+    Returns:
+        float: The longest a tick overslept, in seconds.
+    """
+    longest_lag = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        longest_lag = max(longest_lag, time.perf_counter() - start - TICK_SECONDS)
+    return longest_lag
+
+
+async def run_sessions(answer, questions:list[str]) -> tuple[float, float, float]:
+    """
+    Answers the questions concurrently while monitoring the event loop.
+
+    Args:
+        answer: The coroutine function answering a question.
+        questions (list[str]): A question per chat session.
+
+    Returns:
+        tuple[float, float, float]: The seconds until every session had its answer, the mean
+                                    seconds a session waited for its answer from the start, and
+                                    the longest event loop lag.
+    """
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_event_loop(stop))
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+
+    async def session(question):
+        await answer(question)
+        return time.perf_counter() - start
+
+    session_seconds = await asyncio.gather(*(session(question) for question in questions))
+    total_seconds = time.perf_counter() - start
+    stop.set()
+    return total_seconds, sum(session_seconds) / len(session_seconds), await monitor
+
+
+async def benchmark_concurrent_chats() -> None:
+    """
+    Answers the same questions in a number of concurrent chat sessions, first with the blocking SDK
+    calls the app made before, then through RAGChatHandler's async clients, and logs the seconds
+    until all sessions were answered, the mean wait of a session and the longest the event loop was
+    blocked with each. With the blocking calls the sessions are answered one after another.
+
+    Pick an API or Ollama model: the "(surreal)" models were already called asynchronously.
+    """
+    llm_model = ""
+    session_count = 4
+
+    args_loader.AddArg("llm_model","lm","llm_model","The LLM model as listed in the app, eg 'OLLAMA llama3.2:latest'. The first model listed if empty. (default{0})",llm_model)
+    args_loader.AddArg("session_count","sc","session_count","The number of concurrent chat sessions. (default{0})",session_count)
+    args_loader.LoadArgs()
+
+    llm_model = args_loader.AdditionalArgs["llm_model"]["value"]
+    session_count = int(args_loader.AdditionalArgs["session_count"]["value"])
+
+    logger = loggers.setup_logger("BenchmarkConcurrentChats")
+
+    llm_models = await ModelListHandler(model_params, None).available_llm_models()
+    llm_model = llm_model or next(iter(llm_models))
+    model_data = llm_models[llm_model]
+    if model_data["host"] == "SQL":
+        raise ValueError(f"{llm_model} is called through SurrealDB, pick an API or Ollama model")
+
+    llm_handler = RAGChatHandler(model_data, model_params, None)
+    questions = [f"In one sentence, what is {number} squared?" for number in range(2, 2 + session_count)]
+
+    blocking = await run_sessions(lambda question: legacy_chat_response(model_data, PROMPT, question), questions)
+    non_blocking = await run_sessions(lambda question: llm_handler.get_chat_response(PROMPT, question), questions)
+
+    for name, (total_seconds, session_seconds, longest_lag) in (("blocking", blocking), ("async", non_blocking)):
+        logger.info(f"{llm_model}, {session_count} sessions, {name}: all answered after {total_seconds:.2f}s, "
+                    f"mean wait {session_seconds:.2f}s, event loop blocked for up to {longest_lag:.2f}s")
+    logger.info(f"The async clients send up to {LLM_PROVIDER_LIMITS[model_data['platform']]['max_concurrency']} "
+                f"{model_data['platform']} requests at once, see LLM_PROVIDER_LIMITS")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark_concurrent_chats())
@@ -0,0 +1,231 @@
+"""Benchmark the single pass EDGAR HTML section extraction against the per heading searches it replaced."""
+
+import os
+import random
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup, NavigableString
+
+from surrealdb_rag.helpers import loggers
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams
+from surrealdb_rag.data_processing.fin_data_extractor import (
+    FORM_SECTIONS, extract_text_from_edgar_html, process_table_to_sentences
+)
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Benchmark EDGAR HTML section extraction",db_params,model_params)
+
+PAGE_ELEMENTS = 25
+"""
+The number of headings, paragraphs and tables on each page of a synthetic filing.
+"""
+
+WORDS = ["revenue", "company", "market", "risk", "customers", "products", "operations", "growth", "fiscal", "year",
+         "increased", "decreased", "compared", "net", "income", "cash", "flows", "capital", "agreement", "board"]
+
+
+def legacy_find_section(soup_obj, section_start):
+    """
+    find_section as it was before `HtmlSectionIndex`: searches the whole soup for the heading's
+    string, then <b> tags, then every bold <span>, then <p> tags.
+    """
+    section_start_lower = section_start.lower()
+    start_tag = soup_obj.find(string=re.compile(r'^\s*' + re.escape(section_start_lower), re.IGNORECASE))
+    if start_tag:
+        return start_tag
+    start_tag = soup_obj.find('b', string=re.compile(r'^\s*' + re.escape(section_start_lower), re.IGNORECASE))
+    if start_tag:
+        return start_tag
+    for span in soup_obj.find_all('span'):
+        if span.get('style') and 'font-weight' in span.get('style').lower() and 'bold' in span.get('style').lower():
+            if re.search(r'^\s*' + re.escape(section_start_lower), span.get_text(), re.IGNORECASE):
+                return span
+    start_tag = soup_obj.find('p', string=re.compile(r'^\s*' + re.escape(section_start_lower), re.IGNORECASE))
+    if start_tag:
+        return start_tag
+    return None
+
+
+def legacy_extract_text_between(start_tag, end_tag_text=None):
+    """
+    extract_text_between as it was before `HtmlSectionIndex`: searches the subtree of every tag it
+    passes for the end heading.
+    """
+    if not start_tag:
+        return ""
+
+    extracted_text = []
+    current_tag = start_tag.find_next()
+
+    while current_tag and (end_tag_text is None or not current_tag.find(string=re.compile(end_tag_text, re.IGNORECASE))):
+        if isinstance(current_tag, NavigableString):
+            extracted_text.append(current_tag.strip())
+        elif current_tag.name == 'table':
+            table_sentences = process_table_to_sentences(current_tag)
+            extracted_text.extend(table_sentences)
+        current_tag = current_tag.find_next()
+
+    return " ".join(extracted_text)
+
+
+def legacy_extract_text_from_edgar_html(html_content, form_type):
+    """
+    extract_text_from_edgar_html as it was before `HtmlSectionIndex`.
+    """
+    soup = BeautifulSoup(html_content, 'lxml')
+
+    for tag in soup.find_all(['script', 'style', 'head', 'meta', 'img']):
+        tag.decompose()
+
+    relevant_text = []
+    headings = FORM_SECTIONS.get(form_type.upper(), [])
+    for i in range(len(headings)):
+        start_tag = legacy_find_section(soup, headings[i])
+        if start_tag:
+            end_tag_text = headings[i + 1] if i + 1 < len(headings) else None
+            relevant_text.append(legacy_extract_text_between(start_tag, end_tag_text))
+
+    all_paragraphs = []
+    for p_tag in soup.find_all('p'):
+        paragraph_text = p_tag.get_text(separator=" ", strip=True)
+        if paragraph_text:
+            all_paragraphs.append(paragraph_text)
+
+    combined_text = "\n\n".join(relevant_text)
+    for paragraph in all_paragraphs:
+        if paragraph not in combined_text:
+           combined_text += "\n" + paragraph
+
+    combined_text = re.sub(r'\s+', ' ', combined_text)
+    combined_text = combined_text.strip()
+    return combined_text
+
+
+def build_filing(form_type:str, section_paragraphs:int, rng:random.Random) -> str:
+    """
+    Builds a synthetic filing of a form type: a table of contents, then each heading of the form as
+    a <b>, a bold <span> split over several spans or a plain <p>, followed by paragraphs, tables
+    (some nested) and comments. The body is split into page <div>s, as in inline XBRL filings.
+
+    Args:
+        form_type (str): The form type.
+        section_paragraphs (int): The number of paragraphs in each section.
+        rng (random.Random): The random generator.
+
+    Returns:
+        str: The HTML.
+    """
+    headings = [heading.replace("\\", "") for heading in FORM_SECTIONS[form_type]]
+
+    def sentence():
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + "."
+
+    def table(rows):
+        cells = "".join(f"<th>{rng.choice(WORDS)}</th>" for _ in range(3))
+        body = "".join("<tr>" + "".join(f"<td>${rng.randint(1, 99999):,}</td>" for _ in range(3)) + "</tr>" for _ in range(rows))
+        return f"<table><tr>{cells}</tr>{body}</table>"
+
+    parts = ["<html><head><title>Filing</title><style>p {margin: 0}</style></head><body>"]
+    parts.append("<table>" + "".join(f"<tr><td>{heading.title()}</td><td>{page}</td></tr>" for page, heading in enumerate(headings)) + "</table>")
+    for heading in headings:
+        form = rng.random()
+        if form < 0.4:
+            parts.append(f"<p><b>{heading.upper()}</b></p>")
+        elif form < 0.7:
+            words = heading.title().split(" ", 1)
+            parts.append(f'<div><span style="font-weight:bold"><span>{words[0]}</span> <span>{words[-1]}</span></span></div>')
+        else:
+            parts.append(f"<p>{heading.title()}</p>")
+        for _ in range(section_paragraphs):
+            roll = rng.random()
+            if roll < 0.15:
+                parts.append(f"<div>{table(rng.randint(2, 8))}</div>")
+            elif roll < 0.2:
+                parts.append(f"<table><tr><td>{table(2)}</td></tr></table>")
+            elif roll < 0.25:
+                parts.append(f"<!-- {sentence()} -->")
+            else:
+                parts.append(f"<p>{sentence()} {sentence()}</p>")
+    body = parts[1:]
+    pages = ["<div class=\"page\">" + "".join(body[start:start + PAGE_ELEMENTS]) + "</div>" for start in range(0, len(body), PAGE_ELEMENTS)]
+    return parts[0] + "".join(pages) + "</body></html>"
+
+
+def load_filings(input_folder:str, file_count:int, section_paragraphs:int) -> list[tuple[str, str, str]]:
+    """
+    Loads the sample filings: the .htm and .html files of the input folder, whose form type is the
+    part of the file name before the first "_" (eg "10-K_apple.htm"), or synthetic filings of each
+    form type when there is no folder.
+
+    Returns:
+        list[tuple[str, str, str]]: The name, form type and HTML of each filing.
+    """
+    filings = []
+    if input_folder and os.path.isdir(input_folder):
+        for file_name in sorted(os.listdir(input_folder))[:file_count]:
+            if file_name.lower().endswith((".htm", ".html")):
+                with open(os.path.join(input_folder, file_name), "r", encoding="utf-8", errors="ignore") as f:
+                    filings.append((file_name, file_name.split("_")[0], f.read()))
+        return filings
+
+    rng = random.Random(42)
+    form_types = ["10-K", "SC 13D", "S-1"]
+    for i in range(file_count):
+        form_type = form_types[i % len(form_types)]
+        filings.append((f"synthetic {i} {form_type}", form_type, build_filing(form_type, section_paragraphs, rng)))
+    return filings
+
+
+def benchmark_html_sections() -> None:
+    """
+    Extracts the text of the same filings with the legacy per heading searches and with
+    `extract_text_from_edgar_html`, logs the filings/sec of both and checks the text is identical.
+    Exits with status 1 if any filing's text differs.
+    """
+    input_folder = ""
+    file_count = 9
+    section_paragraphs = 40
+
+    args_loader.AddArg("input_folder","inf","input_folder","A folder of sample .htm filings named <form type>_<name>.htm. Synthetic filings are used if empty. (default{0})",input_folder)
+    args_loader.AddArg("file_count","fc","file_count","The number of filings. (default{0})",file_count)
+    args_loader.AddArg("section_paragraphs","sp","section_paragraphs","The paragraphs in each section of a synthetic filing. (default{0})",section_paragraphs)
+    args_loader.LoadArgs()
+
+    input_folder = args_loader.AdditionalArgs["input_folder"]["value"]
+    file_count = int(args_loader.AdditionalArgs["file_count"]["value"])
+    section_paragraphs = int(args_loader.AdditionalArgs["section_paragraphs"]["value"])
+
+    logger = loggers.setup_logger("BenchmarkHtmlSections")
+
+    filings = load_filings(input_folder, file_count, section_paragraphs)
+    legacy_seconds = indexed_seconds = 0
+    mismatches = 0
+    for name, form_type, html in filings:
+        start = time.perf_counter()
+        legacy = legacy_extract_text_from_edgar_html(html, form_type)
+        legacy_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexed = extract_text_from_edgar_html(html, form_type)
+        indexed_seconds += time.perf_counter() - start
+
+        if legacy != indexed:
+            mismatches += 1
+            logger.error(f"{name}: the extracted text differs")
+
+    logger.info(f"{len(filings)} filings: per heading searches {len(filings) / legacy_seconds:.2f}/sec ({legacy_seconds:.2f}s), "
+                f"single pass {len(filings) / indexed_seconds:.2f}/sec ({indexed_seconds:.2f}s), "
+                f"speedup {legacy_seconds / indexed_seconds:.1f}x, {len(filings) - mismatches} identical")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    benchmark_html_sections()
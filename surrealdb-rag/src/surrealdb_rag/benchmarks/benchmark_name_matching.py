@@ -0,0 +1,135 @@
+"""Benchmark the blocked rapidfuzz name merge against the fuzzywuzzy merge it replaced."""
+
+import random
+import sys
+import time
+
+from fuzzywuzzy import fuzz, process
+
+from surrealdb_rag.helpers import loggers
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams
+from surrealdb_rag.data_processing.name_matching import merge_people_names
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Benchmark people name merging",db_params,model_params)
+
+FIRST_NAMES = ["John", "Jon", "Mary", "Maria", "Robert", "Rob", "Linda", "Michael", "Micheal", "Susan",
+               "William", "Elizabeth", "David", "Jennifer", "James", "Patricia", "Richard", "Barbara", "Thomas", "Karen"]
+LAST_NAMES = ["Smith", "Smyth", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+              "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson",
+              "Martin", "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis"]
+
+
+def legacy_merge_people_names(people_list:list[dict], threshold:int = 85) -> dict[str, dict]:
+    """
+    The merge of fuzzy_merge_people before `merge_people_names`: each name is scored against every
+    merged name and every name found with `fuzzywuzzy.process.extract`.
+
+    Args:
+        people_list (list[dict]): The people found, each with a "name" and "contexts".
+        threshold (int, optional): The lowest token set score of a match. Defaults to 85.
+
+    Returns:
+        dict: Maps each primary name to {"aliases": [...], "contexts": [...]}.
+    """
+    merged_people = {}
+    for person in people_list:
+        name = person["name"]
+        contexts = person["contexts"]
+
+        matches = process.extract(name, list(merged_people.keys()) + [p["name"] for p in people_list], scorer=fuzz.token_set_ratio, limit=None)
+        best_matches = sorted([match[0] for match in matches if match[1] >= threshold], key=len, reverse=True)
+
+        primary_name = best_matches[0]
+
+        if primary_name not in merged_people:
+            merged_people[primary_name] = {"aliases": [primary_name], "contexts": contexts.copy()}
+        else:
+            merged_people[primary_name]["aliases"].extend([m for m in best_matches if m not in merged_people[primary_name]["aliases"]])
+            for context in contexts:
+                if context not in merged_people[primary_name]["contexts"]:
+                    merged_people[primary_name]["contexts"].append(context)
+    return merged_people
+
+
+def build_people(person_count:int, distinct_people:int, seed:int = 42) -> list[dict]:
+    """
+    Builds the PERSON mentions of a proxy statement like filing: a set of people each mentioned
+    several times as their full name, with a middle initial, a title, their surname alone or a typo.
+
+    Args:
+        person_count (int): The number of mentions.
+        distinct_people (int): The number of people mentioned.
+        seed (int, optional): The random seed. Defaults to 42.
+
+    Returns:
+        list[dict]: The mentions, each with a "name" and "contexts".
+    """
+    rng = random.Random(seed)
+    people = [(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice("ABCDEFGHJKLMNPRSTW")) for _ in range(distinct_people)]
+    mentions = []
+    for i in range(person_count):
+        first, last, initial = rng.choice(people)
+        form = rng.random()
+        if form < 0.4:
+            name = f"{first} {last}"
+        elif form < 0.6:
+            name = f"{first} {initial}. {last}"
+        elif form < 0.75:
+            name = f"Mr. {last}" if rng.random() < 0.5 else f"Ms. {last}"
+        elif form < 0.85:
+            name = last
+        else:
+            position = rng.randrange(len(last))
+            name = f"{first} {last[:position]}{rng.choice('aeiou')}{last[position + 1:]}"
+        mentions.append({"name": name, "contexts": [f"Sentence {i} about {name}."]})
+    return mentions
+
+
+def benchmark_name_matching() -> None:
+    """
+    Merges the same mentions with the legacy fuzzywuzzy loop and with `merge_people_names`,
+    logs the mentions/sec of both and checks that they give the same primary names, aliases and contexts.
+    Exits with status 1 if they differ.
+    """
+    person_counts = "100,300,1000"
+    distinct_people = 150
+
+    args_loader.AddArg("person_counts","pc","person_counts","Comma separated numbers of PERSON mentions to merge. (default{0})",person_counts)
+    args_loader.AddArg("distinct_people","dp","distinct_people","The number of distinct people mentioned. (default{0})",distinct_people)
+    args_loader.LoadArgs()
+
+    person_counts = [int(count) for count in str(args_loader.AdditionalArgs["person_counts"]["value"]).split(",")]
+    distinct_people = int(args_loader.AdditionalArgs["distinct_people"]["value"])
+
+    logger = loggers.setup_logger("BenchmarkNameMatching")
+
+    mismatches = 0
+    for person_count in person_counts:
+        people = build_people(person_count, distinct_people)
+
+        start = time.perf_counter()
+        legacy = legacy_merge_people_names(people)
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        blocked = merge_people_names(people)
+        blocked_seconds = time.perf_counter() - start
+
+        same = legacy == blocked and list(legacy.keys()) == list(blocked.keys())
+        mismatches += not same
+        logger.info(f"{person_count:6} mentions: fuzzywuzzy {person_count / legacy_seconds:10.1f}/sec ({legacy_seconds:.3f}s), "
+                    f"blocked rapidfuzz {person_count / blocked_seconds:10.1f}/sec ({blocked_seconds:.3f}s), "
+                    f"speedup {legacy_seconds / blocked_seconds:.1f}x, {len(blocked)} people, {'same output' if same else 'OUTPUT DIFFERS'}")
+
+    if mismatches:
+        logger.error(f"{mismatches} runs gave different output")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    benchmark_name_matching()
@@ -0,0 +1,130 @@
+"""Benchmark the LLM response cache on a synthetic stream of repeated and reworded questions."""
+
+import random
+import time
+
+import numpy as np
+
+from surrealdb_rag.helpers import loggers
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams
+from surrealdb_rag.helpers.chat_cache import (
+    DEFAULT_RESPONSE_CACHE_SIMILARITY, DEFAULT_RESPONSE_CACHE_SIZE, DEFAULT_RESPONSE_CACHE_TTL, LLMResponseCache
+)
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Benchmark the LLM response cache",db_params,model_params)
+
+MODEL_VERSION = "benchmark-model"
+"""
+The model version the synthetic answers are cached under.
+"""
+
+VECTOR_SIZE = 384
+"""
+The size of the synthetic question embeddings.
+"""
+
+REWORDINGS = ["Which risk factors did company {0} call out?", "what are the MAIN risks company {0} reported",
+              "List company {0}'s main risk factors."]
+"""
+The other wordings of a question, asked with its embedding moved by the rewording noise.
+"""
+
+
+def build_questions(distinct_count:int, rng:random.Random) -> list[dict]:
+    """
+    Builds the distinct questions of the stream, each with an embedding, the documents it retrieves
+    and the prompt built from them.
+
+    Returns:
+        list[dict]: The 'content', 'query_vector', 'document_ids' and 'prompt_text' of each question.
+    """
+    questions = []
+    for i in range(distinct_count):
+        document_ids = [f"embedded_edgar_chunks:{rng.randint(0, 10 * distinct_count)}" for _ in range(5)]
+        questions.append({
+            "number": i,
+            "content": f"What did company {i} report as its main risk factors?",
+            "query_vector": np.random.default_rng(i).standard_normal(VECTOR_SIZE).tolist(),
+            "document_ids": document_ids,
+            "embedding_model": "embedding_model_definition:['OPENAI','text-embedding-3-small']",
+            "prompt_text": f"Answer from these documents: {', '.join(document_ids)}",
+        })
+    return questions
+
+
+def reword(question:dict, noise:float, rng:random.Random) -> dict:
+    """
+    Returns:
+        dict: The question reworded, with its embedding moved by the noise as a rewording would. The retrieved documents and prompt stay the same.
+    """
+    vector = np.asarray(question["query_vector"])
+    moved = vector + np.random.default_rng(rng.randint(0, 2**31)).standard_normal(vector.shape) * noise * np.linalg.norm(vector) / np.sqrt(vector.size)
+    return dict(question, content=rng.choice(REWORDINGS).format(question["number"]), query_vector=moved.tolist())
+
+
+def benchmark_response_cache() -> None:
+    """
+    Replays a stream of questions drawn from a set of distinct questions, each asked as it was first
+    worded or reworded, through an `LLMResponseCache`. Each miss is answered by a simulated LLM
+    taking the LLM seconds. Logs the cache's exact and near-identical hits, the hit rate, the LLM
+    seconds saved and the mean lookup time.
+    """
+    request_count = 2000
+    distinct_count = 200
+    reword_share = 0.3
+    reword_noise = 0.1
+    llm_seconds = 2.0
+    cache_size = DEFAULT_RESPONSE_CACHE_SIZE
+    similarity = DEFAULT_RESPONSE_CACHE_SIMILARITY
+
+    args_loader.AddArg("request_count","rc","request_count","The number of questions asked. (default{0})",request_count)
+    args_loader.AddArg("distinct_count","dc","distinct_count","The number of distinct questions they are drawn from. (default{0})",distinct_count)
+    args_loader.AddArg("reword_share","rws","reword_share","The share of questions asked reworded. (default{0})",reword_share)
+    args_loader.AddArg("reword_noise","rwn","reword_noise","How far a rewording moves a question's embedding. (default{0})",reword_noise)
+    args_loader.AddArg("llm_seconds","ls","llm_seconds","The seconds the simulated LLM takes to answer. (default{0})",llm_seconds)
+    args_loader.AddArg("response_cache_size","rcs","response_cache_size","The most answers cached. (default{0})",cache_size)
+    args_loader.AddArg("response_cache_similarity","rcsim","response_cache_similarity","The lowest similarity of a near-identical question. (default{0})",similarity)
+    args_loader.LoadArgs()
+
+    request_count = int(args_loader.AdditionalArgs["request_count"]["value"])
+    distinct_count = int(args_loader.AdditionalArgs["distinct_count"]["value"])
+    reword_share = float(args_loader.AdditionalArgs["reword_share"]["value"])
+    reword_noise = float(args_loader.AdditionalArgs["reword_noise"]["value"])
+    llm_seconds = float(args_loader.AdditionalArgs["llm_seconds"]["value"])
+    cache_size = int(args_loader.AdditionalArgs["response_cache_size"]["value"])
+    similarity = float(args_loader.AdditionalArgs["response_cache_similarity"]["value"])
+
+    logger = loggers.setup_logger("BenchmarkResponseCache")
+
+    rng = random.Random(42)
+    questions = build_questions(distinct_count, rng)
+
+    response_cache = LLMResponseCache(cache_size, DEFAULT_RESPONSE_CACHE_TTL, similarity)
+    lookup_seconds = 0
+    llm_calls = 0
+    for _ in range(request_count):
+        question = rng.choice(questions)
+        if rng.random() < reword_share:
+            question = reword(question, reword_noise, rng)
+
+        start = time.perf_counter()
+        response = response_cache.get(MODEL_VERSION, question)
+        lookup_seconds += time.perf_counter() - start
+        if response is None:
+            llm_calls += 1
+            response_cache.put(MODEL_VERSION, question, f"The answer to {question['content']}", llm_seconds)
+
+    stats = response_cache.stats()
+    logger.info(f"{request_count} questions from {distinct_count} distinct, {reword_share:.0%} reworded: "
+                f"{stats['exact_hits']} exact and {stats['similar_hits']} near-identical hits, hit rate {stats['hit_rate']:.1%}, "
+                f"{llm_calls} LLM calls, {stats['seconds_saved']:.0f} LLM seconds saved of {request_count * llm_seconds:.0f}, "
+                f"{1000 * lookup_seconds / request_count:.3f}ms per lookup")
+
+
+if __name__ == "__main__":
+    benchmark_response_cache()
@@ -0,0 +1,165 @@
+"""Benchmark creating user messages with and without the retrieval cache."""
+
+import asyncio
+import random
+import time
+
+import numpy as np
+from surrealdb import AsyncSurreal, RecordID
+
+from surrealdb_rag.helpers import loggers
+import surrealdb_rag.helpers.constants as constants
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams, SurrealParams
+from surrealdb_rag.helpers.chat_cache import RetrievalCache
+from surrealdb_rag.helpers.chat_handler import ChatHandler
+from surrealdb_rag.helpers.surreal_dml import SurrealDML, bulk_corpus_records
+from surrealdb_rag.data_processing.embedding_table_loader import BULK_INSERT_EMBEDDINGS, embedding_records
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Benchmark the retrieval cache",db_params,model_params)
+
+BENCHMARK_URL = "mem://"
+"""
+The database the benchmark runs against unless a url is passed with -url. The benchmark drops its
+tables, so it never uses the url from the environment.
+"""
+
+TABLE_NAME = "benchmark_retrieval_corpus"
+"""
+The corpus table the benchmark creates.
+"""
+
+EMBED_MODEL = ["GLOVE", "benchmark"]
+"""
+The id of the synthetic GloVe model the benchmark creates.
+"""
+
+GLOVE_DIMENSIONS = 300
+
+VOCABULARY = ["revenue", "company", "market", "risk", "customers", "products", "operations", "growth", "fiscal", "year",
+              "increased", "decreased", "compared", "net", "income", "cash", "flows", "capital", "agreement", "board",
+              "what", "did", "the", "report", "about", "its", "main", "how", "much"]
+
+
+async def build_corpus(connection:AsyncSurreal, row_count:int, rng:random.Random) -> None:
+    """
+    Creates the benchmark corpus table and a synthetic GloVe model of VOCABULARY, and fills the
+    table with row_count documents whose vectors are the mean vector of a few random words.
+    """
+    with open(constants.COMMON_TABLES_DDL) as f:
+        SurrealParams.ParseResponseForErrors(await connection.query_raw(f.read()))
+    with open(constants.COMMON_FUNCTIONS_DDL) as f:
+        SurrealParams.ParseResponseForErrors(await connection.query_raw(f.read()))
+    with open(constants.CORPUS_TABLE_DDL) as f:
+        SurrealParams.ParseResponseForErrors(await connection.query_raw(f.read().format(corpus_table = TABLE_NAME)))
+
+    model = RecordID("embedding_model_definition", EMBED_MODEL)
+    vectors = np.random.default_rng(42).uniform(-1, 1, (len(VOCABULARY), GLOVE_DIMENSIONS))
+    SurrealParams.ParseResponseForErrors(await connection.query_raw(
+        """UPSERT $model CONTENT {model_trainer:'GLOVE', host:'SQL', dimensions:$dimensions, version:'benchmark',
+            corpus:'synthetic', description:'Synthetic vectors of the retrieval cache benchmark'} RETURN NONE;""",
+        params={"model": model, "dimensions": GLOVE_DIMENSIONS}))
+    SurrealParams.ParseResponseForErrors(await connection.query_raw(
+        BULK_INSERT_EMBEDDINGS, params={"records": embedding_records(model, VOCABULARY, vectors)}))
+
+    rows = []
+    for i in range(row_count):
+        words = rng.sample(range(len(VOCABULARY)), 6)
+        rows.append({
+            "url": f"https://example.com/document/{i}",
+            "title": f"Document {i}",
+            "text": " ".join(VOCABULARY[word] for word in words),
+            "content_glove_vector": vectors[words].mean(axis=0).tolist(),
+            "content_openai_vector": None,
+            "content_fasttext_vector": None,
+            "additional_data": None,
+        })
+    SurrealParams.ParseResponseForErrors(await connection.query_raw(
+        SurrealDML.BULK_INSERT_RECORDS(TABLE_NAME), params={"records": bulk_corpus_records(TABLE_NAME, rows)}))
+
+
+async def time_messages(chat_handler:ChatHandler, chat_id:str, questions:list[str], number_of_chunks:int) -> list[float]:
+    """
+    Returns:
+        list[float]: The seconds create_user_message took for each question.
+    """
+    seconds = []
+    for question in questions:
+        start = time.perf_counter()
+        await chat_handler.create_user_message(chat_id, TABLE_NAME, question, EMBED_MODEL, number_of_chunks, "", model_params.openai_token)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+async def run_benchmark(logger, row_count:int, message_count:int, distinct_count:int, number_of_chunks:int) -> None:
+    """
+    Creates the same user messages, drawn from a set of distinct questions, without and with a
+    RetrievalCache, logs the mean ms per message and the cache's hit rate, and checks the cached
+    messages referenced the same documents.
+    """
+    rng = random.Random(42)
+    connection = AsyncSurreal(db_params.DB_PARAMS.url)
+    if db_params.DB_PARAMS.username:
+        await connection.signin({"username": db_params.DB_PARAMS.username, "password": db_params.DB_PARAMS.password})
+    await connection.use(db_params.DB_PARAMS.namespace, db_params.DB_PARAMS.database)
+    await build_corpus(connection, row_count, rng)
+
+    distinct_questions = [" ".join(rng.sample(VOCABULARY, 5)) + "?" for _ in range(distinct_count)]
+    questions = [rng.choice(distinct_questions) for _ in range(message_count)]
+
+    retrieval_cache = RetrievalCache()
+    results = {}
+    for name, chat_handler in (("uncached", ChatHandler(connection)), ("cached", ChatHandler(connection, retrieval_cache = retrieval_cache))):
+        chat = await connection.query("RETURN fn::create_chat();")
+        seconds = await time_messages(chat_handler, str(chat["id"]), questions, number_of_chunks)
+        sent = await connection.query(
+            "SELECT timestamp, referenced_documents.doc AS documents FROM sent WHERE in = $chat ORDER BY timestamp;", {"chat": chat["id"]})
+        results[name] = [message["documents"] for message in sent]
+        logger.info(f"{name:8}: {1000 * sum(seconds) / len(seconds):.2f}ms per user message ({sum(seconds):.2f}s for {len(seconds)})")
+
+    stats = retrieval_cache.stats()
+    same_documents = sum(str(uncached) == str(cached) for uncached, cached in zip(results["uncached"], results["cached"]))
+    logger.info(f"{message_count} messages from {distinct_count} distinct questions over {row_count} documents: "
+                f"hit rate {stats['hit_rate']:.1%}, {same_documents} of {message_count} cached messages referenced the same documents")
+
+    await connection.query(f"REMOVE TABLE IF EXISTS {TABLE_NAME}; REMOVE TABLE IF EXISTS {TABLE_NAME}_source_document;")
+    await connection.close()
+
+
+def benchmark_retrieval_cache() -> None:
+    """
+    Compares the time to create a user message, which embeds the question and searches the corpus,
+    with the retrieval cache of the app and without it, on a synthetic GloVe corpus.
+    """
+    row_count = 5000
+    message_count = 200
+    distinct_count = 20
+    number_of_chunks = 5
+
+    args_loader.AddArg("row_count","rc","row_count","The number of documents in the synthetic corpus. (default{0})",row_count)
+    args_loader.AddArg("message_count","mc","message_count","The number of user messages. (default{0})",message_count)
+    args_loader.AddArg("distinct_count","dc","distinct_count","The number of distinct questions they are drawn from. (default{0})",distinct_count)
+    args_loader.AddArg("number_of_chunks","nc","number_of_chunks","The number of documents retrieved for each message. (default{0})",number_of_chunks)
+    args_loader.LoadArgs()
+
+    row_count = int(args_loader.AdditionalArgs["row_count"]["value"])
+    message_count = int(args_loader.AdditionalArgs["message_count"]["value"])
+    distinct_count = int(args_loader.AdditionalArgs["distinct_count"]["value"])
+    number_of_chunks = int(args_loader.AdditionalArgs["number_of_chunks"]["value"])
+
+    if not args_loader.args.url:
+        db_params.DB_PARAMS.url = BENCHMARK_URL
+        db_params.DB_PARAMS.username = None
+    db_params.DB_PARAMS.namespace = db_params.DB_PARAMS.namespace or "benchmark"
+    db_params.DB_PARAMS.database = db_params.DB_PARAMS.database or "benchmark"
+
+    logger = loggers.setup_logger("BenchmarkRetrievalCache")
+    asyncio.run(run_benchmark(logger, row_count, message_count, distinct_count, number_of_chunks))
+
+
+if __name__ == "__main__":
+    benchmark_retrieval_cache()
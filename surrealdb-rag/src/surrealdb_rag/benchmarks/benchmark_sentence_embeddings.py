@@ -0,0 +1,127 @@
+"""Benchmark per-sentence vs batched sentence embeddings."""
+
+import os
+import random
+import time
+
+import re
+
+import numpy as np
+
+from surrealdb_rag.helpers import loggers
+import surrealdb_rag.helpers.constants as constants
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams
+from surrealdb_rag.data_processing.embeddings import WordEmbeddingModel, PUNCTUATION_TO_SEPARATE
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Benchmark sentence embeddings",db_params,model_params)
+
+
+def legacy_sentence_to_vec(model:WordEmbeddingModel, sentence:str) -> list:
+    """
+    The per-sentence path as it was before `sentences_to_matrix`: compile the punctuation regex,
+    collect the word vectors in a list, average them with `np.mean` and convert to a list.
+
+    Args:
+        model (WordEmbeddingModel): The embedding model.
+        sentence (str): The input sentence.
+
+    Returns:
+        list: The sentence embedding.
+    """
+    punctuation_regex = re.compile(r"([{}])".format(re.escape("".join(PUNCTUATION_TO_SEPARATE))))
+    words = punctuation_regex.sub(r" \1", sentence).lower().split()
+    vectors = [model.vectors[model.dictionary[w]] for w in words if w in model.dictionary]
+    if vectors:
+        return np.mean(vectors, axis=0).tolist()
+    else:
+        return np.zeros(model.vector_size).tolist()
+
+
+def load_sentences(input_folder:str, sentence_count:int, chunk_size:int, model:WordEmbeddingModel) -> list[str]:
+    """
+    Builds the benchmark sentences.
+
+    If the input folder exists its text files are split into chunks of `chunk_size` words, the same
+    way the EDGAR pipeline chunks filings. Otherwise random sentences are sampled from the model vocab.
+
+    Args:
+        input_folder (str): A folder of .txt files to chunk.
+        sentence_count (int): The number of sentences to return.
+        chunk_size (int): The number of words in each sentence.
+        model (WordEmbeddingModel): The model whose vocab is sampled when there is no input folder.
+
+    Returns:
+        list[str]: The sentences.
+    """
+    sentences = []
+    if input_folder and os.path.isdir(input_folder):
+        for file_name in sorted(os.listdir(input_folder)):
+            if not file_name.endswith(".txt"):
+                continue
+            with open(os.path.join(input_folder, file_name), encoding="utf-8") as f:
+                words = f.read().split()
+            for i in range(0, len(words), chunk_size):
+                sentences.append(" ".join(words[i:i + chunk_size]))
+                if len(sentences) >= sentence_count:
+                    return sentences
+
+    vocab = list(model.dictionary.keys())
+    rng = random.Random(42)
+    while len(sentences) < sentence_count:
+        sentences.append(" ".join(rng.choices(vocab, k=chunk_size)))
+    return sentences
+
+
+def benchmark_sentence_embeddings() -> None:
+    """
+    Compares the legacy per-sentence path with one `sentences_to_matrix` call.
+
+    Reports sentences/sec for both paths and the largest difference between their outputs.
+    """
+    model_path = constants.DEFAULT_GLOVE_PATH
+    input_folder = constants.EDGAR_FOLDER
+    sentence_count = 10000
+    chunk_size = constants.DEFAULT_CHUNK_SIZE
+
+    args_loader.AddArg("model_path","emp","model_path","The path to the txt file with the words and vectors. (default{0})",model_path)
+    args_loader.AddArg("input_folder","inf","input_folder","Folder of .txt files to chunk into sentences, random vocab sentences are used if missing. (default{0})",input_folder)
+    args_loader.AddArg("sentence_count","sc","sentence_count","The number of sentences to embed. (default{0})",sentence_count)
+    args_loader.AddArg("chunk_size","cs","chunk_size","The number of words in each sentence. (default{0})",chunk_size)
+    args_loader.LoadArgs()
+
+    model_path = args_loader.AdditionalArgs["model_path"]["value"]
+    input_folder = args_loader.AdditionalArgs["input_folder"]["value"]
+    sentence_count = int(args_loader.AdditionalArgs["sentence_count"]["value"])
+    chunk_size = int(args_loader.AdditionalArgs["chunk_size"]["value"])
+
+    logger = loggers.setup_logger("BenchmarkSentenceEmbeddings")
+
+    start = time.perf_counter()
+    model = WordEmbeddingModel(model_path, False)
+    logger.info(f"Loaded {model_path} ({len(model.dictionary)} words, {model.vector_size}d) in {time.perf_counter() - start:.3f}s")
+
+    sentences = load_sentences(input_folder, sentence_count, chunk_size, model)
+    logger.info(f"Embedding {len(sentences)} sentences of up to {chunk_size} words")
+
+    start = time.perf_counter()
+    per_sentence = [legacy_sentence_to_vec(model, sentence) for sentence in sentences]
+    per_sentence_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = model.sentences_to_matrix(sentences)
+    batched_seconds = time.perf_counter() - start
+
+    max_difference = float(np.abs(np.asarray(per_sentence, dtype=np.float32) - batched).max()) if len(sentences) else 0.0
+
+    logger.info(f"per sentence:        {len(sentences) / per_sentence_seconds:12.1f} sentences/sec ({per_sentence_seconds:.3f}s)")
+    logger.info(f"sentences_to_matrix: {len(sentences) / batched_seconds:12.1f} sentences/sec ({batched_seconds:.3f}s)")
+    logger.info(f"Speedup: {per_sentence_seconds / batched_seconds:.1f}x, max abs difference: {max_difference:.2e}")
+
+
+if __name__ == "__main__":
+    benchmark_sentence_embeddings()
@@ -0,0 +1,100 @@
+"""Benchmark the spaCy calls of the relationship stage with and without reusing the parsed filing's sentences."""
+
+import time
+
+import pandas as pd
+import spacy
+
+from surrealdb_rag.helpers import loggers
+import surrealdb_rag.helpers.constants as constants
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams
+from surrealdb_rag.data_processing.edgar_graph_extractor import SentenceIndex, clean_text, extract_people, find_relationships
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Benchmark spaCy calls per filing",db_params,model_params)
+
+
+class CountingPipeline():
+    """
+    Wraps a spaCy pipeline and counts the texts it is called on.
+    """
+
+    def __init__(self, nlp):
+        self.nlp = nlp
+        self.calls = 0
+
+    def __call__(self, text, **kwargs):
+        self.calls += 1
+        return self.nlp(text, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.nlp, name)
+
+
+def extract_relationships(doc, nlp, sentence_index = None):
+    """
+    Runs the people and person-person relationship steps of the extractor on a parsed filing.
+
+    Returns:
+        tuple: The people and relationships found.
+    """
+    people = extract_people(doc, nlp, sentence_index = sentence_index)
+    relationships = find_relationships(people, people, nlp, sentence_index)
+    return people, relationships
+
+
+def benchmark_sentence_reuse() -> None:
+    """
+    Parses some downloaded filings once, then runs the people and person-person relationship steps
+    on each with every context sentence parsed again, as before, and with the sentences looked up in
+    the filing's `SentenceIndex`. Logs the spaCy calls per filing and the seconds of both.
+
+    The company steps are left out as they need the public companies metadata; they parse their
+    context sentences the same way.
+    """
+    file_count = 5
+    model_name = "en_core_web_lg"
+
+    args_loader.AddArg("file_count","fc","file_count","The number of filings from the EDGAR file index to process. (default{0})",file_count)
+    args_loader.AddArg("spacy_model","sm","spacy_model","The spaCy model. (default{0})",model_name)
+    args_loader.LoadArgs()
+
+    file_count = int(args_loader.AdditionalArgs["file_count"]["value"])
+    model_name = args_loader.AdditionalArgs["spacy_model"]["value"]
+
+    logger = loggers.setup_logger("BenchmarkSentenceReuse")
+
+    nlp = CountingPipeline(spacy.load(model_name))
+    files = pd.read_csv(constants.DEFAULT_EDGAR_FOLDER_FILE_INDEX).head(file_count).to_dict(orient="records")
+
+    before_calls = after_calls = 0
+    before_seconds = after_seconds = 0
+    for file_data in files:
+        with open(file_data["file_path"], "r", encoding="utf-8") as f:
+            doc = nlp.nlp(clean_text(f.read())[:nlp.max_length])
+
+        nlp.calls = 0
+        start = time.perf_counter()
+        people, relationships = extract_relationships(doc, nlp)
+        before_seconds += time.perf_counter() - start
+        before_calls += nlp.calls
+
+        nlp.calls = 0
+        start = time.perf_counter()
+        indexed_people, indexed_relationships = extract_relationships(doc, nlp, SentenceIndex(doc))
+        after_seconds += time.perf_counter() - start
+        after_calls += nlp.calls
+
+        logger.info(f"{file_data['file_path']}: {len(people)} people, {len(relationships)} relationships before, "
+                    f"{len(indexed_relationships)} after")
+
+    logger.info(f"{len(files)} filings: spaCy calls per filing {1 + before_calls / max(len(files), 1):.1f} before, {1 + after_calls / max(len(files), 1):.1f} after "
+                f"(including the parse of the filing), relationship stage {before_seconds:.1f}s before, {after_seconds:.1f}s after")
+
+
+if __name__ == "__main__":
+    benchmark_sentence_reuse()
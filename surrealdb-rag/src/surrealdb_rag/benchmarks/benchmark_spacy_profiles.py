@@ -0,0 +1,73 @@
+"""Benchmark the spaCy pipeline profiles of the EDGAR graph extractor."""
+
+import time
+
+import pandas as pd
+
+from surrealdb_rag.helpers import loggers
+import surrealdb_rag.helpers.constants as constants
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams
+from surrealdb_rag.data_processing.edgar_graph_extractor import (
+    SPACY_MODEL, SPACY_PROFILES, EntitySpanIndex, SentenceIndex, clean_text, extract_people, find_relationships, load_spacy_pipeline
+)
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Benchmark spaCy pipeline profiles",db_params,model_params)
+
+
+def benchmark_spacy_profiles() -> None:
+    """
+    Parses the same downloaded filings with each spaCy pipeline profile and logs the docs/sec of the
+    parse, the PERSON and ORG entities found, and the people and person-person relationships the
+    extractor gets from them. The company steps are left out as they need the public companies metadata.
+    """
+    file_count = 10
+    profiles = ",".join(SPACY_PROFILES.keys())
+
+    args_loader.AddArg("file_count","fc","file_count","The number of filings from the EDGAR file index to parse. (default{0})",file_count)
+    args_loader.AddArg("profiles","sp","profiles","Comma separated spaCy profiles to compare. (default{0})",profiles)
+    args_loader.AddArg("spacy_model","sm","spacy_model","The spaCy model. (default{0})",SPACY_MODEL)
+    args_loader.LoadArgs()
+
+    file_count = int(args_loader.AdditionalArgs["file_count"]["value"])
+    profiles = str(args_loader.AdditionalArgs["profiles"]["value"]).split(",")
+    model_name = args_loader.AdditionalArgs["spacy_model"]["value"]
+
+    logger = loggers.setup_logger("BenchmarkSpacyProfiles")
+
+    files = pd.read_csv(constants.DEFAULT_EDGAR_FOLDER_FILE_INDEX).head(file_count).to_dict(orient="records")
+    texts = []
+    for file_data in files:
+        with open(file_data["file_path"], "r", encoding="utf-8") as f:
+            texts.append(clean_text(f.read()))
+
+    for profile in profiles:
+        nlp = load_spacy_pipeline(logger, model_name, profile)
+        profile_texts = [text[:nlp.max_length] for text in texts]
+
+        start = time.perf_counter()
+        docs = list(nlp.pipe(profile_texts))
+        parse_seconds = time.perf_counter() - start
+
+        person_entities = org_entities = people_count = relationship_count = 0
+        start = time.perf_counter()
+        for doc in docs:
+            person_entities += sum(ent.label_ == "PERSON" for ent in doc.ents)
+            org_entities += sum(ent.label_ == "ORG" for ent in doc.ents)
+            sentence_index = SentenceIndex(doc)
+            people = extract_people(doc, nlp, sentence_index = sentence_index)
+            relationships = find_relationships(people, people, nlp, sentence_index, EntitySpanIndex(nlp, doc, [people]))
+            people_count += len(people)
+            relationship_count += len(relationships)
+        extract_seconds = time.perf_counter() - start
+
+        logger.info(f"{profile}: {len(docs) / max(parse_seconds, 1e-9):.2f} docs/sec ({parse_seconds:.1f}s parsing, {extract_seconds:.1f}s extracting), "
+                    f"{person_entities} PERSON and {org_entities} ORG entities, {people_count} people, {relationship_count} person relationships")
+
+
+if __name__ == "__main__":
+    benchmark_spacy_profiles()
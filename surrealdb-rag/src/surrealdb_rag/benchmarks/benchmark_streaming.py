@@ -0,0 +1,102 @@
+"""Benchmark the time to first token of a streamed LLM answer against the wait for the whole answer."""
+
+import asyncio
+import time
+
+from surrealdb import AsyncSurreal
+
+from surrealdb_rag.helpers import loggers
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams
+from surrealdb_rag.helpers.llm_handler import ModelListHandler, RAGChatHandler
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Benchmark streamed LLM answers",db_params,model_params)
+
+PROMPT = "You are a helpful assistant. Answer in a few paragraphs."
+"""
+The system prompt of every request.
+"""
+
+
+async def time_answer(llm_handler:RAGChatHandler, question:str) -> float:
+    """
+    Returns:
+        float: The seconds until get_chat_response returns the whole answer.
+    """
+    start = time.perf_counter()
+    await llm_handler.get_chat_response(PROMPT, question)
+    return time.perf_counter() - start
+
+
+async def time_stream(llm_handler:RAGChatHandler, question:str) -> tuple[float, float]:
+    """
+    Returns:
+        tuple[float, float]: The seconds until stream_chat_response yields its first text (or ends, if it
+                             yields none) and until it ends.
+    """
+    start = time.perf_counter()
+    first_token_seconds = None
+    async for chunk in llm_handler.stream_chat_response(PROMPT, question):
+        if chunk and first_token_seconds is None:
+            first_token_seconds = time.perf_counter() - start
+    stream_seconds = time.perf_counter() - start
+    return first_token_seconds if first_token_seconds is not None else stream_seconds, stream_seconds
+
+
+async def benchmark_streaming() -> None:
+    """
+    Asks an LLM the same question a number of times, waiting for the whole answer as
+    send_system_message does and streaming it as stream_system_message does, and logs the mean
+    seconds until the user sees the first text of the answer with each.
+
+    The SurrealDB connection is only opened for a "(surreal)" model, which answers in one chunk.
+    """
+    llm_model = ""
+    question = "Explain how a vector index speeds up similarity search."
+    run_count = 3
+
+    args_loader.AddArg("llm_model","lm","llm_model","The LLM model as listed in the app, eg 'OLLAMA llama3.2:latest'. The first model listed if empty. (default{0})",llm_model)
+    args_loader.AddArg("question","q","question","The question to ask. (default{0})",question)
+    args_loader.AddArg("run_count","rc","run_count","The number of times to ask it each way. (default{0})",run_count)
+    args_loader.LoadArgs()
+
+    llm_model = args_loader.AdditionalArgs["llm_model"]["value"]
+    question = args_loader.AdditionalArgs["question"]["value"]
+    run_count = int(args_loader.AdditionalArgs["run_count"]["value"])
+
+    logger = loggers.setup_logger("BenchmarkStreaming")
+
+    llm_models = await ModelListHandler(model_params, None).available_llm_models()
+    llm_model = llm_model or next(iter(llm_models))
+    model_data = llm_models[llm_model]
+
+    connection = None
+    if model_data["host"] == "SQL":
+        connection = AsyncSurreal(db_params.DB_PARAMS.url)
+        await connection.signin({"username": db_params.DB_PARAMS.username, "password": db_params.DB_PARAMS.password})
+        await connection.use(db_params.DB_PARAMS.namespace, db_params.DB_PARAMS.database)
+    llm_handler = RAGChatHandler(model_data, model_params, connection)
+
+    answer_seconds = []
+    first_token_seconds = []
+    stream_seconds = []
+    for _ in range(run_count):
+        answer_seconds.append(await time_answer(llm_handler, question))
+        first_token, stream = await time_stream(llm_handler, question)
+        first_token_seconds.append(first_token)
+        stream_seconds.append(stream)
+
+    if connection:
+        await connection.close()
+
+    logger.info(f"{llm_model}, {run_count} runs: whole answer shown after {sum(answer_seconds) / run_count:.2f}s, "
+                f"streamed answer's first token after {sum(first_token_seconds) / run_count:.2f}s "
+                f"(stream ends after {sum(stream_seconds) / run_count:.2f}s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark_streaming())
@@ -11,8 +11,9 @@ import os
 import tqdm
 from surrealdb_rag.helpers.constants import ArgsLoader
 from surrealdb_rag.helpers.params import DatabaseParams, ModelParams, SurrealParams
-from surrealdb_rag.data_processing.embeddings import WordEmbeddingModel
-import csv
+from surrealdb_rag.data_processing.embeddings import WordEmbeddingModel, WORKER_EMBEDDING_MODELS, map_with_embedding_workers
+from surrealdb_rag.helpers.corpus_file_handler import CorpusFileWriter, STRING, INT
+import functools
 
 # Initialize database and model parameters, and argument loader
 db_params = DatabaseParams()
@@ -102,109 +103,143 @@ def generate_chunks(input_text:str, chunk_size:int)-> list[str]:
     return chunks
 
 
-def create_csv_from_folder(logger,file_index_df: pd.DataFrame , output_file_path, chunk_size:int) -> None:
+MODEL_SPECS = {
+    "GLOVE": (constants.DEFAULT_GLOVE_PATH, False),
+    "FASTTEXT": (constants.FS_EDGAR_PATH, True),
+}
+"""
+The embedding models opened by each worker: name -> (model path, unescape words).
+"""
+
+EDGAR_SCHEMA = {
+    "url":STRING,
+    "company_name":STRING,
+    "cik":INT,
+    "form":STRING,
+    "accession_no":STRING,
+    "company.ticker_display":STRING,
+    "company.tickers":STRING,
+    "company.exchanges":STRING,
+    "company.description":STRING,
+    "company.category":STRING,
+    "company.industry":STRING,
+    "company.sic":INT,
+    "company.website":STRING,
+    "filing_date":STRING,
+    "file_path":STRING,
+    "chunk":INT,
+    "content":STRING,
+}
+"""
+The non-vector columns of the EDGAR corpus file.
+"""
+EDGAR_VECTOR_COLUMNS = ["content_glove_vector", "content_fasttext_vector"]
+"""
+The vector columns of the EDGAR corpus file.
+"""
+
+
+def embed_file(file: dict, chunk_size: int) -> list[dict]:
     """
-    Creates a CSV file from a folder of text files, embedding the content using GloVe and FastText models.
+    Reads a filing, splits it into chunks and embeds every chunk. Runs in a worker process.
+
+    Args:
+        file (dict): The file index row of the filing.
+        chunk_size (int): The size of chunks to break the file into.
+
+    Returns:
+        list[dict]: The rows for the chunks of the file with numpy vectors, or None if the file does not exist.
+    """
+    if not (file["file_path"] and os.path.exists(file["file_path"])):
+        return None
+
+    with open(file["file_path"]) as source:
+        file_contents = source.read()
+    chunks = generate_chunks(file_contents,chunk_size)
+    # embed every chunk of the file in one batched call per model
+    content_glove_vectors = WORKER_EMBEDDING_MODELS["GLOVE"].sentences_to_matrix(chunks)
+    content_fasttext_vectors = WORKER_EMBEDDING_MODELS["FASTTEXT"].sentences_to_matrix(chunks)
+
+    rows = []
+    for chunk_number, chunk in enumerate(chunks):
+        content = f"""
+{file["company.tickers"]}
+{file["company.exchanges"]}
+{file["company_name"]}
+-------------
+{chunk}
+"""
+        rows.append({
+            "url":f"{file["url"]}#chunk{chunk_number}",
+            "company_name":file["company_name"],
+            "cik":file["cik"],
+            "form":file["form"],
+            "accession_no":file["accession_no"],
+            "company.ticker_display":file["company.ticker_display"],
+            "company.tickers":file["company.tickers"],
+            "company.exchanges":file["company.exchanges"],
+            "company.description":file["company.description"],
+            "company.industry":file["company.industry"],
+            "company.sic":file["company.sic"],
+            "company.category":file["company.category"],
+            "company.website":file["company.website"],
+            "filing_date":file["filing_date"],
+            "file_path":file["file_path"],
+            "chunk":chunk_number,
+            "content":content,
+            "content_glove_vector":content_glove_vectors[chunk_number],
+            "content_fasttext_vector":content_fasttext_vectors[chunk_number],
+            })
+    return rows
+
+
+def create_csv_from_folder(logger,file_index_df: pd.DataFrame , output_file_path, chunk_size:int, workers:int = 1) -> None:
+    """
+    Creates a corpus file from a folder of text files, embedding the content using GloVe and FastText models.
+
+    Files are read, chunked and embedded by a pool of worker processes that share the memory-mapped
+    models. Rows are written in file index order regardless of which worker finishes first.
 
     Args:
         logger (logging.Logger): The logger object for logging messages.
         file_index_df (pd.DataFrame): DataFrame containing file metadata.
-        output_file_path (str): The path to save the output CSV.
+        output_file_path (str): The path to save the output to, a .parquet file or a legacy .csv.
         chunk_size (int): The size of chunks to break each file into.
+        workers (int, optional): The number of embedding worker processes. Defaults to 1.
     """
 
-
+    # Open the models once here so the binary caches exist before the workers memory-map them
     logger.info(f"Loading Glove embedding model {constants.DEFAULT_GLOVE_PATH}")
     try:
-        gloveEmbeddingModel = WordEmbeddingModel(constants.DEFAULT_GLOVE_PATH,False)
+        WordEmbeddingModel(*MODEL_SPECS["GLOVE"])
     except Exception as e:
         logger.error(f"Error opening embedding model. please check the model file was downloaded using download_glove_model {e}")
 
     logger.info(f"Loading custom FastText embedding model {constants.FS_EDGAR_PATH}")
     try:
-        fastTextEmbeddingModel = WordEmbeddingModel(constants.FS_EDGAR_PATH,True)
+        WordEmbeddingModel(*MODEL_SPECS["FASTTEXT"])
     except Exception as e:
         logger.error(f"Error opening embedding model. train the model using train_fastText {e}")
 
 
-    file_keys = {
-        "url":"",
-        "company_name":"",
-        "cik":"",
-        "form":"",
-        "accession_no":"",
-        "company.ticker_display":"",
-        "company.tickers":"",
-        "company.exchanges":"",
-        "company.description":"",
-        "company.category":"",
-        "company.industry":"",
-        "company.sic":"",
-        "company.website":"",
-        "filing_date":"",
-        "file_path":"",
-        "chunk":"",
-        "content":"",
-        "content_glove_vector":"",
-        "content_fasttext_vector":"",
-        }.keys()
-    
+    files = file_index_df.to_dict(orient='records')
 
-    with open(output_file_path,"w", newline='') as f:
-        dict_writer = csv.DictWriter(f, file_keys)
-        dict_writer.writeheader()
-
-        for index, file in tqdm.tqdm(file_index_df.iterrows(), total=len(file_index_df), desc=f"Processing files"): 
-            if file["file_path"] and os.path.exists(file["file_path"]):
-                with open(file["file_path"]) as source:
-                    file_contents = source.read()
-                    chunks = generate_chunks(file_contents,chunk_size)
-                    chunk_number = 0
-                    
-                    for chunk in chunks:
-                        content = f"""
-{file["company.tickers"]}
-{file["company.exchanges"]}
-{file["company_name"]}
--------------
-{chunk}
-"""
-                        content_glove_vector = gloveEmbeddingModel.sentence_to_vec(chunk)
-                        content_fasttext_vector = fastTextEmbeddingModel.sentence_to_vec(chunk)
-                        row = {
-                            "url":f"{file["url"]}#chunk{chunk_number}",
-                            "company_name":file["company_name"],
-                            "cik":file["cik"],
-                            "form":file["form"],
-                            "accession_no":file["accession_no"],
-                            "company.ticker_display":file["company.ticker_display"],
-                            "company.tickers":file["company.tickers"],
-                            "company.exchanges":file["company.exchanges"],
-                            "company.description":file["company.description"],
-                            "company.industry":file["company.industry"],
-                            "company.sic":file["company.sic"],
-                            "company.category":file["company.category"],
-                            "company.website":file["company.website"],
-                            "filing_date":file["filing_date"],
-                            "file_path":file["file_path"],
-                            "chunk":chunk_number,
-                            "content":content,
-                            "content_glove_vector":content_glove_vector,
-                            "content_fasttext_vector":content_fasttext_vector,
-                            }
-                        chunk_number += 1
-                        dict_writer.writerow(row)
-            else:
+    with CorpusFileWriter(output_file_path, EDGAR_SCHEMA, EDGAR_VECTOR_COLUMNS) as corpus_writer:
+        file_rows = map_with_embedding_workers(functools.partial(embed_file, chunk_size=chunk_size), files, MODEL_SPECS, workers)
+        for file, rows in tqdm.tqdm(zip(files, file_rows), total=len(files), desc=f"Processing files"): 
+            if rows is None:
                 logger.error(f"File not found: '{file["file_path"]}'")
+            else:
+                corpus_writer.writerows(rows)
     
 
-    logger.info(f"CSV generation complete. Corpus saved to '{output_file_path}'.")
+    logger.info(f"Corpus generation complete. Corpus saved to '{output_file_path}'.")
 
 
 
 def generate_edgar_csv() -> None:
     """
-    Generates a CSV file from EDGAR filing data, embedding the content using GloVe and FastText models.
+    Generates a corpus file (Parquet by default) from EDGAR filing data, embedding the content using GloVe and FastText models.
     This function processes filings based on specified criteria like date range, tickers, exchanges, SIC codes, and forms.
     """
     
@@ -218,6 +253,7 @@ def generate_edgar_csv() -> None:
 
 
     chunk_size = constants.DEFAULT_CHUNK_SIZE
+    workers = os.cpu_count()
 
     start_date_str = ""
     end_date_str = ""
@@ -228,12 +264,13 @@ def generate_edgar_csv() -> None:
     args_loader.AddArg("end_date","eded","end_date","End filing date in format '%Y-%m-%d' for filtering. (default{0} blank string doesn't filter)",end_date_str)
     args_loader.AddArg("index_file","if","index_file","The path to the file that stores the file list and meta data. (default{0})",index_file)
     args_loader.AddArg("chunk_size","cs","chunk_size","The size of chunks to break each file into. (default{0})",chunk_size)
-    args_loader.AddArg("output_file","of","output_file","The path to the csv output. (default{0})",output_file)
+    args_loader.AddArg("output_file","of","output_file","The path to the output, .parquet or .csv for the legacy format. (default{0})",output_file)
     args_loader.AddArg("ticker","tic","ticker","Tickers to filter by can be an array in format 'AAPL,MSFT,AMZN' leave blank for all tickers. (default{0})",ticker_str)
     args_loader.AddArg("exchange","ex","exchange","Exchanges to filter by can be an array in format 'Nasdaq,NYSE,OTC' leave blank for all exchanges. (default{0})",ticker_str)
     args_loader.AddArg("sic","sic","sic","Industries to filter by can be an array in format '3674,1234,5432' (refer to https://www.sec.gov/search-filings/standard-industrial-classification-sic-code-list) leave blank for all industries. (default{0})",sic_str)
     args_loader.AddArg("form","edf","form","Form type to filter can be an array in format '10-K,10-Q,SC 13D,SC 13G,S-1,S-4'. (default{0})",form_str)
     args_loader.AddArg("backup_output_file","buof","backup_output_file","If the ouptut file already exists backup or not with timestamp? If false program will exit if exists. (default{0})",backup_output_file)
+    args_loader.AddArg("workers","w","workers","The number of embedding worker processes. (default{0})",workers)
     
     args_loader.LoadArgs()
 
@@ -276,7 +313,10 @@ def generate_edgar_csv() -> None:
 
 
     if args_loader.AdditionalArgs["chunk_size"]["value"]:
-        chunk_size = args_loader.AdditionalArgs["chunk_size"]["value"]
+        chunk_size = int(args_loader.AdditionalArgs["chunk_size"]["value"])
+
+    if args_loader.AdditionalArgs["workers"]["value"]:
+        workers = int(args_loader.AdditionalArgs["workers"]["value"])
 
 
     logger = loggers.setup_logger("SurreaEdgarBuildCSV")
@@ -338,7 +378,8 @@ def generate_edgar_csv() -> None:
 
 
     if backup_output_file and os.path.exists(output_file):
-        backup_output_file_path = output_file.replace(".csv",f"_backup_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.csv")
+        output_file_root, output_file_extension = os.path.splitext(output_file)
+        backup_output_file_path = f"{output_file_root}_backup_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}{output_file_extension}"
         logger.info(f"Backing up index file to {backup_output_file_path}")
         os.rename(output_file,backup_output_file_path)
     else:
@@ -346,7 +387,7 @@ def generate_edgar_csv() -> None:
             logger.info(f"File already exists... skipping (delete it if you want to regenerate or set buif to true): '{output_file}'.")
             return
 
-    create_csv_from_folder(logger,file_index_df,output_file,chunk_size)
+    create_csv_from_folder(logger,file_index_df,output_file,chunk_size,workers)
 
 
 
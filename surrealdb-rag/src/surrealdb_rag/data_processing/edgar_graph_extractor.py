@@ -5,53 +5,245 @@ from surrealdb_rag.helpers import loggers
 import surrealdb_rag.helpers.constants as constants
 import pandas as pd
 from surrealdb_rag.data_processing.embeddings import WordEmbeddingModel
+from surrealdb_rag.helpers.corpus_file_handler import (
+    CorpusFileWriter, list_part_files, merge_part_files, part_file_path, read_corpus_file, STRING, INT, FLOAT, STRING_LIST
+)
+from surrealdb_rag.helpers.run_manifest import RunManifest
+from surrealdb_rag.data_processing.name_matching import merge_people_names, CompanyNameIndex
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams
 import csv
 import ast
 import spacy
 import tqdm
 import spacy
-spacy.prefer_gpu()
+from spacy.tokens import Doc
+from spacy.matcher import PhraseMatcher
 import os
 import edgar
-from fuzzywuzzy import fuzz, process
+from fuzzywuzzy import fuzz
 import unicodedata
 import re
 import subprocess
 import sys
+from collections import defaultdict
+
+
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Extract the EDGAR graph",db_params,model_params)
+
+GRAPH_SCHEMA = {
+    "url":STRING,
+    "filer_cik":INT,
+    "form":STRING,
+    "filing_date":STRING,
+    "filer_company_name":STRING,
+    "accession_no":STRING,
+    "entity_type":STRING,
+    "entity_name":STRING,
+    "entity_cik":INT,
+    "entity2_name":STRING,
+    "entity2_cik":INT,
+    "relationship":STRING,
+    "confidence":FLOAT,
+    "contexts":STRING_LIST,
+}
+"""
+The non-vector columns of the EDGAR graph file.
+"""
+GRAPH_VECTOR_COLUMNS = ["glove_vector", "fasttext_vector"]
+"""
+The vector columns of the EDGAR graph file, calculated from the contexts of each entity or relationship.
+"""
+CHECKPOINT_FILE_COUNT = 100
+"""
+Every this many processed files their rows are saved to a new part file of the graph file, and their
+urls recorded in the run manifest. The part files are merged into the graph file at the end of the run.
+"""
+DEFAULT_NLP_PROCESSES = 1
+"""
+The default number of processes spaCy parses the filings with. Each process loads its own copy of the pipeline.
+"""
+DEFAULT_NLP_BATCH_SIZE = 4
+"""
+The default number of texts (filings or sections of filings) sent to a spaCy process at a time.
+"""
+SPACY_MODEL = "en_core_web_lg"
+"""
+The spaCy model the filings are parsed with.
+"""
+SPACY_PROFILES = {
+    "accurate": {"exclude": [], "enable": [], "prefer_gpu": True},
+    "fast": {"exclude": ["parser", "textcat", "textcat_multilabel", "entity_linker"], "enable": ["senter"], "prefer_gpu": False},
+}
+"""
+The spaCy pipeline profiles, selected with -sp. "accurate" runs the full pipeline, as before.
+"fast" drops the dependency parser for the (much cheaper) senter for sentence boundaries, and any
+text classifier or entity linker, keeping the tagger, lemmatizer and NER that the people, company
+and relationship verb extraction use. Without the parser relationships are found by the verb
+search between the entities only, so fewer are found.
+Each profile lists the components to exclude when loading, those to enable, and whether to use a GPU if there is one.
+"""
+DEFAULT_SPACY_PROFILE = "accurate"
+"""
+The default spaCy pipeline profile.
+"""
+SECTION_SEPARATORS = ["\n\n", "\n", ". ", " "]
+"""
+The boundaries an over-long filing is split at, tried in order so sections end at a paragraph or sentence where possible.
+"""
+
+
+def split_text_into_sections(text:str, max_length:int) -> list[str]:
+    """
+    Splits a text into sections no longer than max_length, so spaCy can parse a long filing without
+    raising nlp.max_length. Sections end at the last paragraph break (or line break, sentence end or
+    space) before the limit and keep their separators, so joining the sections gives back the text.
 
+    Args:
+        text (str): The text.
+        max_length (int): The most characters in a section.
 
-def fuzzy_merge_people(nlp, people_list, threshold=85):
+    Returns:
+        list[str]: The sections, a single section if the text fits.
     """
-    Merges similar person entities using fuzzy matching and alias handling.
-    Creates a primary key based on the longest, most descriptive name.
+    sections = []
+    start = 0
+    while len(text) - start > max_length:
+        stop = start + max_length
+        for separator in SECTION_SEPARATORS:
+            split_at = text.rfind(separator, start, stop)
+            if split_at > start:
+                stop = split_at + len(separator)
+                break
+        sections.append(text[start:stop])
+        start = stop
+    sections.append(text[start:])
+    return sections
+
+
+def parse_files(logger, nlp, files, skip_file, n_process = DEFAULT_NLP_PROCESSES, batch_size = DEFAULT_NLP_BATCH_SIZE):
+    """
+    Reads and cleans the filings and parses them with `nlp.pipe`, streaming the texts through
+    n_process spaCy processes. Filings longer than nlp.max_length are parsed as sections and the
+    section docs joined back into one Doc. Docs come back in the order of `files`.
+
+    Args:
+        logger (logging.Logger): Logger for files that can't be read.
+        nlp (spacy.language.Language): The spaCy NLP pipeline.
+        files (list): The file metadata dictionaries.
+        skip_file (callable): Called with each file's metadata, returns True to skip it (eg already processed).
+        n_process (int, optional): The number of spaCy processes. Defaults to DEFAULT_NLP_PROCESSES.
+        batch_size (int, optional): The number of texts sent to a process at a time. Defaults to DEFAULT_NLP_BATCH_SIZE.
+
+    Yields:
+        tuple: The file metadata and its Doc, or None if the file was skipped or couldn't be read.
+    """
+    # files that are skipped or unreadable are passed through as a single text-less section
+    def sections():
+        for file_data in files:
+            if skip_file(file_data):
+                yield "", (file_data, 1, False)
+                continue
+            file_path = file_data["file_path"]
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+            except FileNotFoundError:
+                logger.info(f"Error: File not found: {file_path}")
+                yield "", (file_data, 1, False)
+                continue
+            except Exception as e:
+                logger.info(f"Error reading file {file_path}: {e}")
+                yield "", (file_data, 1, False)
+                continue
+
+            file_sections = split_text_into_sections(clean_text(text), nlp.max_length)
+            if len(file_sections) > 1:
+                logger.info(f"Split {file_path} into {len(file_sections)} sections of up to {nlp.max_length} characters")
+            for section in file_sections:
+                yield section, (file_data, len(file_sections), True)
+
+    section_docs = []
+    for doc, (file_data, section_count, parsed) in nlp.pipe(sections(), as_tuples=True, n_process=n_process, batch_size=batch_size):
+        if not parsed:
+            yield file_data, None
+            continue
+        section_docs.append(doc)
+        if len(section_docs) == section_count:
+            yield file_data, section_docs[0] if section_count == 1 else Doc.from_docs(section_docs)
+            section_docs = []
+
+
+class SentenceIndex():
+    """
+    The sentences of a parsed filing, keyed by their start offset, so the context sentences of its
+    entities are looked up as spans of the filing's Doc instead of being parsed again.
+
+    Usage:
+        sentence_index = SentenceIndex(doc)
+        span = sentence_index.span(ent.sent.text.strip())
+    """
+
+    def __init__(self, doc):
+        """
+        Args:
+            doc (spacy.tokens.Doc): The parsed filing.
+        """
+        self.sentences = {}
+        self.offsets = {}
+        for sent in doc.sents:
+            self.sentences[sent.start_char] = sent
+            # a context is the stripped sentence text, the first sentence with that text is used
+            self.offsets.setdefault(sent.text.strip(), sent.start_char)
+
+    def span(self, context):
+        """
+        Args:
+            context (str): A context sentence, the stripped text of a sentence of the filing.
+
+        Returns:
+            spacy.tokens.Span: The sentence, or None if it is not a sentence of the filing.
+        """
+        offset = self.offsets.get(context)
+        return self.sentences[offset] if offset is not None else None
+
+
+def context_span(nlp, context, sentence_index = None):
     """
-    merged_people = {}  # Key: Primary Name, Value: {aliases: [], contexts: []}
+    Gets the parsed context sentence, from the sentence index when there is one, parsing it only
+    when it is not a sentence of the indexed filing.
 
-    for person in tqdm.tqdm(people_list, desc="De-Duping People", position=1, leave=False):
-    #for person in people_list:
-        name = person["name"]
-        contexts = person["contexts"]
+    Args:
+        nlp (spacy.language.Language): The spaCy NLP pipeline.
+        context (str): The context sentence.
+        sentence_index (SentenceIndex, optional): The sentences of the filing. Defaults to None.
 
-        # Find best matches
-        matches = process.extract(name, list(merged_people.keys()) + [p["name"] for p in people_list], scorer=fuzz.token_set_ratio, limit=None)
-        best_matches = sorted([match[0] for match in matches if match[1] >= threshold], key=len, reverse=True)
+    Returns:
+        spacy.tokens.Span or spacy.tokens.Doc: The parsed sentence.
+    """
+    span = sentence_index.span(context) if sentence_index is not None else None
+    return span if span is not None else nlp(context)
 
-        primary_name = best_matches[0]  # Longest name is the primary key
 
-        if primary_name not in merged_people:
-            merged_people[primary_name] = {"aliases": [primary_name], "contexts": contexts.copy()}
-        else:
-            merged_people[primary_name]["aliases"].extend([m for m in best_matches if m not in merged_people[primary_name]["aliases"]])
-            for context in contexts:
-                if context not in merged_people[primary_name]["contexts"]:
-                    merged_people[primary_name]["contexts"].append(context)
+def fuzzy_merge_people(nlp, people_list, threshold=85, sentence_index = None):
+    """
+    Merges similar person entities using fuzzy matching and alias handling.
+    Creates a primary key based on the longest, most descriptive name.
+    The names are matched by `merge_people_names`, which scores them a block at a time with rapidfuzz.
+    The pronouns are found in the sentences of sentence_index, see `context_span`.
+    """
+    merged_people = merge_people_names(people_list, threshold)
+
     #add pronouns
     final_people = []
     for primary_name, data in merged_people.items():
       person_dict = {"name":primary_name, "aliases":data["aliases"], "contexts": data["contexts"]}
       #add pronoun
       for context in data["contexts"]:
-        doc = nlp(context)
+        doc = context_span(nlp, context, sentence_index)
         for token in doc:
             if token.pos_ == "PRON" and token.text.lower() in ("he","she","him","her","his","hers"):
                 if token.text.lower() not in person_dict["aliases"]:
@@ -59,10 +251,11 @@ def fuzzy_merge_people(nlp, people_list, threshold=85):
       final_people.append(person_dict)
 
     return final_people
-def fuzzy_match_company(company_name, company_index, company_metadata_lookup, threshold=80):
+def fuzzy_match_company(company_name, company_index, company_metadata_lookup, threshold=80, company_name_index = None):
     """
     Finds best matching company using fuzzy matching.  Uses company_index
-    for direct lookups, and company_metadata_lookup for fuzzy matching.
+    for direct lookups, and company_name_index (or a scan of company_metadata_lookup
+    when there is no name index) for fuzzy matching.
     Returns CIK or None.
     """
     # 1. Try a direct, case-insensitive lookup in the index FIRST
@@ -71,7 +264,11 @@ def fuzzy_match_company(company_name, company_index, company_metadata_lookup, th
     if cik:
         return cik  # Fast path: exact match found
 
-    # 2. If no direct match, do fuzzy matching against the metadata
+    # 2. If no direct match, score only the companies sharing a token or token prefix with the name
+    if company_name_index is not None:
+        return company_name_index.best_match(company_name, threshold)
+
+    # 3. Without a name index, do fuzzy matching against all the metadata
     best_match = None
     best_score = 0
     for cik, metadata in company_metadata_lookup.items():
@@ -89,7 +286,7 @@ def fuzzy_match_company(company_name, company_index, company_metadata_lookup, th
     return best_match if best_score >= threshold else None
 
 
-def extract_people(doc, nlp):
+def extract_people(doc, nlp, sentence_index = None):
     """Extracts and deduplicates person entities."""
     people = []
     for ent in tqdm.tqdm(doc.ents, desc="Processing People", position=1, leave=False):
@@ -97,12 +294,12 @@ def extract_people(doc, nlp):
         if ent.label_ == "PERSON":
             people.append({"name": ent.text.strip(), "contexts": [ent.sent.text.strip()]})
 
-    merged_people = fuzzy_merge_people(nlp, people)
+    merged_people = fuzzy_merge_people(nlp, people, sentence_index = sentence_index)
     return merged_people
 
 
 
-def extract_companies(doc, company_metadata_lookup, company_index, filing_company_cik, use_fuzz_company_match = False):
+def extract_companies(doc, company_metadata_lookup, company_index, filing_company_cik, use_fuzz_company_match = False, company_name_index = None):
     """Extracts company entities."""
     companies = []
         
@@ -118,7 +315,7 @@ def extract_companies(doc, company_metadata_lookup, company_index, filing_compan
                 # Fallback to fuzzy matching if not found directly
                 #only bother to fuzzy match if string is of sizable length. most firms only discuss other companies in full language
                 if len(ent.text.strip()) > 4:
-                    cik = fuzzy_match_company(ent.text.strip(), company_index, company_metadata_lookup)
+                    cik = fuzzy_match_company(ent.text.strip(), company_index, company_metadata_lookup, company_name_index = company_name_index)
                     if cik and cik != filing_company_cik:
                         companies.append({"cik": cik, "name": ent.text.strip(), "contexts": [ent.sent.text.strip()],"company_data":company_metadata_lookup[cik]})
 
@@ -142,69 +339,164 @@ def extract_companies(doc, company_metadata_lookup, company_index, filing_compan
     return list(merged_companies.values())
 
 
-def find_relationships(entity1_list, entity2_list, nlp):
+def build_context_index(entity_list):
     """
-    Finds relationships between two lists of entities, focusing only on shared contexts.
+    Builds an inverted index from each context sentence to the entities mentioned in it.
+
+    Args:
+        entity_list (list): The entities, each with its "contexts".
+
+    Returns:
+        dict: Maps each context to the positions in entity_list of the entities it is a context of, in order.
+    """
+    context_index = defaultdict(list)
+    for position, entity in enumerate(entity_list):
+        for context in dict.fromkeys(entity.get("contexts", [])):
+            context_index[context].append(position)
+    return context_index
+
+
+def co_occurring_entities(entity1_list, entity2_list):
     """
-    relationships = []
+    Finds the pairs of entities that share a context, visiting only the entities of entity2_list
+    indexed under the contexts of each entity of entity1_list instead of every pair.
 
+    Args:
+        entity1_list (list): The first entities of the pairs.
+        entity2_list (list): The second entities of the pairs, which may be entity1_list.
 
+    Yields:
+        tuple: entity1, entity2 and the set of their shared contexts, in the order of entity1_list
+               then entity2_list. An entity is not paired with itself.
+    """
+    context_index = build_context_index(entity2_list)
     for entity1 in tqdm.tqdm(entity1_list, desc="Processing relationships", position=1, leave=False):
-    #for entity1 in entity1_list:
-        
-        for entity2 in tqdm.tqdm(entity2_list, desc="...", position=2, leave=False):
-        #for entity2 in entity2_list:
+        shared_contexts_by_position = defaultdict(set)
+        for context in entity1.get("contexts", []):
+            for position in context_index.get(context, ()):
+                shared_contexts_by_position[position].add(context)
+
+        for position in sorted(shared_contexts_by_position):
+            entity2 = entity2_list[position]
             if entity1 == entity2:  # Avoid self-relations
                 continue
-                         
-            # Find shared contexts
-            shared_contexts = set(entity1.get("contexts", [])) & set(entity2.get("contexts", []))
-
-            if not shared_contexts:
-                continue  # Skip if no shared contexts
+            yield entity1, entity2, shared_contexts_by_position[position]
 
 
+class EntitySpanIndex():
+    """
+    The spans of the aliases of a filing's entities, found by one PhraseMatcher pass over the filing
+    with the aliases of every entity, and grouped by entity and sentence. The cost grows with the
+    length of the filing rather than with the number of entities times their contexts.
 
-            for context in shared_contexts:
+    Like `find_entity_spans`, aliases match case-insensitively and on token boundaries.
 
-                # if "cik" in entity1 and entity1["cik"] == 354950:
-                #     if "name" in entity2 and entity2["name"] == 'Monica Schwartz':
-                #         a = ""
-                        
-                context_doc = nlp(context) #added spacy_nlp
+    Usage:
+        entity_span_index = EntitySpanIndex(nlp, doc, [people, companies])
+        spans = entity_span_index.find(sentence, person)
+    """
 
-               # Find entity1 spans
+    def __init__(self, nlp, doc, entity_lists):
+        """
+        Args:
+            nlp (spacy.language.Language): The spaCy NLP pipeline, whose tokenizer splits the aliases.
+            doc (spacy.tokens.Doc): The parsed filing.
+            entity_lists (list): The lists of entities (dicts with a "name" and optional "aliases") to find.
+        """
+        self.doc = doc
+        self.positions = {}
+        self.spans = defaultdict(list)
+        matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+        for entities in entity_lists:
+            for entity in entities:
+                if id(entity) in self.positions:
+                    continue
+                position = len(self.positions)
+                self.positions[id(entity)] = position
+                aliases = [alias for alias in dict.fromkeys(entity.get("aliases", [entity.get("name")])) if alias and alias.strip()]
+                if aliases:
+                    matcher.add(str(position), list(nlp.tokenizer.pipe(aliases)))
+
+        for match_id, start, end in matcher(doc):
+            span = doc[start:end]
+            self.spans[(int(nlp.vocab.strings[match_id]), span.sent.start_char)].append(span)
+
+    def find(self, sentence, entity):
+        """
+        Finds an entity's spans in a sentence, falling back to `find_entity_spans` for a sentence
+        or an entity that is not part of the index.
+
+        Args:
+            sentence (spacy.tokens.Span): A sentence of the filing.
+            entity (dict): An indexed entity.
+
+        Returns:
+            list: (span, entity) tuples, in the order they appear in the sentence.
+        """
+        position = self.positions.get(id(entity))
+        if position is None or getattr(sentence, "doc", None) is not self.doc:
+            return find_entity_spans(sentence, entity)
+        return [(span, entity) for span in self.spans.get((position, sentence.start_char), [])]
+
+
+def find_relationships(entity1_list, entity2_list, nlp, sentence_index = None, entity_span_index = None):
+    """
+    Finds relationships between two lists of entities, focusing only on shared contexts.
+    Only the pairs that co-occur in a context are visited, see `co_occurring_entities`,
+    the contexts are the parsed sentences of sentence_index, see `context_span`, and the entities
+    are found in them with entity_span_index when there is one, else `find_entity_spans`.
+    The relationships are accumulated in a dict keyed by `relationship_key`, see `add_directional_relationship`.
+    """
+    relationships = {}
+
+    for entity1, entity2, shared_contexts in co_occurring_entities(entity1_list, entity2_list):
+        for context in shared_contexts:
+
+            # if "cik" in entity1 and entity1["cik"] == 354950:
+            #     if "name" in entity2 and entity2["name"] == 'Monica Schwartz':
+            #         a = ""
+                    
+            context_doc = context_span(nlp, context, sentence_index)
+
+            if entity_span_index is not None:
+                sentence_entity1_spans = entity_span_index.find(context_doc, entity1)
+                sentence_entity2_spans = entity_span_index.find(context_doc, entity2)
+            else:
+                # Find entity1 spans
                 sentence_entity1_spans = find_entity_spans(context_doc, entity1)
 
                 # Find entity2 spans
                 sentence_entity2_spans = find_entity_spans(context_doc, entity2)
 
-                for span1, entity1_found in sentence_entity1_spans:
-                    for span2, entity2_found in sentence_entity2_spans:
-                        if entity1_found != entity2_found:  # Avoid self-relations within sentence
-                            # --- Simplified Relationship Extraction ---
-                            relationship = find_relationship_verb(span1.root, span2.root) #passing the span root.
-                            if relationship:
-                                add_directional_relationship(relationships, entity1_found, entity2_found, relationship, shared_contexts=list(shared_contexts))               
-    
-    relationships = normalize_confidence(relationships)
+            for span1, entity1_found in sentence_entity1_spans:
+                for span2, entity2_found in sentence_entity2_spans:
+                    if entity_key(entity1_found) != entity_key(entity2_found):  # Avoid self-relations within sentence
+                        # --- Simplified Relationship Extraction ---
+                        relationship = find_relationship_verb(span1.root, span2.root) #passing the span root.
+                        if relationship:
+                            add_directional_relationship(relationships, entity1_found, entity2_found, relationship, shared_contexts=list(shared_contexts))
+
+    relationships = normalize_confidence(list(relationships.values()))
     
     return relationships
 
 def normalize_confidence(relationships):
     """
-    Normalizes confidence scores in a list of relationships to a 1-10 range.
+    Normalizes confidence scores in a list of relationships to a 1-10 range, in place,
+    finding the range in one pass and rescaling in a second.
     """
-    if not relationships:
-        return relationships
-
-    confidences = [rel["confidence"] for rel in relationships if rel.get("confidence") is not None]
-    if not confidences:
+    min_confidence = None
+    max_confidence = None
+    for rel in relationships:
+        confidence = rel.get("confidence")
+        if confidence is not None:
+            if min_confidence is None or confidence < min_confidence:
+                min_confidence = confidence
+            if max_confidence is None or confidence > max_confidence:
+                max_confidence = confidence
+    if min_confidence is None:
         return relationships
 
-    min_confidence = min(confidences)
-    max_confidence = max(confidences)
-
     if min_confidence == max_confidence:
         # All scores are the same, set them to 5
         for rel in relationships:
@@ -222,7 +514,7 @@ def normalize_confidence(relationships):
 
 def find_entity_spans(doc, entity):
     """
-    Finds entity spans within a spaCy Doc based on aliases.
+    Finds entity spans within a spaCy Doc, or a sentence Span of one, based on aliases.
     """
     entity_spans = []
     for alias in entity.get("aliases", [entity.get("name")]):
@@ -291,12 +583,12 @@ def find_relationship_verb(source_token, target_token):
 
     if not verb_token:
         # --- Verb Search ---
-        sentence = source_token.sent  # Get the sentence containing the tokens
         # Find verbs between token1 and token2
+        # token.i indexes the whole Doc, which is the filing when the sentence is a span of it
         start = min(source_token.i, target_token.i)
         end = max(source_token.i, target_token.i)
 
-        for token in sentence[start:end]:
+        for token in source_token.doc[start:end]:
             if token.pos_ == "VERB":
                 # Heuristic filtering (adjust as needed)
                 if token.dep_ not in ("aux", "auxpass"):  # Exclude auxiliary verbs
@@ -351,13 +643,32 @@ def calculate_token_distance_relationship_confidence(source_token,target_token,v
 
 
 
+def entity_key(entity):
+    """
+    The canonical key of an extracted entity: its CIK for a company, its primary name for a person.
+    Entities are merged by these, so equal keys mean equal entities within a filing.
+    """
+    if "cik" in entity:
+        return ("company", entity["cik"])
+    return ("person", entity.get("name"))
+
+
+def relationship_key(entity1, entity2, verb):
+    """
+    The canonical key of a directional relationship, (source entity, target entity, verb).
+    """
+    return (entity_key(entity1), entity_key(entity2), verb)
+
+
 def add_directional_relationship(relationships, entity1, entity2, relationship_data, shared_contexts=None):
     """
-    Adds a directional relationship to the relationships list, handling deduplication,
+    Adds a directional relationship to the relationships, handling deduplication,
     merging shared contexts, and incorporating confidence scores.
+    The relationships are a dict keyed by `relationship_key`, so an existing relationship is
+    found with one lookup and merged in place.
 
     Args:
-        relationships (list): The list of relationship dictionaries.
+        relationships (dict): The relationship dictionaries by their `relationship_key`, in the order they were found.
         entity1 (dict): The first entity in the relationship.
         entity2 (dict): The second entity in the relationship.
         relationship_data (dict): A dictionary containing the 'verb', 'source_is_actor',
@@ -375,38 +686,40 @@ def add_directional_relationship(relationships, entity1, entity2, relationship_d
     if shared_contexts is None:
         shared_contexts = []
 
-    for existing_relationship in relationships:
-        if (existing_relationship["entity1"] == ent1 and
-            existing_relationship["entity2"] == ent2 and
-            existing_relationship["relationship"] == relationship_data["verb"]):
-
-            # Merge shared_contexts
-            existing_relationship["shared_contexts"] = list(set(existing_relationship["shared_contexts"] + shared_contexts))
-            # multiply the confidence score by the number of matched context to better wieght for normalization
-            existing_relationship["confidence"] += relationship_data["confidence"] * len(shared_contexts)
-            # max(existing_relationship.get("confidence",0), relationship_data["confidence"])
-            return  # Exit after merging
-
-    # If no existing relationship found, append a new one
-    relationships.append({
+    key = relationship_key(ent1, ent2, relationship_data["verb"])
+    existing_relationship = relationships.get(key)
+    if existing_relationship is not None:
+        # Merge shared_contexts
+        existing_relationship["shared_contexts"] = list(set(existing_relationship["shared_contexts"] + shared_contexts))
+        # multiply the confidence score by the number of matched context to better wieght for normalization
+        existing_relationship["confidence"] += relationship_data["confidence"] * len(shared_contexts)
+        # max(existing_relationship.get("confidence",0), relationship_data["confidence"])
+        return  # Exit after merging
+
+    # If no existing relationship found, add a new one
+    relationships[key] = {
         "entity1": ent1,
         "entity2": ent2,
         "relationship": relationship_data["verb"],
         "shared_contexts": shared_contexts,
         "confidence": relationship_data["confidence"] * len(shared_contexts)
-    })
+    }
 
 def write_file_data_to_csv(
-            dict_writer:csv.DictWriter,gloveEmbeddingModel,fastTextEmbeddingModel,
+            corpus_writer:CorpusFileWriter,gloveEmbeddingModel,fastTextEmbeddingModel,
             file_data,
             people,
             companies,
             relationships):
     """
-    Writes extracted entity and relationship data to a CSV file, including embedding vectors.
+    Writes extracted entity and relationship data to the graph file, including embedding vectors.
+
+    The rows of the filing are built first, then the joined contexts of all of them are embedded
+    with one `sentences_to_matrix` call per model and each row is given its float32 row of the
+    matrices, which the writer stores without converting it to a list.
 
     Args:
-        dict_writer (csv.DictWriter): The CSV writer object.
+        corpus_writer (CorpusFileWriter): The graph file writer.
         gloveEmbeddingModel (WordEmbeddingModel): The GloVe embedding model.
         fastTextEmbeddingModel (WordEmbeddingModel): The FastText embedding model.
         file_data (dict): Metadata about the current file being processed.
@@ -427,17 +740,13 @@ def write_file_data_to_csv(
         "filer_company_name":file_data["company_name"],
         "accession_no":file_data["accession_no"],
     }
+    rows = []
     for person in people:
         row = row_master.copy()
         row["entity_type"] = "person"
         row["entity_name"] = person["name"]
         row["contexts"] = person["contexts"]
-        all_contexts = "\n".join(row["contexts"])
-        context_glove_vector = gloveEmbeddingModel.sentence_to_vec(all_contexts)
-        context_fasttext_vector = fastTextEmbeddingModel.sentence_to_vec(all_contexts)
-        row["glove_vector"] = context_glove_vector
-        row["fasttext_vector"] = context_fasttext_vector
-        dict_writer.writerow(row)
+        rows.append(row)
 
     for company in companies:
         row = row_master.copy()
@@ -445,12 +754,7 @@ def write_file_data_to_csv(
         row["entity_name"] = company["name"]
         row["entity_cik"] = company["cik"]
         row["contexts"] = company["contexts"]
-        all_contexts = "\n".join(row["contexts"])
-        context_glove_vector = gloveEmbeddingModel.sentence_to_vec(all_contexts)
-        context_fasttext_vector = fastTextEmbeddingModel.sentence_to_vec(all_contexts)
-        row["glove_vector"] = context_glove_vector
-        row["fasttext_vector"] = context_fasttext_vector
-        dict_writer.writerow(row)
+        rows.append(row)
     
 
     for relation in relationships:
@@ -470,13 +774,16 @@ def write_file_data_to_csv(
         row["relationship"] = relation["relationship"]
         row["confidence"] = relation["confidence"]
         row["contexts"] = relation["shared_contexts"]
+        rows.append(row)
 
-        all_contexts = "\n".join(row["contexts"])
-        context_glove_vector = gloveEmbeddingModel.sentence_to_vec(all_contexts)
-        context_fasttext_vector = fastTextEmbeddingModel.sentence_to_vec(all_contexts)
+    # embed the contexts of every row of the filing in one batch per model
+    all_contexts = ["\n".join(row["contexts"]) for row in rows]
+    context_glove_vectors = gloveEmbeddingModel.sentences_to_matrix(all_contexts)
+    context_fasttext_vectors = fastTextEmbeddingModel.sentences_to_matrix(all_contexts)
+    for row, context_glove_vector, context_fasttext_vector in zip(rows, context_glove_vectors, context_fasttext_vectors):
         row["glove_vector"] = context_glove_vector
         row["fasttext_vector"] = context_fasttext_vector
-        dict_writer.writerow(row)
+    corpus_writer.writerows(rows)
     
 def clean_text(text):
     """
@@ -516,23 +823,40 @@ def clean_text(text):
 
     return text
 
-def extract_entities_and_relationships(logger, output_file_path ,files, company_metadata_lookup, company_index, nlp, use_fuzz_company_match = False, return_results = False):
+def extract_entities_and_relationships(logger, output_file_path ,files, company_metadata_lookup, company_index, nlp, use_fuzz_company_match = False, return_results = False, resume = True,
+                                       n_process = DEFAULT_NLP_PROCESSES, nlp_batch_size = DEFAULT_NLP_BATCH_SIZE, company_name_index = None,
+                                       extract_person_relationships = True):
     """
     Extracts entities (people and companies) and their relationships from a collection of text files.
 
     This function processes each file, identifies entities using spaCy's Named Entity Recognition,
     deduplicates entities, and then extracts relationships between them.  The results are either
-    written to a CSV file or returned as a dictionary.
+    written to the graph file (Parquet, or CSV for the legacy format) or returned as a dictionary.
+
+    The filings are parsed by `parse_files`, which streams them through n_process spaCy processes
+    while the entities of the parsed filings are extracted here. The results are written in the
+    order of `files` whatever the number of processes.
+
+    Every CHECKPOINT_FILE_COUNT files the rows written since the last checkpoint are saved to a part
+    file next to the graph file and their urls recorded in a run manifest, so a resumed run skips them
+    with a set lookup instead of re-reading the file. The part files, including those left by an
+    interrupted run, are merged into the graph file once the run completes. On an error the rows of
+    the files since the last checkpoint are dropped, and a resumed run processes those files again.
 
     Args:
         logger (logging.Logger): Logger for logging information and errors.
-        output_file_path (str): Path to the output CSV file.
+        output_file_path (str): Path to the output .parquet or .csv file.
         files (list): A list of dictionaries, where each dictionary contains file metadata.
         company_metadata_lookup (dict): A dictionary mapping CIKs to company metadata.
         company_index (dict): A dictionary for fast company lookup by name/ticker.
         nlp (spacy.language.Language): The spaCy NLP pipeline.
         use_fuzz_company_match (bool, optional): Whether to use fuzzy matching for company names. Defaults to False.
-        return_results (bool, optional): Whether to return the extraction results instead of writing to CSV. Defaults to False.
+        return_results (bool, optional): Whether to return the extraction results instead of writing to the file. Defaults to False.
+        resume (bool, optional): Add to an existing graph file, skipping the files already in it. Defaults to True.
+        n_process (int, optional): The number of spaCy processes. Defaults to DEFAULT_NLP_PROCESSES.
+        nlp_batch_size (int, optional): The number of texts sent to a spaCy process at a time. Defaults to DEFAULT_NLP_BATCH_SIZE.
+        company_name_index (CompanyNameIndex, optional): Narrows fuzzy company matching to the candidate companies. Defaults to None, scanning every company.
+        extract_person_relationships (bool, optional): Also extract the relationships between people. Defaults to True.
 
     Returns:
         dict (optional): If return_results is True, returns a dictionary where keys are file URLs and
@@ -553,82 +877,47 @@ def extract_entities_and_relationships(logger, output_file_path ,files, company_
         logger.error(f"Error opening embedding model. train the model using train_fastText {e}")
 
 
-    add_to_existing_data = False
-    open_text_mode = "w"
+    part_paths = list_part_files(output_file_path)
+    add_to_existing_data = resume and (os.path.exists(output_file_path) or len(part_paths) > 0)
 
-    if os.path.exists(output_file_path):
-        logger.info(f"File already exists... skipping (delete it if you want to regenerate): '{output_file_path}'.")
-        logger.info(f"Loading data that was already processed to data frame '{output_file_path}'")
-       
-        already_processed_file_data = pd.read_csv(output_file_path)
-        add_to_existing_data = True
-        open_text_mode = "a"
-    
+    manifest = RunManifest(f"edgar_graph_extractor:{os.path.abspath(output_file_path)}")
+    if not add_to_existing_data:
+        manifest.reset()
+        for part_path in part_paths:
+            os.remove(part_path)
+        part_paths = []
+    elif not manifest.processed_items and os.path.exists(output_file_path):
+        # a graph file written before the manifest existed, record its urls once
+        logger.info(f"Loading urls that were already processed from '{output_file_path}'")
+        already_processed_file_data = read_corpus_file(output_file_path, [], columns=["url"])
+        manifest.mark_processed(already_processed_file_data["url"].unique().tolist())
 
-    
-    
-    file_keys = {
-        "url":"",
-        "filer_cik":"",
-        "form":"",
-        "filing_date":"",
-        "filer_company_name":"",
-        "accession_no":"",
-        "entity_type":"",
-        "entity_name":"",
-        "entity_cik":"",
-        "entity2_name":"",
-        "entity2_cik":"",
-        "relationship":"",
-        "confidence":0,
-        "contexts":[],
-        "glove_vector":[],
-        "fasttext_vector":[]
-        }.keys()
-    
+    if add_to_existing_data:
+        logger.info(f"File already exists, skipping the {len(manifest.processed_items)} files in it (delete it if you want to regenerate): '{output_file_path}'.")
 
-    with open(output_file_path,open_text_mode, newline='') as f:
-        dict_writer = csv.DictWriter(f, file_keys)
-        if not add_to_existing_data:
-            dict_writer.writeheader()
+    # the urls written since the last checkpoint, recorded once their part file is saved
+    pending_urls = []
 
+    def open_part_writer():
+        # numbered on from the parts an interrupted run left, only the last part of a run can be empty and unsaved
+        part_paths.append(part_file_path(output_file_path, len(part_paths) + 1))
+        return CorpusFileWriter(part_paths[-1], GRAPH_SCHEMA, GRAPH_VECTOR_COLUMNS)
 
+    corpus_writer = open_part_writer()
 
+    try:
         results = {}
 
-        file_tqdm = tqdm.tqdm(files, desc="Processing Files")
-        for file_data in file_tqdm:
-            if add_to_existing_data:
-                url = file_data["url"]
-                # check to see if file already processed
-                if url in already_processed_file_data['url'].values:
-                    continue
-
-
-            file_path = file_data["file_path"]
-            filing_company_cik = file_data["cik"]
+        # check to see if file already processed
+        skip_file = lambda file_data: manifest.is_processed(file_data["url"])
 
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
-            except FileNotFoundError:
-                logger.info(f"Error: File not found: {file_path}")
+        file_tqdm = tqdm.tqdm(parse_files(logger, nlp, files, skip_file, n_process, nlp_batch_size), total=len(files), desc="Processing Files")
+        for file_data, doc in file_tqdm:
+            if doc is None:
                 continue
-            except Exception as e:
-                logger.info(f"Error reading file {file_path}: {e}")
-                continue
-
-            text = clean_text(text)
-            text_length = len(text)
-            if text_length > nlp.max_length:
-                nlp.max_length =  len(text)  # Increase to 5,000,000 characters (5GB memory)
-                logger.info(f"Increased nlp.max_length to {nlp.max_length} for file: {file_path}")
-
-            # Update tqdm with a message before nlp processing
-            file_tqdm.set_description(f"Processing file: {file_path}") #use tqdm.write to avoid overwriting the progress bar.
-            file_tqdm.set_description("Loading spaCy...")
 
-            doc = nlp(text)  # This might take a while
+            url = file_data["url"]
+            filing_company_cik = file_data["cik"]
 
             # Update tqdm with a message after nlp processing
             file_tqdm.set_description("spaCy loaded, extracting data...")
@@ -636,18 +925,20 @@ def extract_entities_and_relationships(logger, output_file_path ,files, company_
 
 
             # --- Step 1 & 2: Extract and Deduplicate Entities ---
-            people = extract_people(doc, nlp)
-            companies = extract_companies(doc, company_metadata_lookup,company_index, filing_company_cik, use_fuzz_company_match = use_fuzz_company_match)
+            # the context sentences of the entities are looked up in the parsed filing, not parsed again
+            sentence_index = SentenceIndex(doc)
+            people = extract_people(doc, nlp, sentence_index = sentence_index)
+            companies = extract_companies(doc, company_metadata_lookup,company_index, filing_company_cik, use_fuzz_company_match = use_fuzz_company_match,
+                                          company_name_index = company_name_index)
             # --- Step 3: Find Relationships ---
-            company_company_relationships = find_relationships(companies, companies, nlp)
-            company_person_relationships = find_relationships(companies, people, nlp)
-
-            # This is slow... lets skip for now
-            # person_person_relationships = find_relationships(people, people, nlp)
+            # the aliases of all the entities are matched in one pass over the filing
+            entity_span_index = EntitySpanIndex(nlp, doc, [people, companies])
+            company_company_relationships = find_relationships(companies, companies, nlp, sentence_index, entity_span_index)
+            company_person_relationships = find_relationships(companies, people, nlp, sentence_index, entity_span_index)
+            person_person_relationships = find_relationships(people, people, nlp, sentence_index, entity_span_index) if extract_person_relationships else []
 
             # Combine relationships
-            # all_relationships = company_company_relationships + company_person_relationships + person_person_relationships
-            all_relationships = company_company_relationships + company_person_relationships
+            all_relationships = company_company_relationships + company_person_relationships + person_person_relationships
 
 
       
@@ -657,10 +948,29 @@ def extract_entities_and_relationships(logger, output_file_path ,files, company_
                     "companies": companies,
                     "relationships": all_relationships,
                 }
-            write_file_data_to_csv (dict_writer,gloveEmbeddingModel,fastTextEmbeddingModel,file_data,people,companies,all_relationships)
+            write_file_data_to_csv (corpus_writer,gloveEmbeddingModel,fastTextEmbeddingModel,file_data,people,companies,all_relationships)
+            pending_urls.append(url)
+
+            if len(pending_urls) >= CHECKPOINT_FILE_COUNT:
+                corpus_writer.close()
+                manifest.mark_processed(pending_urls)
+                pending_urls = []
+                corpus_writer = open_part_writer()
 
             file_tqdm.set_description("Processing Complete")
+
+        corpus_writer.close()
+        manifest.mark_processed(pending_urls)
+        part_paths = [part_path for part_path in part_paths if os.path.exists(part_path)]
+        logger.info(f"Merging {len(part_paths)} part files into '{output_file_path}'")
+        merge_part_files(output_file_path, part_paths, append = add_to_existing_data)
         return results
+    except BaseException:
+        # the files since the last checkpoint are not in the manifest, so a resumed run writes them again
+        corpus_writer.discard()
+        raise
+    finally:
+        manifest.close()
 
 
 def get_name_of_entity_dict(entity):
@@ -743,6 +1053,21 @@ def get_public_companies(logger):
     return company_index, company_metadata_lookup  # Return BOTH
 
 
+def get_company_name_index(logger, company_metadata_lookup):
+    """
+    Loads the company name index used for fuzzy company matching, building it from the public
+    companies metadata the first time, or when the metadata file has changed since it was built.
+
+    Args:
+        logger (logging.Logger): Logger for logging information and errors.
+        company_metadata_lookup (dict): The company metadata by CIK, see `get_public_companies`.
+
+    Returns:
+        CompanyNameIndex: The index.
+    """
+    return CompanyNameIndex.load(constants.EDGAR_PUBLIC_COMPANIES_INDEX, constants.EDGAR_PUBLIC_COMPANIES_LIST, company_metadata_lookup, logger)
+
+
 def print_entities_and_relationships(logger, results):
     """Prints entities and relationships."""
     for file, data in results.items():
@@ -774,18 +1099,73 @@ def print_entities_and_relationships(logger, results):
         print(f"\nRelationships: {len(data['relationships'])}")
 
 
+def load_spacy_pipeline(logger, model_name = SPACY_MODEL, profile = DEFAULT_SPACY_PROFILE):
+    """
+    Loads a spaCy model with the components of a pipeline profile, downloading the model if it is
+    not installed.
+
+    Args:
+        logger (logging.Logger): Logger for logging information and errors.
+        model_name (str, optional): The spaCy model. Defaults to SPACY_MODEL.
+        profile (str, optional): A key of SPACY_PROFILES. Defaults to DEFAULT_SPACY_PROFILE.
+
+    Returns:
+        spacy.language.Language: The pipeline.
+    """
+    if profile not in SPACY_PROFILES:
+        raise ValueError(f"Unknown spaCy profile '{profile}', use one of {list(SPACY_PROFILES.keys())}")
+    profile_settings = SPACY_PROFILES[profile]
+    if profile_settings["prefer_gpu"]:
+        spacy.prefer_gpu()
+
+    logger.info(f"Loading spaCy model '{model_name}' with the {profile} profile...")
+
+    try:
+        nlp = spacy.load(model_name, exclude=profile_settings["exclude"])
+        print(f"spaCy model '{model_name}' loaded successfully.")
+    except OSError:
+        print(f"spaCy model '{model_name}' not found. Downloading...")
+        try:
+            subprocess.check_call([sys.executable, "-m", "spacy", "download", model_name])
+            nlp = spacy.load(model_name, exclude=profile_settings["exclude"])
+            print(f"spaCy model '{model_name}' downloaded and loaded successfully.")
+        except subprocess.CalledProcessError as e:
+            print(f"Error downloading spaCy model: {e}")
+            sys.exit(1) #exit the program due to failure.
+
+    for component in profile_settings["enable"]:
+        if component in nlp.disabled:
+            nlp.enable_pipe(component)
+    logger.info(f"spaCy pipeline: {nlp.pipe_names}")
+    return nlp
+
+
 def run_edgar_graph_extraction() -> None:
     """
-    Extracts entities and relationships from EDGAR filings and saves them to a CSV file.
+    Extracts entities and relationships from EDGAR filings and saves them to a Parquet file.
 
     This function processes EDGAR filings, extracts people, companies, and their relationships,
-    and saves the extracted data to a CSV file. It uses spaCy for natural language processing,
+    and saves the extracted data to a Parquet file. It uses spaCy for natural language processing,
     fuzzy matching for entity deduplication, and custom logic for relationship extraction.
     """
 
     index_file = constants.DEFAULT_EDGAR_FOLDER_FILE_INDEX
     output_file = constants.DEFAULT_EDGAR_GRAPH_PATH
 
+    args_loader.AddArg("resume","rs","resume","Add to the existing graph file, skipping the files already in it. False regenerates it. (default{0})",True)
+    args_loader.AddArg("n_process","np","n_process","The number of processes spaCy parses the filings with. (default{0})",DEFAULT_NLP_PROCESSES)
+    args_loader.AddArg("nlp_batch_size","nbs","nlp_batch_size","The number of filings or filing sections sent to a spaCy process at a time. (default{0})",DEFAULT_NLP_BATCH_SIZE)
+    args_loader.AddArg("fuzzy_company_match","fcm","fuzzy_company_match","Fuzzy match the organisations that are not a company name or ticker, using the company name index. (default{0})",False)
+    args_loader.AddArg("person_relationships","ppr","person_relationships","Also extract the relationships between the people in each filing. (default{0})",True)
+    args_loader.AddArg("spacy_profile","sp","spacy_profile",f"The spaCy pipeline profile, one of {list(SPACY_PROFILES.keys())}. (default{{0}})",DEFAULT_SPACY_PROFILE)
+    args_loader.LoadArgs()
+    resume = str(args_loader.AdditionalArgs["resume"]["value"]).lower() in ("true","yes","1")
+    n_process = int(args_loader.AdditionalArgs["n_process"]["value"])
+    nlp_batch_size = int(args_loader.AdditionalArgs["nlp_batch_size"]["value"])
+    use_fuzz_company_match = str(args_loader.AdditionalArgs["fuzzy_company_match"]["value"]).lower() in ("true","yes","1")
+    extract_person_relationships = str(args_loader.AdditionalArgs["person_relationships"]["value"]).lower() in ("true","yes","1")
+    spacy_profile = str(args_loader.AdditionalArgs["spacy_profile"]["value"])
+
     logger = loggers.setup_logger("SurreaEdgarGraphExtractor")
     logger.info(f"Loading EDGAR file index data to data frame '{index_file}'")
 
@@ -799,31 +1179,18 @@ def run_edgar_graph_extraction() -> None:
 
 
     company_index, company_metadata_lookup = get_public_companies(logger)
+    company_name_index = get_company_name_index(logger, company_metadata_lookup) if use_fuzz_company_match else None
 
 
-
-    model_name = "en_core_web_lg"
-
-    logger.info(f"Loading spaCy model '{model_name}'...")
-
-    try:
-        nlp = spacy.load(model_name)
-        print(f"spaCy model '{model_name}' loaded successfully.")
-    except OSError:
-        print(f"spaCy model '{model_name}' not found. Downloading...")
-        try:
-            subprocess.check_call([sys.executable, "-m", "spacy", "download", model_name])
-            nlp = spacy.load(model_name)
-            print(f"spaCy model '{model_name}' downloaded and loaded successfully.")
-        except subprocess.CalledProcessError as e:
-            print(f"Error downloading spaCy model: {e}")
-            sys.exit(1) #exit the program due to failure.
+    nlp = load_spacy_pipeline(logger, SPACY_MODEL, spacy_profile)
 
 
 
     files = file_index_df.to_dict(orient='records')
 
-    extract_entities_and_relationships(logger,output_file,files, company_metadata_lookup,company_index,nlp, use_fuzz_company_match = False, return_results = False)
+    extract_entities_and_relationships(logger,output_file,files, company_metadata_lookup,company_index,nlp, use_fuzz_company_match = use_fuzz_company_match, return_results = False, resume = resume,
+                                       n_process = n_process, nlp_batch_size = nlp_batch_size, company_name_index = company_name_index,
+                                       extract_person_relationships = extract_person_relationships)
 
 if __name__ == "__main__":
     run_edgar_graph_extraction()
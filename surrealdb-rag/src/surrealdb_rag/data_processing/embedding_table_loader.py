@@ -0,0 +1,146 @@
+"""Stream a word embedding model into the embedding_model table over concurrent connections."""
+
+import time
+
+import tqdm
+from surrealdb import RecordID
+
+import surrealdb_rag.helpers.constants as constants
+from surrealdb_rag.data_processing.embeddings import WordEmbeddingModel
+from surrealdb_rag.helpers.adaptive_batcher import AdaptiveBatcher, estimate_payload_bytes
+from surrealdb_rag.helpers.params import SurrealParams
+from surrealdb_rag.helpers.run_manifest import RunManifest
+from surrealdb_rag.helpers.surreal_batch_loader import SurrealBatchLoader, DEFAULT_CONCURRENCY
+
+
+"""
+SurrealQL query to insert a batch of word embeddings with a native array INSERT.
+
+Args:
+    $records (list): The embedding_model records, see `embedding_records`.
+"""
+BULK_INSERT_EMBEDDINGS = """
+    INSERT INTO embedding_model $records RETURN NONE;
+"""
+
+"""
+SurrealQL query to insert or update a batch of word embeddings, used when resuming a load so the
+words of a batch that was written but not recorded in the run manifest are overwritten.
+
+Args:
+    $records (list): The embedding_model records, see `embedding_records`.
+"""
+BULK_UPSERT_EMBEDDINGS = """
+    INSERT INTO embedding_model $records ON DUPLICATE KEY UPDATE embedding = $input.embedding RETURN NONE;
+"""
+
+READ_CHUNK_SIZE = 1000
+"""
+The number of words whose vectors are read from the model matrix at a time.
+"""
+
+
+def embedding_records(model:RecordID, words:list[str], vectors) -> list[dict]:
+    """
+    Builds the embedding_model records of some words, keyed by [model, word] like the FOR loop insert.
+
+    Args:
+        model (RecordID): The embedding_model_definition record.
+        words (list[str]): The words.
+        vectors: The (len(words), vector size) matrix of their vectors.
+
+    Returns:
+        list[dict]: The records.
+    """
+    return [
+        {
+            "id": RecordID("embedding_model", [model, word]),
+            "word": word,
+            "model": model,
+            "embedding": vector,
+        }
+        for word, vector in zip(words, vectors.tolist())
+    ]
+
+
+def embedding_rows(embedding_model:WordEmbeddingModel, model:RecordID, manifest:RunManifest = None, on_skipped = None):
+    """
+    Streams the words of a model as records, reading the vectors a chunk at a time so only the
+    chunk is copied out of the (memory-mapped) matrix. Words are stored unescaped.
+
+    Args:
+        embedding_model (WordEmbeddingModel): The model.
+        model (RecordID): The embedding_model_definition record.
+        manifest (RunManifest, optional): The words it holds as written are skipped. Defaults to None.
+        on_skipped (callable, optional): Called with the number of words skipped in each chunk.
+
+    Yields:
+        tuple: The row index of the word and its record.
+    """
+    items = list(embedding_model.dictionary.items())
+    for start in range(0, len(items), READ_CHUNK_SIZE):
+        chunk = [(row_index, word, row) for row_index, (word, row) in enumerate(items[start:start + READ_CHUNK_SIZE], start)
+                 if not (manifest and manifest.is_row_done(row_index))]
+        skipped = min(READ_CHUNK_SIZE, len(items) - start) - len(chunk)
+        if skipped and on_skipped:
+            on_skipped(skipped)
+        if not chunk:
+            continue
+        words = [WordEmbeddingModel.unescape_token_text_for_txt_file(str(word)) for _, word, _ in chunk]
+        records = embedding_records(model, words, embedding_model.vectors[[row for _, _, row in chunk]])
+        for (row_index, _, _), record in zip(chunk, records):
+            yield row_index, record
+
+
+async def load_embedding_table(logger, embedding_model:WordEmbeddingModel, model_trainer:str, model_version:str,
+                               connection_params:SurrealParams, concurrency:int = DEFAULT_CONCURRENCY,
+                               batcher:AdaptiveBatcher = None, manifest:RunManifest = None, upsert:bool = False) -> int:
+    """
+    Inserts the words of a model into the embedding_model table.
+
+    The words are streamed from the model in batches sized by the batcher and written with native
+    array INSERTs by `concurrency` connections at once. Batches that still fail after retrying are
+    written to the dead letter file. The rate is shown in words/sec on the progress bar and logged
+    at the end.
+
+    Args:
+        logger (logging.Logger): Logger instance.
+        embedding_model (WordEmbeddingModel): The model.
+        model_trainer (str): Name of the training algorithm (e.g., 'GLOVE', 'FASTTEXT').
+        model_version (str): Version of the model (e.g., '300d', 'custom wiki').
+        connection_params (SurrealParams): The SurrealDB connection parameters.
+        concurrency (int, optional): The number of batches written at once. Defaults to DEFAULT_CONCURRENCY.
+        batcher (AdaptiveBatcher, optional): Sizes the batches. Defaults to an AdaptiveBatcher with the default targets.
+        manifest (RunManifest, optional): Records the written words and holds the words of the run being resumed. Defaults to None.
+        upsert (bool, optional): Overwrite words that already exist instead of failing. Defaults to False.
+
+    Returns:
+        int: The number of words sent in this run, including any in dead lettered batches.
+    """
+    model = RecordID("embedding_model_definition", [model_trainer, model_version])
+    insert_surql = BULK_UPSERT_EMBEDDINGS if upsert else BULK_INSERT_EMBEDDINGS
+    batcher = batcher or AdaptiveBatcher(logger=logger, name="embedding_model")
+    dead_letter_file = f"{constants.DEAD_LETTER_FOLDER}embedding_model.jsonl"
+    words_written = 0
+
+    def count_written(row_count:int) -> None:
+        nonlocal words_written
+        words_written += row_count
+        pbar.update(row_count)
+
+    start = time.perf_counter()
+    with tqdm.tqdm(total=len(embedding_model.dictionary), desc="Inserting", unit="words") as pbar:
+        async with SurrealBatchLoader(connection_params, concurrency, on_batch_written=count_written,
+                                      dead_letter_file=dead_letter_file, logger=logger, batcher=batcher) as loader:
+            rows = embedding_rows(embedding_model, model, manifest, pbar.update)
+            for batch, batch_bytes in batcher.batches(rows, lambda item: estimate_payload_bytes(item[1])):
+                row_indexes = [row_index for row_index, _ in batch]
+                await loader.submit(insert_surql, {"records": [record for _, record in batch]}, len(batch), batch_bytes,
+                                    (lambda row_indexes=row_indexes: manifest.mark_rows_done(row_indexes)) if manifest else None)
+    seconds = time.perf_counter() - start
+
+    batcher.log_summary()
+    logger.info(f"Inserted {words_written} words of {model_trainer} {model_version} in {seconds:.1f}s ({words_written / max(seconds, 1e-9):.0f} words/sec)")
+    if loader.failed_batches:
+        logger.error(f"{loader.failed_batches} batches failed and were written to {dead_letter_file}")
+    return words_written
@@ -1,10 +1,33 @@
+import collections
+import concurrent.futures
+import itertools
 import numpy as np
+import os
 import re
 
 PUNCTUATION_TO_SEPARATE = [
                 ".", ",", "?", "!", ";", ":", "(", ")", "[", "]", "{", "}", "\"", "'", "`", "/", "\\", "<", ">", "—", "–"
             ]
 
+PUNCTUATION_REGEX = re.compile(r"([{}])".format(re.escape("".join(PUNCTUATION_TO_SEPARATE))))
+"""
+Compiled once: matches any of the characters in PUNCTUATION_TO_SEPARATE.
+"""
+
+SENTENCE_BATCH_TOKENS = 65536
+"""
+The maximum number of word vectors `sentences_to_matrix` gathers at once (about 75MB for 300d vectors).
+"""
+
+BINARY_VOCAB_SUFFIX = ".vocab.txt"
+"""
+Suffix appended to a text embedding file path for its binary cache vocab file.
+"""
+BINARY_MATRIX_SUFFIX = ".npy"
+"""
+Suffix appended to a text embedding file path for its binary cache vector matrix.
+"""
+
 class WordEmbeddingModel:
     """
     A class for loading and utilizing word embedding models.
@@ -59,32 +82,179 @@ class WordEmbeddingModel:
 
 
 
-    def __init__(self,model_path,unescape_words:False):
+    @staticmethod
+    def binary_cache_paths(model_path:str) -> tuple[str,str]:
+        """
+        Returns the paths of the binary cache files for a text embedding file.
+
+        The cache is a vocab file with one word per line (in the same escaped form as the
+        text file) and a contiguous float32 `.npy` matrix whose rows line up with the vocab.
+
+        Args:
+            model_path (str): The path to the text embedding file.
+
+        Returns:
+            tuple[str,str]: The vocab file path and the matrix file path.
+        """
+        return model_path + BINARY_VOCAB_SUFFIX, model_path + BINARY_MATRIX_SUFFIX
+
+
+    @staticmethod
+    def binary_cache_is_current(model_path:str) -> bool:
+        """
+        Checks if a binary cache exists for the model and is not older than the text file.
+
+        Args:
+            model_path (str): The path to the text embedding file.
+
+        Returns:
+            bool: True if the cache can be used instead of parsing the text file.
+        """
+        vocab_path, matrix_path = WordEmbeddingModel.binary_cache_paths(model_path)
+        if not (os.path.exists(vocab_path) and os.path.exists(matrix_path)):
+            return False
+        if not os.path.exists(model_path):
+            # the text file was removed after conversion, the cache is all we have
+            return True
+        text_mtime = os.path.getmtime(model_path)
+        return os.path.getmtime(vocab_path) >= text_mtime and os.path.getmtime(matrix_path) >= text_mtime
+
+
+    def __init__(self,model_path,unescape_words:False,use_binary_cache:bool = True):
 
         """
-        Initializes the WordEmbeddingModel by loading word vectors from a file.
+        Initializes the WordEmbeddingModel from its binary cache or, the first time, from the text file.
+
+        `dictionary` maps each word to its row index in `vectors`, a (vocab size, vector size)
+        float32 matrix. When the binary cache is used the matrix is memory-mapped read only, so
+        start up is near instant and the pages are shared by every process using the model.
+        If the cache is missing or older than the text file it is rebuilt after parsing the text.
 
         Args:
             model_path (str): The path to the word embedding file.
             unescape_words (bool): Whether to unescape words read from the file.
+            use_binary_cache (bool): Whether to read and write the binary cache. Defaults to True.
         """
 
 
         self.dictionary = {}
+        self.vectors = None
         self.vector_size = 0
         self.model_path = model_path
 
+        if use_binary_cache and WordEmbeddingModel.binary_cache_is_current(self.model_path):
+            self.load_binary_cache(unescape_words)
+        else:
+            words = self.load_text_file(unescape_words)
+            if use_binary_cache:
+                self.save_binary_cache(words)
+
+
+    def load_text_file(self,unescape_words:bool) -> list[str]:
+        """
+        Parses the text embedding file into the vocab dictionary and vector matrix.
+
+        Each line holds a word followed by its vector values separated by spaces.
+        Lines whose vector size differs from the first line are skipped.
+
+        Args:
+            unescape_words (bool): Whether to unescape words read from the file.
+
+        Returns:
+            list[str]: The words as written in the file (escaped), in row order.
+        """
+        raw_words = []
+        vectors = []
         with open(self.model_path, 'r', encoding='utf-8') as f:
             for line in f:
                 values = line.split()
-                if unescape_words:
-                    word = WordEmbeddingModel.unescape_token_text_for_txt_file(values[0])
-                else:
-                    word = values[0]
+                if not values:
+                    continue
                 vector = np.asarray(values[1:], "float32")
-                self.dictionary[word] = vector
                 if self.vector_size==0:
                     self.vector_size = len(vector)
+                if len(vector) != self.vector_size:
+                    continue
+                raw_words.append(values[0])
+                vectors.append(vector)
+
+        if vectors:
+            self.vectors = np.vstack(vectors)
+        else:
+            self.vectors = np.zeros((0, self.vector_size), dtype=np.float32)
+        self.set_dictionary(raw_words, unescape_words)
+        return raw_words
+
+
+    def save_binary_cache(self,raw_words:list[str]) -> None:
+        """
+        Writes the vocab file and `.npy` matrix for this model.
+
+        Files are written to a temporary name and then moved into place so a process
+        reading the cache never sees a partially written file.
+
+        Args:
+            raw_words (list[str]): The words as written in the text file, in row order.
+        """
+        vocab_path, matrix_path = WordEmbeddingModel.binary_cache_paths(self.model_path)
+        tmp_suffix = f".{os.getpid()}.tmp"
+
+        with open(vocab_path + tmp_suffix, 'w', encoding='utf-8') as f:
+            for word in raw_words:
+                f.write(word + "\n")
+        with open(matrix_path + tmp_suffix, 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+
+        os.replace(matrix_path + tmp_suffix, matrix_path)
+        os.replace(vocab_path + tmp_suffix, vocab_path)
+
+
+    def load_binary_cache(self,unescape_words:bool) -> None:
+        """
+        Loads the vocab file and memory-maps the vector matrix.
+
+        Args:
+            unescape_words (bool): Whether to unescape words read from the vocab file.
+        """
+        vocab_path, matrix_path = WordEmbeddingModel.binary_cache_paths(self.model_path)
+        with open(vocab_path, 'r', encoding='utf-8') as f:
+            raw_words = f.read().split("\n")[:-1]
+
+        self.vectors = np.load(matrix_path, mmap_mode="r")
+        if len(raw_words) != self.vectors.shape[0]:
+            raise ValueError(f"Corrupt embedding cache for {self.model_path}: {len(raw_words)} words but {self.vectors.shape[0]} vectors. Delete {vocab_path} and {matrix_path} to rebuild it.")
+        self.vector_size = self.vectors.shape[1]
+        self.set_dictionary(raw_words, unescape_words)
+
+
+    def set_dictionary(self,raw_words:list[str],unescape_words:bool) -> None:
+        """
+        Builds the word to row index dictionary.
+
+        Args:
+            raw_words (list[str]): The words in row order.
+            unescape_words (bool): Whether to unescape the words.
+        """
+        if unescape_words:
+            raw_words = [WordEmbeddingModel.unescape_token_text_for_txt_file(word) for word in raw_words]
+        # later duplicates win, the same as when the dictionary held the vectors
+        self.dictionary = {word: row for row, word in enumerate(raw_words)}
+
+
+    def get_vector(self,word:str) -> np.ndarray:
+        """
+        Returns the vector for a word.
+
+        Args:
+            word (str): The word to look up.
+
+        Returns:
+            np.ndarray: The word vector, or None if the word is not in the vocabulary.
+        """
+        row = self.dictionary.get(word)
+        if row is None:
+            return None
+        return self.vectors[row]
 
 
     def separate_punctuation(sentence):
@@ -99,14 +269,87 @@ class WordEmbeddingModel:
         Returns:
             str: The sentence with separated punctuation.
         """
-        punctuation_regex = re.compile(r"([{}])".format(re.escape("".join(PUNCTUATION_TO_SEPARATE))))
-        return punctuation_regex.sub(r" \1", sentence)
+        return PUNCTUATION_REGEX.sub(r" \1", sentence)
+
+
+    def sentence_to_ids(self,sentence:str) -> list[int]:
+        """
+        Tokenizes a sentence and maps its words to row indexes in `vectors`.
+
+        Words missing from the vocabulary are dropped.
+
+        Args:
+            sentence (str): The input sentence.
+
+        Returns:
+            list[int]: The row indexes of the known words, in order.
+        """
+        words = WordEmbeddingModel.separate_punctuation(sentence).lower().split()
+        lookup = self.dictionary.get
+        return [row for row in map(lookup, words) if row is not None]
+
+
+    def sentences_to_matrix(self,sentences:list[str]) -> np.ndarray:
+        """
+        Generates sentence embeddings for a batch of sentences in one vectorized pass.
+
+        Every sentence is tokenized once into vocab row indexes. The ids of all sentences are
+        flattened, their vectors gathered and summed per sentence with `np.add.reduceat`, then
+        divided by the word counts. Sentences without any known word get a zero vector.
+        Large batches are processed in slices of at most `SENTENCE_BATCH_TOKENS` words to
+        bound the memory used by the gathered vectors.
+
+        Args:
+            sentences (list[str]): The input sentences.
+
+        Returns:
+            np.ndarray: A float32 array of shape (len(sentences), vector_size).
+        """
+        matrix = np.zeros((len(sentences), self.vector_size), dtype=np.float32)
+        if len(sentences) == 0:
+            return matrix
+
+        id_lists = [self.sentence_to_ids(sentence) for sentence in sentences]
+        counts = np.fromiter((len(ids) for ids in id_lists), dtype=np.int64, count=len(id_lists))
+        token_totals = np.cumsum(counts)
+
+        start = 0
+        while start < len(sentences):
+            # take as many sentences as fit in the token budget, but always at least one
+            budget = (token_totals[start - 1] if start > 0 else 0) + SENTENCE_BATCH_TOKENS
+            end = max(start + 1, int(np.searchsorted(token_totals, budget, side="right")))
+            self.mean_vectors_into(matrix[start:end], id_lists[start:end], counts[start:end])
+            start = end
+
+        return matrix
+
+
+    def mean_vectors_into(self,out:np.ndarray,id_lists:list[list[int]],counts:np.ndarray) -> None:
+        """
+        Writes the mean word vector of each id list into the matching row of `out`.
+
+        Args:
+            out (np.ndarray): The output rows, one per id list. Rows for empty id lists are left untouched.
+            id_lists (list[list[int]]): The vocab row indexes of each sentence.
+            counts (np.ndarray): The length of each id list.
+        """
+        non_empty = np.flatnonzero(counts)
+        if len(non_empty) == 0:
+            return
+        non_empty_counts = counts[non_empty]
+        flat_ids = np.fromiter(itertools.chain.from_iterable(id_lists), dtype=np.int64, count=int(non_empty_counts.sum()))
+        offsets = np.zeros(len(non_empty), dtype=np.int64)
+        np.cumsum(non_empty_counts[:-1], out=offsets[1:])
+        sums = np.add.reduceat(self.vectors[flat_ids], offsets, axis=0, dtype=np.float64)
+        out[non_empty] = sums / non_empty_counts[:, None]
 
     
     def sentence_to_vec(self,sentence):
         """
         Generates a sentence embedding by averaging the word vectors of its constituent words.
 
+        For many sentences use `sentences_to_matrix`, which embeds them in one pass.
+
         Args:
             sentence (str): The input sentence.
 
@@ -114,11 +357,68 @@ class WordEmbeddingModel:
             list: A list representing the sentence embedding.
         """
 
-        words = WordEmbeddingModel.separate_punctuation(sentence).lower().split()
-        
-        vectors = [self.dictionary[w] for w in words if w in self.dictionary]
+        return self.sentences_to_matrix([sentence])[0].tolist()
 
-        if vectors:
-            return np.mean(vectors, axis=0).tolist()
-        else:
-            return np.zeros(self.vector_size).tolist()
+
+WORKER_EMBEDDING_MODELS = {}
+"""
+The embedding models opened in a worker process by `init_embedding_worker`, keyed by name.
+"""
+
+
+def init_embedding_worker(model_specs:dict) -> None:
+    """
+    Process pool initializer that opens the embedding models in a worker process.
+
+    The models are opened from their binary caches, so every worker memory-maps the same
+    `.npy` files and the vectors are shared through the OS page cache instead of copied.
+    Call `WordEmbeddingModel` once in the parent process first so the caches exist.
+
+    Args:
+        model_specs (dict): Maps a model name to a (model_path, unescape_words) tuple.
+    """
+    for name, (model_path, unescape_words) in model_specs.items():
+        WORKER_EMBEDDING_MODELS[name] = WordEmbeddingModel(model_path, unescape_words)
+
+
+def map_with_embedding_workers(func, items, model_specs:dict, workers:int, max_pending:int = None):
+    """
+    Applies `func` to each item in a pool of processes that share the embedding models.
+
+    `func` must be a module level function; it reads the models from `WORKER_EMBEDDING_MODELS`.
+    Results are yielded in the order of `items` whatever order the workers finish in.
+    Items are read from `items` and submitted only as results are yielded, so at most `max_pending`
+    items and results are held at once however many items there are.
+    With one worker or less everything runs in the current process.
+
+    Args:
+        func (callable): The function to apply to each item.
+        items (iterable): The items to process.
+        model_specs (dict): Maps a model name to a (model_path, unescape_words) tuple.
+        workers (int): The number of worker processes.
+        max_pending (int, optional): The most items submitted and not yet yielded. Defaults to twice the workers.
+
+    Yields:
+        The result of `func` for each item, in order.
+    """
+    if workers <= 1:
+        init_embedding_worker(model_specs)
+        for item in items:
+            yield func(item)
+    else:
+        max_pending = max_pending or 2 * workers
+        items = iter(items)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                    initializer=init_embedding_worker,
+                                                    initargs=(model_specs,)) as executor:
+            pending = collections.deque(executor.submit(func, item) for item in itertools.islice(items, max_pending))
+            try:
+                while pending:
+                    result = pending.popleft().result()
+                    for item in itertools.islice(items, 1):
+                        pending.append(executor.submit(func, item))
+                    yield result
+            finally:
+                # like executor.map, a failure or an early close doesn't wait for the queued items
+                for future in pending:
+                    future.cancel()
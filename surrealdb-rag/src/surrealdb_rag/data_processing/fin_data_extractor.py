@@ -1,6 +1,87 @@
-from bs4 import BeautifulSoup, NavigableString
+"""Extract the text of EDGAR HTML filings, section by section, with their tables as sentences."""
+
+from bisect import bisect_right
+
+from bs4 import BeautifulSoup, NavigableString, Tag
 import re
 
+
+TEN_K_SECTIONS = [
+    r"item 1\. business", r"item 1a\. risk factors", r"item 1b\. unresolved staff comments",
+    r"item 2\. properties", r"item 3\. legal proceedings",
+    r"item 4\. mine safety disclosures",
+    r"item 5\. market for registrant’s common equity, related stockholder matters and issuer purchases of equity securities",
+    r"item 6\. \[reserved\]",
+    r"item 7\. management’s discussion and analysis of financial condition and results of operations",
+    r"item 7a\. quantitative and qualitative disclosures about market risk",
+    r"item 8\. financial statements and supplementary data",
+    r"item 9\. changes in and disagreements with accountants on accounting and financial disclosure",
+    r"item 9a\. controls and procedures",
+    r"item 9b\. other information",
+    r"item 9b\. disclosure regarding foreign jurisdictions that prevent inspections",
+    r"item 10\. directors, executive officers and corporate governance",
+    r"item 11\. executive compensation",
+    r"item 12\. security ownership of certain beneficial owners and management and related stockholder matters",
+    r"item 13\. certain relationships and related transactions, and director independence",
+    r"item 14\. principal accountant fees and services",
+    "part i",
+    "part ii",
+    "part iii",
+    "part iv", ]
+"""
+The section headings of 10-K and 10-Q filings, in order. Each section ends at the next heading.
+A section starts at the first text beginning with its heading taken literally (see `HtmlSectionIndex`)
+and ends at the next heading taken as a regular expression.
+"""
+
+SCHEDULE_13_ITEMS = [
+    r"item 1\. security and issuer",
+    r"item 2\. identity and background",
+    r"item 3\. source and amount of funds or other consideration",
+    r"item 4\. purpose of transaction",
+    r"item 5\. interest in securities of the issuer",
+    r"item 6\. contracts, arrangements, understandings or relationships with respect to securities of the issuer",
+    r"item 7\. material to be filed as exhibits",
+    "signature"
+]
+"""
+The items of SC 13D and SC 13G filings, in order.
+"""
+
+REGISTRATION_HEADINGS = [
+    "summary",
+    "risk factors",
+    "use of proceeds",
+    "dividend policy",
+    "capitalization",
+    "dilution",
+    "selected financial data",
+    "management’s discussion and analysis",
+    "business",
+    "management",
+    "certain relationships and related transactions",
+    "principal stockholders",
+    "description of securities",
+    "underwriting",
+    "legal matters",
+    "experts",
+    "where you can find more information",
+    "incorporation of certain information by reference",
+]
+"""
+The common headings of S-1 and S-4 filings, in order.
+"""
+
+FORM_SECTIONS = {
+    "10-K": TEN_K_SECTIONS, "10-Q": TEN_K_SECTIONS,
+    "SC 13D": SCHEDULE_13_ITEMS, "SC 13G": SCHEDULE_13_ITEMS,
+    "S-1": REGISTRATION_HEADINGS, "S-4": REGISTRATION_HEADINGS,
+}
+"""
+The section headings extracted from each form type. Other forms only have their paragraphs extracted.
+"""
+
+
 def extract_text_from_edgar_html(html_content, form_type):
     """
     Extracts text from Edgar HTML filings, focusing on relevant sections and improving table handling.
@@ -8,6 +89,7 @@ def extract_text_from_edgar_html(html_content, form_type):
     This function parses HTML content from EDGAR filings, removes irrelevant tags (scripts, styles, etc.),
     and extracts text from key sections based on the filing's form type (10-K, 10-Q, SC 13D, etc.).
     It includes enhanced logic to process HTML tables into natural language sentences.
+    The sections are found and cut with an `HtmlSectionIndex`, built in one walk of the document.
 
     Args:
         html_content (str): The HTML content of the EDGAR filing.
@@ -22,86 +104,14 @@ def extract_text_from_edgar_html(html_content, form_type):
         tag.decompose()
 
     relevant_text = []
-    if form_type.upper() in ("10-K", "10-Q"):
-        sections_to_find = [  # ... (Same list as before) ...
-            "item 1\. business", "item 1a\. risk factors", "item 1b\. unresolved staff comments",
-            "item 2\. properties", "item 3\. legal proceedings",
-            "item 4\. mine safety disclosures",
-            "item 5\. market for registrant’s common equity, related stockholder matters and issuer purchases of equity securities",
-            "item 6\. \[reserved\]",
-            "item 7\. management’s discussion and analysis of financial condition and results of operations",
-            "item 7a\. quantitative and qualitative disclosures about market risk",
-            "item 8\. financial statements and supplementary data",
-            "item 9\. changes in and disagreements with accountants on accounting and financial disclosure",
-            "item 9a\. controls and procedures",
-            "item 9b\. other information",
-            "item 9b\. disclosure regarding foreign jurisdictions that prevent inspections",
-            "item 10\. directors, executive officers and corporate governance",
-            "item 11\. executive compensation",
-            "item 12\. security ownership of certain beneficial owners and management and related stockholder matters",
-            "item 13\. certain relationships and related transactions, and director independence",
-            "item 14\. principal accountant fees and services",
-            "part i",
-            "part ii",
-            "part iii",
-            "part iv", ]
-
-        for i in range(len(sections_to_find)):
-          start_section = sections_to_find[i]
-          start_tag = find_section(soup, start_section)
-
-          if start_tag:
-            end_tag_text = sections_to_find[i + 1] if i + 1 < len(sections_to_find) else None
-            section_text = extract_text_between(start_tag, end_tag_text)  # Use updated extract_text_between
-            relevant_text.append(section_text)
-
-    elif form_type.upper() in ("SC 13D", "SC 13G"):
-        items_to_find = [
-            "item 1\. security and issuer",
-            "item 2\. identity and background",
-            "item 3\. source and amount of funds or other consideration",
-            "item 4\. purpose of transaction",
-            "item 5\. interest in securities of the issuer",
-            "item 6\. contracts, arrangements, understandings or relationships with respect to securities of the issuer",
-            "item 7\. material to be filed as exhibits",
-            "signature"
-        ]
-        for i in range(len(items_to_find)):
-          start_item = items_to_find[i]
-          start_tag = find_section(soup, start_item)
-          if start_tag:
-            end_tag_text = items_to_find[i+1] if i + 1 < len(items_to_find) else None
-            item_text = extract_text_between(start_tag, end_tag_text)
-            relevant_text.append(item_text)
-
-    elif form_type.upper() in ("S-1", "S-4"):
-        common_headings = [
-            "summary",
-            "risk factors",
-            "use of proceeds",
-            "dividend policy",
-            "capitalization",
-            "dilution",
-            "selected financial data",
-            "management’s discussion and analysis",
-            "business",
-            "management",
-            "certain relationships and related transactions",
-            "principal stockholders",
-            "description of securities",
-            "underwriting",
-            "legal matters",
-            "experts",
-            "where you can find more information",
-            "incorporation of certain information by reference",
-        ]
-        for heading in common_headings:
-          start_tag = find_section(soup, heading)
-          if start_tag:
-            next_heading_index = common_headings.index(heading) + 1
-            end_tag_text = common_headings[next_heading_index] if next_heading_index < len(common_headings) else None
-            section_text = extract_text_between(start_tag, end_tag_text)
-            relevant_text.append(section_text)
+    headings = FORM_SECTIONS.get(form_type.upper())
+    if headings:
+        section_index = HtmlSectionIndex(soup, headings)
+        for i in range(len(headings)):
+          start_position = section_index.find_section(headings[i])
+          if start_position is not None:
+            end_heading = headings[i + 1] if i + 1 < len(headings) else None
+            relevant_text.append(section_index.extract_text_between(start_position, end_heading))
 
     all_paragraphs = []
     for p_tag in soup.find_all('p'):
@@ -119,66 +129,123 @@ def extract_text_from_edgar_html(html_content, form_type):
     return combined_text
 
 
-def find_section(soup_obj, section_start):
+class HtmlSectionIndex():
     """
-    Finds the starting tag of a section within the BeautifulSoup object.
+    The elements of a parsed filing in document order, indexed in one walk of the document so the
+    sections of a form are found and cut without searching the tree again for each heading.
 
-    This function searches for a tag that contains the section start text, considering various tag types
-    (string, <b>, <span>, <p>) and case-insensitivity.
+    A section starts at the first string (text node) that begins with its heading, taken literally
+    and case-insensitively, or failing that the first bold <span> whose text does. It runs to the
+    first tag after the start containing a string in which the next heading, taken as a regular
+    expression, is found. The tables between are converted to sentences.
 
-    Args:
-        soup_obj (BeautifulSoup): The BeautifulSoup object representing the HTML.
-        section_start (str): The text that marks the beginning of the section.
+    All headings are first tested with one combined regular expression, so each string of the
+    document is matched once and only the few that pass are tested against each heading.
 
-    Returns:
-        bs4.element.Tag or None: The starting tag of the section, or None if not found.
+    Usage:
+        section_index = HtmlSectionIndex(soup, TEN_K_SECTIONS)
+        start_position = section_index.find_section(TEN_K_SECTIONS[0])
+        text = section_index.extract_text_between(start_position, TEN_K_SECTIONS[1])
     """
-    section_start_lower = section_start.lower()
-    start_tag = soup_obj.find(string=re.compile(r'^\s*' + re.escape(section_start_lower), re.IGNORECASE))
-    if start_tag:
-        return start_tag
-    start_tag = soup_obj.find('b', string=re.compile(r'^\s*' + re.escape(section_start_lower), re.IGNORECASE))
-    if start_tag:
-        return start_tag
-    for span in soup_obj.find_all('span'):
-        if span.get('style') and 'font-weight' in span.get('style').lower() and 'bold' in span.get('style').lower():
-            if re.search(r'^\s*' + re.escape(section_start_lower), span.get_text(), re.IGNORECASE):
-                return span
-    start_tag = soup_obj.find('p', string=re.compile(r'^\s*' + re.escape(section_start_lower), re.IGNORECASE))
-    if start_tag:
-        return start_tag
-    return None
-
-def extract_text_between(start_tag, end_tag_text=None):
-    """
-    Extracts text from the HTML between a starting tag and an optional ending tag/text.
-
-    This function iterates through the tags following the start tag, extracting text and handling tables.
-    It stops when it encounters the end_tag_text (if provided) or reaches the end of the document.
-
-    Args:
-        start_tag (bs4.element.Tag): The tag where the extraction should begin.
-        end_tag_text (str, optional): The text that indicates the end of the extraction. Defaults to None.
 
-    Returns:
-        str: The extracted text.
-    """
-    if not start_tag:
-        return ""
-
-    extracted_text = []
-    current_tag = start_tag.find_next()
-
-    while current_tag and (end_tag_text is None or not current_tag.find(string=re.compile(end_tag_text, re.IGNORECASE))):
-        if isinstance(current_tag, NavigableString):
-            extracted_text.append(current_tag.strip())
-        elif current_tag.name == 'table':
-            # Improved Table Handling
-            table_sentences = process_table_to_sentences(current_tag)
-            extracted_text.extend(table_sentences)
-        current_tag = current_tag.find_next()
-
-    return " ".join(extracted_text)
+    def __init__(self, soup, headings):
+        """
+        Args:
+            soup (BeautifulSoup): The parsed filing.
+            headings (list[str]): The headings that will be looked for.
+        """
+        start_any = re.compile(r'^\s*(?:' + "|".join(re.escape(heading.lower()) for heading in headings) + ')', re.IGNORECASE)
+        end_any = re.compile("|".join(f"(?:{heading})" for heading in headings), re.IGNORECASE)
+
+        self.tag_positions = []
+        self.tags = []
+        self.tag_ends = []
+        self.start_strings = []  # (position, string) of the strings that may begin with a heading
+        self.end_strings = []  # (position, string) of the strings that may contain a heading
+        self.bold_spans = []  # (position, span)
+        self.table_sentences = {}
+        self.end_positions = {}
+
+        # the last position inside each open tag is known once the walk leaves it
+        open_tags = []
+        position = -1
+        for position, element in enumerate(soup.descendants):
+            while open_tags and self.tags[open_tags[-1]] is not element.parent:
+                self.tag_ends[open_tags.pop()] = position - 1
+            if isinstance(element, Tag):
+                open_tags.append(len(self.tags))
+                self.tag_positions.append(position)
+                self.tags.append(element)
+                self.tag_ends.append(position)
+                if element.name == 'span':
+                    style = element.get('style')
+                    if style and 'font-weight' in style.lower() and 'bold' in style.lower():
+                        self.bold_spans.append((position, element))
+            elif isinstance(element, NavigableString):
+                if start_any.search(element):
+                    self.start_strings.append((position, element))
+                if end_any.search(element):
+                    self.end_strings.append((position, element))
+        for tag_index in open_tags:
+            self.tag_ends[tag_index] = position
+
+    def find_section(self, section_start):
+        """
+        Finds where a section starts.
+
+        Args:
+            section_start (str): The section heading.
+
+        Returns:
+            int: The document position of the string or bold span the section starts at, or None if not found.
+        """
+        start_pattern = re.compile(r'^\s*' + re.escape(section_start.lower()), re.IGNORECASE)
+        for position, string in self.start_strings:
+            if start_pattern.search(string):
+                return position
+        for position, span in self.bold_spans:
+            if start_pattern.search(span.get_text()):
+                return position
+        return None
+
+    def heading_positions(self, end_tag_text):
+        """
+        Args:
+            end_tag_text (str): A heading, as a regular expression.
+
+        Returns:
+            list[int]: The sorted document positions of the strings it is found in.
+        """
+        if end_tag_text not in self.end_positions:
+            end_pattern = re.compile(end_tag_text, re.IGNORECASE)
+            self.end_positions[end_tag_text] = [position for position, string in self.end_strings if end_pattern.search(string)]
+        return self.end_positions[end_tag_text]
+
+    def extract_text_between(self, start_position, end_tag_text=None):
+        """
+        Extracts the text of the tables from a section start to the first tag containing the next
+        heading, or the end of the document.
+
+        Args:
+            start_position (int): Where the section starts, see `find_section`.
+            end_tag_text (str, optional): The next heading, as a regular expression. Defaults to None.
+
+        Returns:
+            str: The extracted text.
+        """
+        end_positions = self.heading_positions(end_tag_text) if end_tag_text is not None else []
+        extracted_text = []
+        for tag_index in range(bisect_right(self.tag_positions, start_position), len(self.tags)):
+            # stop at the first tag with a heading string inside it
+            next_end = bisect_right(end_positions, self.tag_positions[tag_index])
+            if next_end < len(end_positions) and end_positions[next_end] <= self.tag_ends[tag_index]:
+                break
+            if self.tags[tag_index].name == 'table':
+                if tag_index not in self.table_sentences:
+                    self.table_sentences[tag_index] = process_table_to_sentences(self.tags[tag_index])
+                extracted_text.extend(self.table_sentences[tag_index])
+
+        return " ".join(extracted_text)
 
 def process_table_to_sentences(table_tag):
     """
@@ -1,8 +1,7 @@
 """Insert Edgar data into SurrealDB."""
 
-import ast
+import asyncio
 
-import pandas as pd
 from surrealdb import Surreal
 import tqdm
 
@@ -15,7 +14,11 @@ from surrealdb_rag.helpers.llm_handler import EMBED_MODEL_DEFINITIONS
 
 from surrealdb_rag.helpers.constants import ArgsLoader
 from surrealdb_rag.helpers.params import DatabaseParams, ModelParams, SurrealParams
-from surrealdb_rag.helpers.surreal_dml import SurrealDML
+from surrealdb_rag.helpers.surreal_dml import SurrealDML, bulk_corpus_records
+from surrealdb_rag.helpers.corpus_file_handler import iter_corpus_file, count_corpus_file_rows
+from surrealdb_rag.helpers.surreal_batch_loader import SurrealBatchLoader, DEFAULT_CONCURRENCY
+from surrealdb_rag.helpers.adaptive_batcher import AdaptiveBatcher, estimate_payload_bytes, DEFAULT_TARGET_BATCH_BYTES, DEFAULT_TARGET_LATENCY
+from surrealdb_rag.helpers.run_manifest import RunManifest, file_run_key
 
 # Initialize database and model parameters, and argument loader
 db_params = DatabaseParams()
@@ -24,157 +27,102 @@ args_loader = ArgsLoader("Input EDGAR data",db_params,model_params)
 
 
 
-# Chunk size for batch processing
-BATCH_SIZE = 100
+# Chunk size for reading the file, the inserts are batched by an AdaptiveBatcher
+READ_CHUNK_SIZE = 1000
 
 
-def count_csv_rows_pandas_chunked(csv_filepath, chunk_size=1000): # Adjust chunk_size as needed
+async def insert_rows(logger, table_name, input_file, total_rows, using_glove, using_fasttext,incrimental_load, concurrency = DEFAULT_CONCURRENCY, bulk_insert = False, batcher = None, manifest = None) -> int:
     """
-    Counts CSV rows accurately using pandas chunking, handling embedded newlines.
+    Inserts data from a corpus file into a SurrealDB table.
 
-    This function efficiently counts the number of rows in a CSV file by reading it in chunks.
-    It's designed to handle CSV files that may contain embedded newlines within fields, which
-    can cause incorrect row counts if read line by line.
-
-    Args:
-        csv_filepath (str): The path to the CSV file.
-        chunk_size (int, optional): The number of rows to read in each chunk. Defaults to 1000.
-
-    Returns:
-        int: The total number of rows in the CSV file.
-    """
-    total_rows = 0
-    csv_chunk_iterator = pd.read_csv(csv_filepath, chunksize=chunk_size)
-    for chunk_df in csv_chunk_iterator:
-        total_rows += len(chunk_df) # Add the number of rows in each chunk
-    return total_rows
-
-MAX_RETRY_COUNT = 3
-def insert_chunk_of_rows(insert_record_surql: str, batch_rows: list, retry_count = 0) -> None:
-
-    """
-    Inserts a batch of rows into SurrealDB, with retry logic for handling transient errors.
-
-    This function attempts to insert a chunk of data into the database. If an exception occurs,
-    it retries the insertion up to a maximum number of times.
-
-    Args:
-        insert_record_surql (str): The SurrealQL query for inserting records.
-        batch_rows (list): A list of dictionaries representing the rows to insert.
-        retry_count (int, optional): The current retry count. Defaults to 0.
-
-    Raises:
-        Exception: If the insertion fails after multiple retries.
-    """
-    try:
-        with Surreal(db_params.DB_PARAMS.url) as connection:
-            connection.signin({"username": db_params.DB_PARAMS.username, "password": db_params.DB_PARAMS.password})
-            connection.use(db_params.DB_PARAMS.namespace, db_params.DB_PARAMS.database)
-            SurrealParams.ParseResponseForErrors(connection.query_raw(
-                insert_record_surql, params={"records": batch_rows}
-            ))
-    except Exception as e:
-        if retry_count >= MAX_RETRY_COUNT:
-            raise Exception(f"Failed to insert chunk of rows after multiple retries {e}")
-        else:
-            insert_chunk_of_rows(insert_record_surql, batch_rows, retry_count + 1)
-            
-
-
-def insert_rows(table_name, input_file, total_chunks, using_glove, using_fasttext,incrimental_load):
-    """
-    Inserts data from a CSV file into a SurrealDB table.
-
-    This function reads the CSV file in chunks, formats the data, and inserts it into the specified
-    SurrealDB table. It handles different embedding models (GloVe, FastText) and provides options
-    for incremental loading.
+    This function reads the Parquet (or legacy CSV) file in chunks with the vectors as numpy arrays,
+    formats the data, and inserts it into the specified SurrealDB table in batches sized by payload
+    bytes, with a SurrealBatchLoader keeping several batches in flight. Batches that still fail after retrying are written to the
+    table's dead letter file. It handles different embedding models (GloVe, FastText) and provides
+    options for incremental loading. If a run manifest is given, each written batch is recorded in it
+    and rows it already holds are skipped.
 
     Args:
+        logger (logging.Logger): The logger object for logging messages.
         table_name (str): The name of the SurrealDB table to insert data into.
-        input_file (str): The path to the CSV file containing the data.
-        total_chunks (int): The total number of chunks to process (used for progress tracking).
+        input_file (str): The path to the Parquet or CSV file containing the data.
+        total_rows (int): The total number of rows to insert (used for progress tracking).
         using_glove (bool): Flag indicating whether GloVe embeddings are used.
         using_fasttext (bool): Flag indicating whether FastText embeddings are used.
         incremental_load (bool): Flag indicating whether to perform an incremental load.
+        concurrency (int, optional): The number of batches in flight at once. Defaults to DEFAULT_CONCURRENCY.
+        bulk_insert (bool, optional): Use the native array INSERT instead of the FOR loop. Defaults to False.
+        batcher (AdaptiveBatcher, optional): Sizes the batches. Defaults to an AdaptiveBatcher with the default targets.
+        manifest (RunManifest, optional): Records the written rows and holds the rows of the run being resumed. Defaults to None.
+
+    Returns:
+        int: The number of batches written to the dead letter file.
     """
-    #schema of the csv
-    file_keys = {
-        "url":"",
-        "company_name":"",
-        "cik":"",
-        "form":"",
-        "accession_no":"",
-        "company.ticker_display":"",
-        "company.tickers":"",
-        "company.exchanges":"",
-        "company.description":"",
-        "company.category":"",
-        "company.industry":"",
-        "company.sic":"",
-        "company.website":"",
-        "filing_date":"",
-        "file_path":"",
-        "chunk":"",
-        "content":"",
-        "content_glove_vector":"",
-        "content_fasttext_vector":"",
-        }.keys()
+    vector_columns = []
+    if using_glove:
+        vector_columns.append("content_glove_vector")
+    if using_fasttext:
+        vector_columns.append("content_fasttext_vector")
     
 
-    insert_record_surql = SurrealDML.UPSERT_RECORDS(table_name)
+    insert_record_surql = SurrealDML.BULK_UPSERT_RECORDS(table_name) if bulk_insert else SurrealDML.UPSERT_RECORDS(table_name)
     
     # if incrimental_load:
     #     insert_record_surql = SurrealDML.UPSERT_RECORDS(table_name)
     # else:
     #     insert_record_surql = SurrealDML.INSERT_RECORDS(table_name)
 
-    #with tqdm.tqdm(total=total_chunks, desc="Inserting Batches") as pbar: # Progress bar for batches
-    with tqdm.tqdm(total=total_chunks,desc="Inserting Batches") as pbar: # Progress bar for batches
-        row_counter = 0 # Track row number for batching
-        batch_rows = [] # List to accumulate rows for a batch
-        with pd.read_csv(input_file, chunksize=BATCH_SIZE) as csv_chunk_iterator: # Iterate through CSV chunks
-            for chunk_df in csv_chunk_iterator: # chunk_df is a DataFrame chunk
-
-                for index, row in chunk_df.iterrows(): # Iterate over rows in the chunk DataFrame
-                    row_counter += 1
-
-                    formatted_row ={
-                        "url":str(row["url"]),
-                        "title": f"{row['company.ticker_display']} {row['form']} {row['filing_date']}",
-                        "text": str(row["content"]),
-                        "content_glove_vector":ast.literal_eval(row["content_glove_vector"]) if using_glove else None,
-                        "content_fasttext_vector":ast.literal_eval(row["content_fasttext_vector"]) if using_fasttext else None,
-                        "additional_data": {
-                                "company_name": row["company_name"],
-                                "cik": row["cik"],
-                                "form": row["form"],
-                                "accession_no": row["accession_no"],
-                                "company_ticker_display": row["company.ticker_display"],
-                                "company_tickers":row["company.tickers"],
-                                "company_exchanges":row["company.exchanges"],
-                                "company_description": row["company.description"],
-                                "company_category": row["company.category"],
-                                "company_industry": row["company.industry"],
-                                "company_sic": row["company.sic"],
-                                "company_website": row["company.website"],
-                                "filing_date": row["filing_date"],
-                        }
+    dead_letter_file = f"{constants.DEAD_LETTER_FOLDER}{table_name}.jsonl"
+    batcher = batcher or AdaptiveBatcher(logger=logger, name=table_name)
+    if manifest and manifest.completed_row_count:
+        logger.info(f"Resuming, skipping {manifest.completed_row_count} rows written by the last run")
+
+    def formatted_rows():
+        # yields (row index, row) for the rows not written by an earlier attempt
+        row_index = -1
+        for chunk_df in iter_corpus_file(input_file, READ_CHUNK_SIZE, vector_columns): # chunk_df is a DataFrame chunk
+            for row in chunk_df.to_dict(orient='records'):
+                row_index += 1
+                if manifest and manifest.is_row_done(row_index):
+                    pbar.update(1)
+                    continue
+                yield row_index, {
+                    "url":str(row["url"]),
+                    "title": f"{row['company.ticker_display']} {row['form']} {row['filing_date']}",
+                    "text": str(row["content"]),
+                    "content_glove_vector":row["content_glove_vector"].tolist() if using_glove else None,
+                    "content_fasttext_vector":row["content_fasttext_vector"].tolist() if using_fasttext else None,
+                    "additional_data": {
+                            "company_name": row["company_name"],
+                            "cik": row["cik"],
+                            "form": row["form"],
+                            "accession_no": row["accession_no"],
+                            "company_ticker_display": row["company.ticker_display"],
+                            "company_tickers":row["company.tickers"],
+                            "company_exchanges":row["company.exchanges"],
+                            "company_description": row["company.description"],
+                            "company_category": row["company.category"],
+                            "company_industry": row["company.industry"],
+                            "company_sic": row["company.sic"],
+                            "company_website": row["company.website"],
+                            "filing_date": row["filing_date"],
                     }
-
-                            
-                    batch_rows.append(formatted_row) # Add formatted row to the batch
-
-                    if row_counter % BATCH_SIZE == 0: # Batch size reached, insert batch
-                       insert_chunk_of_rows(insert_record_surql, batch_rows)
-                       batch_rows = [] # Clear batch after insert
-                       pbar.update(1) # Update progress bar after each batch
-
-            # Insert any remaining rows in the last batch (if less than BATCH_SIZE)
-            if batch_rows:
-                insert_chunk_of_rows(insert_record_surql, batch_rows)
-                batch_rows = [] # Clear batch after insert
-                pbar.update(1) # Update progress bar after each batch
-               
+                }
+
+    with tqdm.tqdm(total=total_rows,desc="Inserting Rows") as pbar: # Progress bar for rows
+        async with SurrealBatchLoader(db_params.DB_PARAMS, concurrency, on_batch_written=pbar.update,
+                                      dead_letter_file=dead_letter_file, logger=logger, batcher=batcher) as loader:
+            for batch, batch_bytes in batcher.batches(formatted_rows(), lambda item: estimate_payload_bytes(item[1])):
+                row_indexes = [row_index for row_index, _ in batch]
+                batch_rows = [row for _, row in batch]
+                records = bulk_corpus_records(table_name, batch_rows) if bulk_insert else batch_rows
+                await loader.submit(insert_record_surql, {"records": records}, len(batch_rows), batch_bytes,
+                                    (lambda row_indexes=row_indexes: manifest.mark_rows_done(row_indexes)) if manifest else None)
+
+    batcher.log_summary()
+    if loader.failed_batches:
+        logger.error(f"{loader.failed_batches} batches failed, they were written to {dead_letter_file}")
+    return loader.failed_batches
 
         
 
@@ -185,7 +133,7 @@ def surreal_edgar_insert() -> None:
     """
     Main function to insert EDGAR data into SurrealDB.
 
-    This function reads data from a CSV file, configures the SurrealDB connection,
+    This function reads data from a Parquet (or legacy CSV) corpus file, configures the SurrealDB connection,
     and calls the `insert_rows` function to perform the data insertion. It also handles
     command-line arguments for customization, including specifying embedding models and
     incremental loading.
@@ -211,10 +159,15 @@ def surreal_edgar_insert() -> None:
         "The name of the FASTTEXT version you uploaded. (default{0})",
         ""
     )
-    args_loader.AddArg("input_file","if","input_file","The path to the csv to insert. (default{0})",input_file)
+    args_loader.AddArg("input_file","if","input_file","The path to the .parquet or legacy .csv file to insert. (default{0})",input_file)
     args_loader.AddArg("table_name","tn","table_name","The sql table name to load the data into (eg embedded_edgar_10k_2025). (default{0})",table_name)
     args_loader.AddArg("display_name","dn","display_name","The name of the corpus to see when selecting in the ux (eg '10k filings for 2025'). (default{0})",display_name)
     args_loader.AddArg("incrimental_load","il","incrimental_load","do an incremental load? or overwrite entire database?. (default{0})",incrimental_load)
+    args_loader.AddArg("concurrency","con","concurrency","The number of batches to insert concurrently, each on its own connection. (default{0})",DEFAULT_CONCURRENCY)
+    args_loader.AddArg("batch_bytes","bb","batch_bytes","The payload size in bytes of the first batches. (default{0})",DEFAULT_TARGET_BATCH_BYTES)
+    args_loader.AddArg("batch_latency","bl","batch_latency","The round-trip seconds the batch size is tuned towards, 0 keeps the batch bytes fixed. (default{0})",DEFAULT_TARGET_LATENCY)
+    args_loader.AddArg("resume","rs","resume","Carry on from the rows the last run of the same file wrote, without recreating the table. (default{0})",False)
+    args_loader.AddArg("bulk_insert","bulk","bulk_insert","Insert with native array INSERT statements instead of a FOR loop per row, see benchmark_bulk_insert.py. (default{0})",False)
 
     # Parse command-line arguments
     args_loader.LoadArgs()
@@ -236,6 +189,9 @@ def surreal_edgar_insert() -> None:
     if args_loader.AdditionalArgs["incrimental_load"]["value"]:
         incrimental_load = str(args_loader.AdditionalArgs["incrimental_load"]["value"]).lower()in ("true","yes","1")
 
+    concurrency = int(args_loader.AdditionalArgs["concurrency"]["value"])
+    bulk_insert = str(args_loader.AdditionalArgs["bulk_insert"]["value"]).lower() in ("true","yes","1")
+    resume = str(args_loader.AdditionalArgs["resume"]["value"]).lower() in ("true","yes","1")
 
 
     logger = loggers.setup_logger("SurrealEDGARInsert")
@@ -280,18 +236,19 @@ def surreal_edgar_insert() -> None:
 
 
     logger.info(f"Calculating rows in file {input_file}")
-    # num_rows_csv = sum(1 for row in open(input_file, 'r', encoding='utf-8')) - 1 # Subtract header row 
-    num_rows_csv = count_csv_rows_pandas_chunked(input_file)
-    total_rows = num_rows_csv # Use this count for batching and progress bar
-    total_chunks = (total_rows + BATCH_SIZE - 1) // BATCH_SIZE
+    total_rows = count_corpus_file_rows(input_file) # Use this count for batching and progress bar
 
-    logger.info(f"Total rows in CSV: {total_rows}") # Debugging - check row count
+    logger.info(f"Total rows in file: {total_rows}") # Debugging - check row count
     
 
 
     
 
-    if not incrimental_load:
+    manifest = RunManifest(file_run_key(f"insert_edgar:{table_name}", input_file, using_glove, using_fasttext))
+    if not resume:
+        manifest.reset()
+
+    if not incrimental_load and not resume:
         with Surreal(db_params.DB_PARAMS.url) as connection:            
             logger.info(f"Connecting to SurrealDB")
             connection.signin({"username": db_params.DB_PARAMS.username, "password": db_params.DB_PARAMS.password})
@@ -314,7 +271,10 @@ def surreal_edgar_insert() -> None:
 
 
     logger.info("Inserting rows into SurrealDB")
-    insert_rows(table_name, input_file, total_chunks, using_glove, using_fasttext, incrimental_load)
+    batcher = AdaptiveBatcher(int(args_loader.AdditionalArgs["batch_bytes"]["value"]), float(args_loader.AdditionalArgs["batch_latency"]["value"]),
+                              logger=logger, name=table_name)
+    with manifest:
+        asyncio.run(insert_rows(logger, table_name, input_file, total_rows, using_glove, using_fasttext, incrimental_load, concurrency, bulk_insert, batcher, manifest))
 
             
     if not incrimental_load:
@@ -325,6 +285,12 @@ def surreal_edgar_insert() -> None:
             logger.info("Connected to SurrealDB")    
             logger.info(f"Updating corpus table info for {table_name}")
             SurrealParams.ParseResponseForErrors( connection.query_raw(SurrealDML.UPDATE_CORPUS_TABLE_INFO(table_name,display_name),params={"embed_models":embed_model_mappings}))
+    else:
+        with Surreal(db_params.DB_PARAMS.url) as connection:
+            connection.signin({"username": db_params.DB_PARAMS.username, "password": db_params.DB_PARAMS.password})
+            connection.use(db_params.DB_PARAMS.namespace, db_params.DB_PARAMS.database)
+            # Lets the app drop what it has cached for the table
+            SurrealParams.ParseResponseForErrors( connection.query_raw(SurrealDML.MARK_CORPUS_TABLE_LOADED(table_name)))
 
 
 
@@ -1,6 +1,6 @@
 """Insert Edgar data into SurrealDB."""
 
-import ast
+import asyncio
 
 import pandas as pd
 from surrealdb import Surreal
@@ -11,12 +11,16 @@ import surrealdb_rag.helpers.constants as constants
 import datetime
 from surrealdb_rag.helpers.llm_handler import RAGChatHandler,ModelListHandler
 
-from surrealdb_rag.data_processing.edgar_graph_extractor import get_public_companies
+from surrealdb_rag.data_processing.edgar_graph_extractor import get_public_companies, GRAPH_VECTOR_COLUMNS
+from surrealdb_rag.helpers.corpus_file_handler import read_corpus_file
+from surrealdb_rag.helpers.surreal_batch_loader import SurrealBatchLoader, DEFAULT_CONCURRENCY
+from surrealdb_rag.helpers.adaptive_batcher import AdaptiveBatcher, estimate_payload_bytes, DEFAULT_TARGET_BATCH_BYTES, DEFAULT_TARGET_LATENCY
+from surrealdb_rag.helpers.run_manifest import RunManifest, file_run_key
 
 
 from surrealdb_rag.helpers.constants import ArgsLoader
 from surrealdb_rag.helpers.params import DatabaseParams, ModelParams, SurrealParams
-from surrealdb_rag.helpers.surreal_dml import SurrealDML
+from surrealdb_rag.helpers.surreal_dml import SurrealDML, bulk_source_document_records, bulk_graph_entity_records, bulk_graph_relation_records
 
 from surrealdb_rag.helpers.corpus_data_handler import CorpusTableListHandler
 
@@ -27,54 +31,22 @@ args_loader = ArgsLoader("Input EDGAR Graph data",db_params,model_params)
 
 
 
-# Chunk size for batch processing
-CHUNK_SIZE = 100
-
-MAX_RETRY_COUNT = 3
-
-
-def insert_chunk_of_rows(insert_record_surql: str, batch_rows: list, retry_count = 0) -> None:
-
-    """
-    Inserts a batch of rows into SurrealDB, with retry logic for handling transient errors.
-
-    This function attempts to insert a chunk of data into the database. If an exception occurs,
-    it retries the insertion up to a maximum number of times.
-
-    Args:
-        insert_record_surql (str): The SurrealQL query for inserting records.
-        batch_rows (list): A list of dictionaries representing the rows to insert.
-        retry_count (int, optional): The current retry count. Defaults to 0.
-
-    Raises:
-        Exception: If the insertion fails after multiple retries.
-    """
-
-
-    try:
-        with Surreal(db_params.DB_PARAMS.url) as connection:
-            connection.signin({"username": db_params.DB_PARAMS.username, "password": db_params.DB_PARAMS.password})
-            connection.use(db_params.DB_PARAMS.namespace, db_params.DB_PARAMS.database)
-            SurrealParams.ParseResponseForErrors(connection.query_raw(
-                insert_record_surql, params={"records": batch_rows}
-            ))
-    except Exception as e:
-        if retry_count >= MAX_RETRY_COUNT:
-            raise Exception(f"Failed to insert chunk of rows after multiple retries {e}")
-        else:
-            insert_chunk_of_rows(insert_record_surql, batch_rows, retry_count + 1)
-            
-
-
-def insert_rows(entity_table_name,relation_table_name,source_document_table_name,graph_data_df, company_metadata_lookup, using_glove, using_fasttext,incrimental_load):
+async def insert_rows(logger,entity_table_name,relation_table_name,source_document_table_name,graph_data_df, company_metadata_lookup, using_glove, using_fasttext,incrimental_load, concurrency = DEFAULT_CONCURRENCY, bulk_insert = False, batcher = None, manifest = None) -> int:
     """
     Inserts data from a DataFrame into SurrealDB tables (entities, relations, source documents).
 
-    This function processes the DataFrame in chunks, formatting the data and inserting it into the
-    appropriate SurrealDB tables. It handles different entity types (person, company, relation)
-    and incorporates metadata and embeddings.
+    This function formats the rows of the DataFrame and groups them into batches by payload size,
+    inserting them into the appropriate SurrealDB tables. It handles different entity types (person, company, relation)
+    and incorporates metadata and embeddings. Each batch is one SurrealBatchLoader batch that writes
+    the source documents, entities and relations in order; several batches are in flight at once and
+    batches that still fail after retrying are written to the entity table's dead letter file.
+    If a run manifest is given, each written batch is recorded in it and rows it already holds are
+    skipped, with entity and relation upserts instead of inserts. The upserted relations have ids
+    derived from their entities and relationship, so a batch that was written but not recorded
+    before the last run failed is written again without duplicating its edges.
 
     Args:
+        logger (logging.Logger): The logger object for logging messages.
         entity_table_name (str): The name of the entity table in SurrealDB.
         relation_table_name (str): The name of the relation table in SurrealDB.
         source_document_table_name (str): The name of the source document table in SurrealDB.
@@ -83,6 +55,13 @@ def insert_rows(entity_table_name,relation_table_name,source_document_table_name
         using_glove (bool): Flag indicating whether GloVe embeddings are used.
         using_fasttext (bool): Flag indicating whether FastText embeddings are used.
         incremental_load (bool): Flag indicating whether to perform an incremental load.
+        concurrency (int, optional): The number of batches in flight at once. Defaults to DEFAULT_CONCURRENCY.
+        bulk_insert (bool, optional): Use the native array INSERT statements instead of the FOR loops. Defaults to False.
+        batcher (AdaptiveBatcher, optional): Sizes the batches by the entity and relation rows. Defaults to an AdaptiveBatcher with the default targets.
+        manifest (RunManifest, optional): Records the written rows and holds the rows of the run being resumed. Defaults to None.
+
+    Returns:
+        int: The number of batches written to the dead letter file.
     """
     file_keys = {
         "url":"",
@@ -105,10 +84,23 @@ def insert_rows(entity_table_name,relation_table_name,source_document_table_name
 
     insert_source_documents_surql = SurrealDML.UPSERT_SOURCE_DOCUMENTS(source_document_table_name)
 
+    if manifest and manifest.completed_row_count:
+        logger.info(f"Resuming, skipping {manifest.completed_row_count} rows written by the last run")
+        # the last batches of the failed run may have been written without being recorded
+        incrimental_load = True
+
     # insert_entity_record_surql = SurrealDML.UPSERT_GRAPH_ENTITY_RECORDS(entity_table_name,source_document_table_name)
     # insert_relation_record_surql = SurrealDML.UPSERT_GRAPH_RELATION_RECORDS(entity_table_name,relation_table_name,source_document_table_name)
 
-    if incrimental_load:
+    if bulk_insert:
+        insert_source_documents_surql = SurrealDML.BULK_UPSERT_SOURCE_DOCUMENTS(source_document_table_name)
+        if incrimental_load:
+            insert_entity_record_surql = SurrealDML.BULK_UPSERT_GRAPH_ENTITY_RECORDS(entity_table_name)
+            insert_relation_record_surql = SurrealDML.BULK_UPSERT_GRAPH_RELATION_RECORDS(relation_table_name)
+        else:
+            insert_entity_record_surql = SurrealDML.BULK_INSERT_GRAPH_ENTITY_RECORDS(entity_table_name)
+            insert_relation_record_surql = SurrealDML.BULK_INSERT_GRAPH_RELATION_RECORDS(relation_table_name)
+    elif incrimental_load:
         insert_entity_record_surql = SurrealDML.UPSERT_GRAPH_ENTITY_RECORDS(entity_table_name,source_document_table_name)
         insert_relation_record_surql = SurrealDML.UPSERT_GRAPH_RELATION_RECORDS(entity_table_name,relation_table_name,source_document_table_name)
     else:
@@ -117,95 +109,115 @@ def insert_rows(entity_table_name,relation_table_name,source_document_table_name
 
 
     total_rows=len(graph_data_df)
-    total_chunks = total_rows // CHUNK_SIZE + (
-        1 if total_rows % CHUNK_SIZE else 0
-    )   
-
-    with tqdm.tqdm(total=total_chunks, desc="Inserting") as pbar:
-        for i in range(0, total_rows, CHUNK_SIZE):
-            chunk_df = graph_data_df.iloc[i:i + CHUNK_SIZE]
-            batch_entity_rows = [] 
-            batch_relation_rows = []
-            batch_source_document_rows = {}
-            for index, row in chunk_df.iterrows(): # Iterate over rows in the chunk DataFrame
-
-                source_document_row = {}
-                source_document_row["url"] = row["url"]
-                source_document_row["title"] = row["filer_company_name"] + ' ' + row["form"] + ' ' + row["filing_date"]
-                source_document_row["additional_data"] = {
-                                    "form": row["form"],
-                                    "filer_cik": row["filer_cik"],
-                                    "filing_date": row["filing_date"],
-                                    "filer_company_name": row["filer_company_name"],
-                                    "accession_no": row["accession_no"]
-                                }
-                batch_source_document_rows[row["url"]] = source_document_row
-
-                
-                formatted_row = {
-                    "url": row["url"],
-                    "contexts": ast.literal_eval(row["contexts"]),
-                    "content_glove_vector":ast.literal_eval(row["glove_vector"]) if using_glove else None,
-                    "content_fasttext_vector":ast.literal_eval(row["fasttext_vector"]) if using_fasttext else None,
-                    "additional_data" : {
-                                    "form": row["form"],
-                                    "filer_cik": row["filer_cik"],
-                                    "filing_date": row["filing_date"],
-                                    "filer_company_name": row["filer_company_name"],
-                                    "accession_no": row["accession_no"]
-                                }
-                }
-                
-                match row["entity_type"]:
-                    case "relation":
-                        try:
-                            # company will have int in the cik field
-                            entity1 = [row["url"],"company",str(int(row["entity_cik"]))]
-                        except:
-                            entity1 = [row["url"],"person",row["entity_name"]]
-                        try:
-                            # company will have int in the cik field
-                            entity2 = [row["url"],"company",str(int(row["entity2_cik"]))]
-                        except:
-                            entity2 = [row["url"],"person",row["entity2_name"]]
 
-                        formatted_row["entity1"] = entity1
-                        formatted_row["entity2"] = entity2
-                        formatted_row["confidence"] = row["confidence"]
+    dead_letter_file = f"{constants.DEAD_LETTER_FOLDER}{entity_table_name}.jsonl"
+    batcher = batcher or AdaptiveBatcher(logger=logger, name=entity_table_name)
+
+    def formatted_rows():
+        # yields (row index, source document row, entity or relation row, "entity" or "relation") for the rows not written by an earlier attempt
+        for row_index, (index, row) in enumerate(graph_data_df.iterrows()):
+            if manifest and manifest.is_row_done(row_index):
+                pbar.update(1)
+                continue
+            source_document_row = {}
+            source_document_row["url"] = row["url"]
+            source_document_row["title"] = row["filer_company_name"] + ' ' + row["form"] + ' ' + row["filing_date"]
+            source_document_row["additional_data"] = {
+                                "form": row["form"],
+                                "filer_cik": row["filer_cik"],
+                                "filing_date": row["filing_date"],
+                                "filer_company_name": row["filer_company_name"],
+                                "accession_no": row["accession_no"]
+                            }
+
+
+            formatted_row = {
+                "url": row["url"],
+                "contexts": row["contexts"],
+                "content_glove_vector":row["glove_vector"].tolist() if using_glove else None,
+                "content_fasttext_vector":row["fasttext_vector"].tolist() if using_fasttext else None,
+                "additional_data" : {
+                                "form": row["form"],
+                                "filer_cik": row["filer_cik"],
+                                "filing_date": row["filing_date"],
+                                "filer_company_name": row["filer_company_name"],
+                                "accession_no": row["accession_no"]
+                            }
+            }
+
+            match row["entity_type"]:
+                case "relation":
+                    try:
+                        # company will have int in the cik field
+                        entity1 = [row["url"],"company",str(int(row["entity_cik"]))]
+                    except:
+                        entity1 = [row["url"],"person",row["entity_name"]]
+                    try:
+                        # company will have int in the cik field
+                        entity2 = [row["url"],"company",str(int(row["entity2_cik"]))]
+                    except:
+                        entity2 = [row["url"],"person",row["entity2_name"]]
+
+                    formatted_row["entity1"] = entity1
+                    formatted_row["entity2"] = entity2
+                    formatted_row["confidence"] = row["confidence"]
+                    try:
+                        relationship = str(row["relationship"])
+                    except:
+                        relationship = "?"
+                    formatted_row["relationship"] =  relationship
+                    yield row_index, source_document_row, formatted_row, "relation"
+
+                case "person" | "company":
+
+                    identifier = str(int(row["entity_cik"])) if row["entity_type"]=="company" else row["entity_name"]
+                    formatted_row["full_id"] = [row["url"],row["entity_type"],identifier]
+
+                    formatted_row["entity_type"] = row["entity_type"]
+                    formatted_row["identifier"] = identifier
+                    formatted_row["name"] = row["entity_name"]
+
+                    if row["entity_type"] == "company":
                         try:
-                            relationship = str(row["relationship"])
+                            company_metadata = company_metadata_lookup[int(row["entity_cik"])]
+                            formatted_row["additional_data"]["company_metadata"] = company_metadata
                         except:
-                            relationship = "?"
-                        formatted_row["relationship"] =  relationship
-                        batch_relation_rows.append(formatted_row) # Add formatted row to the batch
-
-                    case "person" | "company":
-                        
-                        identifier = str(int(row["entity_cik"])) if row["entity_type"]=="company" else row["entity_name"]
-                        formatted_row["full_id"] = [row["url"],row["entity_type"],identifier]
-
-                        formatted_row["entity_type"] = row["entity_type"]
-                        formatted_row["identifier"] = identifier
-                        formatted_row["name"] = row["entity_name"]
-                        
-                        if row["entity_type"] == "company":
-                            try:
-                                company_metadata = company_metadata_lookup[int(row["entity_cik"])]
-                                formatted_row["additional_data"]["company_metadata"] = company_metadata
-                            except:
-                                a = ""
-
-                        batch_entity_rows.append(formatted_row) # Add formatted row to the batch
-                    case _:
-                        a = ""
-                
-            pbar.set_description("Ins. docs")
-            insert_chunk_of_rows(insert_source_documents_surql, list(batch_source_document_rows.values()))
-            pbar.set_description("Ins. ents")
-            insert_chunk_of_rows(insert_entity_record_surql, batch_entity_rows)
-            pbar.set_description("Ins. rels")
-            insert_chunk_of_rows(insert_relation_record_surql,batch_relation_rows)
-            pbar.update(1) # Update progress bar after each batch
+                            a = ""
+
+                    yield row_index, source_document_row, formatted_row, "entity"
+                case _:
+                    yield row_index, source_document_row, None, None
+
+    def formatted_row_bytes(item) -> int:
+        return estimate_payload_bytes(item[2])
+
+    with tqdm.tqdm(total=total_rows, desc="Inserting") as pbar:
+        async with SurrealBatchLoader(db_params.DB_PARAMS, concurrency, on_batch_written=pbar.update,
+                                      dead_letter_file=dead_letter_file, logger=logger, batcher=batcher) as loader:
+            for batch, batch_bytes in batcher.batches(formatted_rows(), formatted_row_bytes):
+                row_indexes = [row_index for row_index, _, _, _ in batch]
+                batch_source_document_rows = list({source_document_row["url"]: source_document_row for _, source_document_row, _, _ in batch}.values())
+                batch_entity_rows = [formatted_row for _, _, formatted_row, kind in batch if kind == "entity"]
+                batch_relation_rows = [formatted_row for _, _, formatted_row, kind in batch if kind == "relation"]
+                if bulk_insert:
+                    batch_source_document_rows = bulk_source_document_records(source_document_table_name, batch_source_document_rows)
+                    batch_entity_rows = bulk_graph_entity_records(entity_table_name, source_document_table_name, batch_entity_rows)
+                    batch_relation_rows = bulk_graph_relation_records(entity_table_name, source_document_table_name, batch_relation_rows,
+                                                                      with_ids = incrimental_load, RELATE_TABLE_NAME = relation_table_name)
+
+                steps = [(insert_source_documents_surql, {"records": batch_source_document_rows})]
+                if batch_entity_rows:
+                    steps.append((insert_entity_record_surql, {"records": batch_entity_rows}))
+                if batch_relation_rows:
+                    steps.append((insert_relation_record_surql, {"records": batch_relation_rows}))
+                await loader.submit_steps(steps, len(batch), batch_bytes,
+                                          (lambda row_indexes=row_indexes: manifest.mark_rows_done(row_indexes)) if manifest else None)
+
+    batcher.log_summary()
+
+    if loader.failed_batches:
+        logger.error(f"{loader.failed_batches} batches failed, they were written to {dead_letter_file}")
+    return loader.failed_batches
             
 
 
@@ -217,7 +229,7 @@ def surreal_edgar_graph_insert() -> None:
     """
     Main function to insert EDGAR graph data into SurrealDB.
 
-    This function reads graph data from a CSV file, configures the SurrealDB connection,
+    This function reads graph data from a Parquet (or legacy CSV) file, configures the SurrealDB connection,
     and calls the `insert_rows` function to perform the data insertion. It also handles
     command-line arguments for customization.
     """
@@ -246,9 +258,14 @@ def surreal_edgar_graph_insert() -> None:
 
     args_loader.AddArg("start_date","edsd","start_date","Start filing date in format '%Y-%m-%d' for filtering. (default{0} blank string doesn't filter)",start_date_str)
     args_loader.AddArg("end_date","eded","end_date","End filing date in format '%Y-%m-%d' for filtering. (default{0} blank string doesn't filter)",end_date_str)
-    args_loader.AddArg("input_file","if","input_file","The path to the csv to insert. (default{0})",input_file)
+    args_loader.AddArg("input_file","if","input_file","The path to the .parquet or legacy .csv file to insert. (default{0})",input_file)
     args_loader.AddArg("table_name","tn","entity_table_name","The sql corpuls table name the 2 will be created with suffixes _entity and _relation (eg embedded_edgar_10k_2025). (default{0})",table_name)
     args_loader.AddArg("incrimental_load","il","incrimental_load","do an incremental load? or overwrite entire database?. (default{0})",incrimental_load)
+    args_loader.AddArg("concurrency","con","concurrency","The number of batches to insert concurrently, each on its own connection. (default{0})",DEFAULT_CONCURRENCY)
+    args_loader.AddArg("batch_bytes","bb","batch_bytes","The payload size in bytes of the first batches. (default{0})",DEFAULT_TARGET_BATCH_BYTES)
+    args_loader.AddArg("batch_latency","bl","batch_latency","The round-trip seconds the batch size is tuned towards, 0 keeps the batch bytes fixed. (default{0})",DEFAULT_TARGET_LATENCY)
+    args_loader.AddArg("resume","rs","resume","Carry on from the rows the last run of the same file and dates wrote, without recreating the tables. (default{0})",False)
+    args_loader.AddArg("bulk_insert","bulk","bulk_insert","Insert with native array INSERT statements instead of a FOR loop per row, see benchmark_bulk_insert.py. (default{0})",False)
 
     # Parse command-line arguments
     args_loader.LoadArgs()
@@ -265,11 +282,15 @@ def surreal_edgar_graph_insert() -> None:
     if args_loader.AdditionalArgs["incrimental_load"]["value"]:
         incrimental_load = str(args_loader.AdditionalArgs["incrimental_load"]["value"]).lower()in ("true","yes","1")
 
+    concurrency = int(args_loader.AdditionalArgs["concurrency"]["value"])
+    bulk_insert = str(args_loader.AdditionalArgs["bulk_insert"]["value"]).lower() in ("true","yes","1")
+    resume = str(args_loader.AdditionalArgs["resume"]["value"]).lower() in ("true","yes","1")
+
 
     logger = loggers.setup_logger("SurrealEDGARGraphInsert")
     logger.info(args_loader.string_to_print())
 
-    graph_data_df = pd.read_csv(input_file)
+    graph_data_df = read_corpus_file(input_file, GRAPH_VECTOR_COLUMNS, list_columns=["contexts"])
 
     graph_data_df['filing_datetime'] = pd.to_datetime(graph_data_df['filing_date'], errors='coerce')
 
@@ -284,7 +305,7 @@ def surreal_edgar_graph_insert() -> None:
 
     total_rows = len(graph_data_df)
 
-    logger.info(f"Total rows in CSV: {total_rows}") # Debugging - check row count
+    logger.info(f"Total rows in file: {total_rows}") # Debugging - check row count
     logger.info(f"Executting DDL for {table_name}")
 
     logger.info("Getting public companies metadata")
@@ -316,7 +337,12 @@ def surreal_edgar_graph_insert() -> None:
             raise Exception("You must specify at least one valid model of GLOVE,FASTTEXT,OPENAI for the core corpus table. Check your corpus table definition")
     
 
-        if not incrimental_load:
+        manifest = RunManifest(file_run_key(f"insert_edgar_graph:{table_name}", input_file,
+                                            args_loader.AdditionalArgs["start_date"]["value"], args_loader.AdditionalArgs["end_date"]["value"]))
+        if not resume:
+            manifest.reset()
+
+        if not incrimental_load and not resume:
             # Read and execute table DDL that creates the tables and indexes if missing
             logger.info(f"Executting DDL for {table_name}")
             with open(constants.CORPUS_GRAPH_TABLE_DDL) as f: 
@@ -339,7 +365,10 @@ def surreal_edgar_graph_insert() -> None:
 
     company_index, company_metadata_lookup = get_public_companies(logger)
     
-    insert_rows(entity_table_name,relation_table_name,source_document_table_name, graph_data_df, company_metadata_lookup, using_glove, using_fasttext,incrimental_load)
+    batcher = AdaptiveBatcher(int(args_loader.AdditionalArgs["batch_bytes"]["value"]), float(args_loader.AdditionalArgs["batch_latency"]["value"]),
+                              logger=logger, name=entity_table_name)
+    with manifest:
+        asyncio.run(insert_rows(logger,entity_table_name,relation_table_name,source_document_table_name, graph_data_df, company_metadata_lookup, using_glove, using_fasttext,incrimental_load, concurrency, bulk_insert, batcher, manifest))
 
     if not incrimental_load:
         with Surreal(db_params.DB_PARAMS.url) as connection:
@@ -357,6 +386,12 @@ def surreal_edgar_graph_insert() -> None:
                 "entity_date_field": "additional_data.filing_date",
                 "relation_date_field": "source_document.additional_data.filing_date"
                 }))
+    else:
+        with Surreal(db_params.DB_PARAMS.url) as connection:
+            connection.signin({"username": db_params.DB_PARAMS.username, "password": db_params.DB_PARAMS.password})
+            connection.use(db_params.DB_PARAMS.namespace, db_params.DB_PARAMS.database)
+            # Lets the app drop what it has cached for the table
+            SurrealParams.ParseResponseForErrors( connection.query_raw(SurrealDML.MARK_CORPUS_TABLE_LOADED(table_name)))
 
 
 
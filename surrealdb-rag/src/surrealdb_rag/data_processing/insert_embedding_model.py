@@ -1,9 +1,8 @@
-"""Insert Wikipedia data into SurrealDB."""
+"""Insert a GloVe or FastText embedding model into SurrealDB."""
 
+import asyncio
 
-import pandas as pd
 from surrealdb import Surreal
-import tqdm
 
 from surrealdb_rag.helpers import loggers
 
@@ -11,6 +10,10 @@ from surrealdb_rag.helpers import loggers
 from surrealdb_rag.helpers.constants import ArgsLoader
 from surrealdb_rag.helpers.params import DatabaseParams, ModelParams, SurrealParams
 from surrealdb_rag.data_processing.embeddings import WordEmbeddingModel
+from surrealdb_rag.data_processing.embedding_table_loader import load_embedding_table
+from surrealdb_rag.helpers.adaptive_batcher import AdaptiveBatcher, DEFAULT_TARGET_BATCH_BYTES, DEFAULT_TARGET_LATENCY
+from surrealdb_rag.helpers.surreal_batch_loader import DEFAULT_CONCURRENCY
+from surrealdb_rag.helpers.run_manifest import RunManifest, file_run_key
 
 
 # Initialize database and model parameters, and argument loader
@@ -18,29 +21,6 @@ db_params = DatabaseParams()
 model_params = ModelParams()
 args_loader = ArgsLoader("Input Glove embeddings model",db_params,model_params)
 
-"""
-SurrealQL query to insert word embeddings into the database.
-
-This query creates `embedding_model` records, associating each word with its
-embedding vector and the embedding model it belongs to.
-
-Args:
-    $model_trainer (str): The name of the training algorithm (e.g., 'GLOVE', 'FASTTEXT').
-    $model_version (str): The version of the model (e.g., '300d', 'custom wiki').
-    $embeddings (list): A list of dictionaries, where each dictionary represents a word and its embedding.
-                      Each dictionary should have 'word' (str) and 'embedding' (list) keys.
-"""
-INSERT_EMBEDDINGS = """
-    LET $model = type::thing('embedding_model_definition',[$model_trainer,$model_version]);
-    FOR $row IN $embeddings {
-        CREATE embedding_model:[$model,$row.word]  CONTENT {
-        word : $row.word,
-        model : $model,
-        embedding: $row.embedding
-        } RETURN NONE;
-    };
-"""
-
 DELETE_EMBEDDINGS = """
 LET $model = type::thing('embedding_model_definition',[$model_trainer,$model_version]);
 DELETE embedding_model WHERE model = $model;
@@ -77,20 +57,17 @@ CHECK_IF_MODEL_EXISTS = """
     AND array::len(SELECT * FROM embedding_model:[embedding_model_definition:[$model_trainer,$model_version],'the']) > 0;
 """
 
-CHUNK_SIZE = 1000 # Size of chunks for batch insertion
-"""
-The number of embedding vectors to insert in each batch. This can be adjusted to optimize
-performance based on the database server's capabilities and network conditions.
-"""
 
 
-def surreal_model_insert(model_trainer,model_version,model_path,description,corpus,overwrite,logger):
+def surreal_model_insert(model_trainer,model_version,model_path,description,corpus,overwrite,logger,batcher:AdaptiveBatcher = None,resume = False,concurrency = DEFAULT_CONCURRENCY):
     """
     Inserts word embeddings from a model file into SurrealDB.
 
-    This function reads a word embedding model file, creates a DataFrame from the word-vector pairs,
-    and then inserts the embeddings into SurrealDB in batches. It also updates the embedding model
-    definition in the database.
+    This function reads a word embedding model file (or its binary cache) and streams the word-vector
+    pairs into SurrealDB with `load_embedding_table`, in batches sized by payload bytes written by
+    several connections at once. It also updates the embedding model definition in the database.
+    Each written batch is recorded in the run manifest, so with `resume` a failed load carries on
+    from the last written batch instead of deleting the model's words and starting over.
 
     Args:
         model_trainer (str): Name of the training algorithm (e.g., 'GLOVE', 'FASTTEXT').
@@ -99,6 +76,9 @@ def surreal_model_insert(model_trainer,model_version,model_path,description,corp
         description (str): Description of the embedding model.
         corpus (str): Description of the training data.
         logger (logging.Logger): Logger instance.
+        batcher (AdaptiveBatcher, optional): Sizes the batches. Defaults to an AdaptiveBatcher with the default targets.
+        resume (bool, optional): Carry on from the last run of the same model file. Defaults to False.
+        concurrency (int, optional): The number of batches written at once. Defaults to DEFAULT_CONCURRENCY.
     """
 
     with Surreal(db_params.DB_PARAMS.url) as connection:
@@ -108,7 +88,7 @@ def surreal_model_insert(model_trainer,model_version,model_path,description,corp
         connection.use(db_params.DB_PARAMS.namespace, db_params.DB_PARAMS.database)
         logger.info("Connected to SurrealDB")
 
-        if not overwrite:
+        if not overwrite and not resume:
             # Check if the model already exists in the database.
             result = connection.query(CHECK_IF_MODEL_EXISTS,params={"model_trainer":model_trainer,"model_version":model_version})
             if result == True:
@@ -119,40 +99,24 @@ def surreal_model_insert(model_trainer,model_version,model_path,description,corp
         logger.info(f"Reading {model_trainer} {model_version} model")
         # Load the embedding model
         embeddingModel = WordEmbeddingModel(model_path, model_trainer=="FASTTEXT") 
-        # Create DataFrame from model data.
-        embeddings_df = pd.DataFrame({'word': embeddingModel.dictionary.keys(), 'embedding': embeddingModel.dictionary.values()})
-        # Calculate number of chunks for batch processing.
-        total_rows = len(embeddings_df)
-        total_chunks = (total_rows + CHUNK_SIZE - 1) // CHUNK_SIZE  # Calculate number of chunks for batch processing
-
-
-        logger.info(f"Deleting any rows from {model_trainer} {model_version}")
-
-        # Delete existing embeddings for this particular model
-        SurrealParams.ParseResponseForErrors(connection.query_raw(DELETE_EMBEDDINGS,params={"model_trainer":model_trainer,"model_version":model_version}))
-        logger.info("Inserting rows into SurrealDB")
-
-        with tqdm.tqdm(total=total_chunks, desc="Inserting") as pbar:
-            # Iterate through chunks of data.
-            for i in range(0, total_rows, CHUNK_SIZE):
-                # Get a chunk of data.
-                chunk = embeddings_df.iloc[i:i + CHUNK_SIZE]
-
-                # create an array of dicts to bulk load into surreal
-                formatted_rows = [
-                    {
-                        "word": WordEmbeddingModel.unescape_token_text_for_txt_file(str(row["word"])),
-                        "embedding":row["embedding"].tolist()
-                    }
-                    for _, row in chunk.iterrows()
-                ]
-
-                # Insert the chunk.
-                SurrealParams.ParseResponseForErrors(connection.query_raw(
-                    INSERT_EMBEDDINGS, params={"embeddings": formatted_rows,"model_trainer":model_trainer,"model_version":model_version}
-                ))
-                # Update progress bar.
-                pbar.update(1)
+        batcher = batcher or AdaptiveBatcher(logger=logger, name="embedding_model")
+
+
+        manifest = RunManifest(file_run_key(f"insert_embedding_model:{model_trainer}:{model_version}", model_path))
+        upsert = resume and manifest.completed_row_count > 0
+        if upsert:
+            logger.info(f"Resuming, skipping {manifest.completed_row_count} words written by the last run")
+        else:
+            manifest.reset()
+            logger.info(f"Deleting any rows from {model_trainer} {model_version}")
+
+            # Delete existing embeddings for this particular model
+            SurrealParams.ParseResponseForErrors(connection.query_raw(DELETE_EMBEDDINGS,params={"model_trainer":model_trainer,"model_version":model_version}))
+        logger.info(f"Inserting rows into SurrealDB with {concurrency} concurrent batches")
+
+        with manifest:
+            asyncio.run(load_embedding_table(logger, embeddingModel, model_trainer, model_version, db_params.DB_PARAMS,
+                                             concurrency, batcher, manifest, upsert))
 
         # Update the model definition.
         SurrealParams.ParseResponseForErrors(connection.query_raw(UPDATE_EMBEDDING_MODEL_DEF,
@@ -192,6 +156,10 @@ def surreal_embeddings_insert() -> None:
     
 
     args_loader.AddArg("overwrite","ow","overwrite","If true delete the model and re-upload. Else exit if model and data exists. (default{0})",overwrite)
+    args_loader.AddArg("concurrency","con","concurrency","The number of batches to insert concurrently, each on its own connection. (default{0})",DEFAULT_CONCURRENCY)
+    args_loader.AddArg("resume","rs","resume","Carry on from the words the last run of the same model file wrote, instead of deleting them. (default{0})",False)
+    args_loader.AddArg("batch_bytes","bb","batch_bytes","The payload size in bytes of the first batches. (default{0})",DEFAULT_TARGET_BATCH_BYTES)
+    args_loader.AddArg("batch_latency","bl","batch_latency","The round-trip seconds the batch size is tuned towards, 0 keeps the batch bytes fixed. (default{0})",DEFAULT_TARGET_LATENCY)
     
     # Parse command-line arguments.
     args_loader.LoadArgs()
@@ -217,6 +185,8 @@ def surreal_embeddings_insert() -> None:
 
     if args_loader.AdditionalArgs["overwrite"]["value"]:
         overwrite = str(args_loader.AdditionalArgs["overwrite"]["value"]).lower()in ("true","yes","1")
+    resume = str(args_loader.AdditionalArgs["resume"]["value"]).lower() in ("true","yes","1")
+    concurrency = int(args_loader.AdditionalArgs["concurrency"]["value"])
 
 
     # Log the parsed arguments.
@@ -224,7 +194,9 @@ def surreal_embeddings_insert() -> None:
 
     
     # Insert the embedding model.
-    surreal_model_insert(model_trainer,model_version,model_path,description,corpus,overwrite,logger)
+    batcher = AdaptiveBatcher(int(args_loader.AdditionalArgs["batch_bytes"]["value"]), float(args_loader.AdditionalArgs["batch_latency"]["value"]),
+                              logger=logger, name="embedding_model")
+    surreal_model_insert(model_trainer,model_version,model_path,description,corpus,overwrite,logger,batcher,resume,concurrency)
 
     logger.info(f"Model loaded!")
 
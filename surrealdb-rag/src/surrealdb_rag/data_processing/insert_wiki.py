@@ -1,8 +1,8 @@
 """Insert Wikipedia data into SurrealDB."""
 
-import ast
+import asyncio
+import os
 
-import pandas as pd
 from surrealdb import Surreal
 import tqdm
 
@@ -13,7 +13,11 @@ import surrealdb_rag.helpers.constants as constants
 from surrealdb_rag.helpers.llm_handler import EMBED_MODEL_DEFINITIONS
 from surrealdb_rag.helpers.constants import ArgsLoader
 from surrealdb_rag.helpers.params import DatabaseParams, ModelParams, SurrealParams
-from surrealdb_rag.helpers.surreal_dml import SurrealDML
+from surrealdb_rag.helpers.surreal_dml import SurrealDML, bulk_corpus_records
+from surrealdb_rag.helpers.corpus_file_handler import iter_corpus_file, count_corpus_file_rows
+from surrealdb_rag.helpers.surreal_batch_loader import SurrealBatchLoader, DEFAULT_CONCURRENCY
+from surrealdb_rag.helpers.adaptive_batcher import AdaptiveBatcher, estimate_payload_bytes, DEFAULT_TARGET_BATCH_BYTES, DEFAULT_TARGET_LATENCY
+from surrealdb_rag.helpers.run_manifest import RunManifest, file_run_key
 
 
 # Initialize database and model parameters, and argument loader
@@ -31,21 +35,97 @@ DISPLAY_NAME = "Wikipedia"
 The display name for the Wikipedia corpus, used for presentation in user interfaces.
 """
 
-CHUNK_SIZE = 50
+READ_CHUNK_SIZE = 1000
 """
-The number of Wikipedia records to insert into SurrealDB in each batch.
-Adjust this value based on your system's performance capabilities.
+The number of Wikipedia records read from the file at a time. The records are inserted in batches
+sized by an AdaptiveBatcher, see the -bb and -bl arguments.
 """
 
 
+async def insert_wiki_records(logger, input_file:str, vector_columns:list[str], usecols:list[str], total_rows:int, concurrency:int,
+                              bulk_insert:bool = False, batcher:AdaptiveBatcher = None, manifest:RunManifest = None) -> int:
+    """
+    Streams the Wikipedia records from the input file into SurrealDB.
+
+    The file is read READ_CHUNK_SIZE rows at a time and the records are grouped into batches by payload
+    size and queued on a SurrealBatchLoader, so up to `concurrency` batches are in flight while the
+    file is read and memory use does not grow with the size of the corpus. Batches that still fail
+    after retrying are written to the table's dead letter file.
+
+    If a run manifest is given, each written batch is recorded in it and rows it already holds
+    are skipped, with upserts instead of inserts in case the last batches of the failed run were
+    written but not recorded.
+
+    Args:
+        logger (logging.Logger): The logger object for logging messages.
+        input_file (str): The Parquet or legacy CSV file to insert.
+        vector_columns (list[str]): The vector columns to insert, the others are inserted as None.
+        usecols (list[str]): The columns to read from the file.
+        total_rows (int): The number of rows (used for progress tracking).
+        concurrency (int): The number of batches in flight at once.
+        bulk_insert (bool, optional): Use the native array INSERT instead of the FOR loop. Defaults to False.
+        batcher (AdaptiveBatcher, optional): Sizes the batches. Defaults to an AdaptiveBatcher with the default targets.
+        manifest (RunManifest, optional): Records the written rows and holds the rows of the run being resumed. Defaults to None.
+
+    Returns:
+        int: The number of batches written to the dead letter file.
+    """
+    using_openai = "content_vector" in vector_columns
+    using_glove = "content_glove_vector" in vector_columns
+    using_fasttext = "content_fasttext_vector" in vector_columns
+
+    if manifest and manifest.completed_row_count:
+        logger.info(f"Resuming, skipping {manifest.completed_row_count} rows written by the last run")
+        insert_record_surql = SurrealDML.BULK_UPSERT_RECORDS(TABLE_NAME) if bulk_insert else SurrealDML.UPSERT_RECORDS(TABLE_NAME)
+    else:
+        insert_record_surql = SurrealDML.BULK_INSERT_RECORDS(TABLE_NAME) if bulk_insert else SurrealDML.INSERT_RECORDS(TABLE_NAME)
+    dead_letter_file = f"{constants.DEAD_LETTER_FOLDER}{TABLE_NAME}.jsonl"
+    batcher = batcher or AdaptiveBatcher(logger=logger, name=TABLE_NAME)
+
+    def formatted_rows():
+        # yields (row index, row) for the rows not written by an earlier attempt
+        row_index = -1
+        for chunk_df in iter_corpus_file(input_file, READ_CHUNK_SIZE, vector_columns, columns=usecols):
+            for row in chunk_df.to_dict(orient='records'):
+                row_index += 1
+                if manifest and manifest.is_row_done(row_index):
+                    pbar.update(1)
+                    continue
+                yield row_index, {
+                    "url":str(row["url"]),
+                    "title":str(row["title"]),
+                    "text":str(row["text"]),
+                    "content_openai_vector":row["content_vector"].tolist() if using_openai else None,
+                    "content_glove_vector":row["content_glove_vector"].tolist() if using_glove else None,
+                    "content_fasttext_vector": row["content_fasttext_vector"].tolist() if using_fasttext else None
+                }
+
+    with tqdm.tqdm(total=total_rows, desc="Inserting") as pbar:
+        async with SurrealBatchLoader(db_params.DB_PARAMS, concurrency, on_batch_written=pbar.update,
+                                      dead_letter_file=dead_letter_file, logger=logger, batcher=batcher) as loader:
+            for batch, batch_bytes in batcher.batches(formatted_rows(), lambda item: estimate_payload_bytes(item[1])):
+                row_indexes = [row_index for row_index, _ in batch]
+                records = [row for _, row in batch]
+                if bulk_insert:
+                    records = bulk_corpus_records(TABLE_NAME, records)
+                await loader.submit(insert_record_surql, {"records": records}, len(batch), batch_bytes,
+                                    (lambda row_indexes=row_indexes: manifest.mark_rows_done(row_indexes)) if manifest else None)
+
+    batcher.log_summary()
+    if loader.failed_batches:
+        logger.error(f"{loader.failed_batches} batches failed, they were written to {dead_letter_file}")
+    return loader.failed_batches
+
+
 """Main entrypoint to insert Wikipedia embeddings into SurrealDB."""
 def surreal_wiki_insert() -> None:
     """
     Main function to insert Wikipedia data with embeddings into SurrealDB.
 
-    This function reads Wikipedia data from a CSV file, configures the SurrealDB connection,
-    and inserts the data into the specified SurrealDB table. It handles different embedding models
-    (GloVe, FastText, OpenAI) and updates corpus table metadata.
+    This function streams Wikipedia data from the Parquet vectors file (or the legacy CSV if it has
+    not been created), configures the SurrealDB connection,
+    and inserts the data into the specified SurrealDB table with several batches in flight. It handles
+    different embedding models (GloVe, FastText, OpenAI) and updates corpus table metadata.
     """
     args_loader.AddArg(
         "embed_models",
@@ -63,6 +143,12 @@ def surreal_wiki_insert() -> None:
         ""
     )
 
+    args_loader.AddArg("concurrency","con","concurrency","The number of batches to insert concurrently, each on its own connection. (default{})",DEFAULT_CONCURRENCY)
+    args_loader.AddArg("batch_bytes","bb","batch_bytes","The payload size in bytes of the first batches. (default{})",DEFAULT_TARGET_BATCH_BYTES)
+    args_loader.AddArg("batch_latency","bl","batch_latency","The round-trip seconds the batch size is tuned towards, 0 keeps the batch bytes fixed. (default{})",DEFAULT_TARGET_LATENCY)
+    args_loader.AddArg("resume","rs","resume","Carry on from the rows the last run of the same file wrote, instead of recreating the table. (default{})",False)
+    args_loader.AddArg("bulk_insert","bulk","bulk_insert","Insert with native array INSERT statements instead of a FOR loop per row, see benchmark_bulk_insert.py. (default{})",False)
+
 
     # Parse command-line arguments
     args_loader.LoadArgs()
@@ -71,6 +157,12 @@ def surreal_wiki_insert() -> None:
 
     logger.info(args_loader.string_to_print())
 
+    concurrency = int(args_loader.AdditionalArgs["concurrency"]["value"])
+    bulk_insert = str(args_loader.AdditionalArgs["bulk_insert"]["value"]).lower() in ("true","yes","1")
+    resume = str(args_loader.AdditionalArgs["resume"]["value"]).lower() in ("true","yes","1")
+    batcher = AdaptiveBatcher(int(args_loader.AdditionalArgs["batch_bytes"]["value"]), float(args_loader.AdditionalArgs["batch_latency"]["value"]),
+                              logger=logger, name=TABLE_NAME)
+
     # Retrieve embedding models from arguments
     embed_models_str = args_loader.AdditionalArgs["embed_models"]["value"]
     embed_models = embed_models_str.split(",")
@@ -110,27 +202,29 @@ def surreal_wiki_insert() -> None:
                 model_definition[1] = fs_version
             embed_model_mappings.append({"model_id": model_definition, "field_name": field_name})
 
-    logger.info(f"Loading file {constants.DEFAULT_WIKI_PATH}")
-
-    # Define columns to read from CSV
+    # Prefer the Parquet vectors file, falling back to a CSV with the vectors appended by an older version
+    input_file = constants.DEFAULT_WIKI_VECTORS_PATH
+    if not os.path.exists(input_file):
+        input_file = constants.DEFAULT_WIKI_PATH
+
+    logger.info(f"Counting rows in file {input_file}")
+
+    # Define the vector columns to read, only the ones being inserted
+    vector_columns = []
+    if using_openai:
+        vector_columns.append("content_vector")
+    if using_glove:
+        vector_columns.append("content_glove_vector")
+    if using_fasttext:
+        vector_columns.append("content_fasttext_vector")
     usecols=[
                         "url",
                         "title",
                         "text",
-                        "content_vector",
-                        "content_glove_vector",
-                        "content_fasttext_vector"
-                    ]
+                    ] + vector_columns
 
-    # Read Wikipedia records from CSV
-    wiki_records_df = pd.read_csv(constants.DEFAULT_WIKI_PATH,usecols=usecols)
-    
-    
-    # Calculate total rows and chunks
-    total_rows = len(wiki_records_df)
-    total_chunks = total_rows // CHUNK_SIZE + (
-        1 if total_rows % CHUNK_SIZE else 0
-    )   
+    # Calculate total rows
+    total_rows = count_corpus_file_rows(input_file)
     with Surreal(db_params.DB_PARAMS.url) as connection:
 
         
@@ -142,40 +236,24 @@ def surreal_wiki_insert() -> None:
     
         
 
-        # Read and execute table DDL that creates the tables and indexes if missing
-        with open(constants.CORPUS_TABLE_DDL) as f: 
-            surlql_to_execute = f.read()
-            surlql_to_execute = surlql_to_execute.format(corpus_table = TABLE_NAME)
-            SurrealParams.ParseResponseForErrors( connection.query_raw(surlql_to_execute))
-
-
-        logger.info("Inserting rows into SurrealDB")
-        # Iterate through chunks and insert records
-        with tqdm.tqdm(total=total_chunks, desc="Inserting") as pbar:
-            for i in range(0, total_rows, CHUNK_SIZE):
-                chunk = wiki_records_df.iloc[i:i + CHUNK_SIZE]
-                formatted_rows = [
-                        {
-                            "url":str(row["url"]),
-                            "title":str(row["title"]),
-                            "text":str(row["text"]),
-                            "content_openai_vector":ast.literal_eval(row["content_vector"]) if using_openai else None,
-                            "content_glove_vector":ast.literal_eval(row["content_glove_vector"]) if using_glove else None,
-                            "content_fasttext_vector": ast.literal_eval(row["content_fasttext_vector"]) if using_fasttext else None
-                        }
-                        for _, row in chunk.iterrows()
-                    ]
-                try:
-                    SurrealParams.ParseResponseForErrors(connection.query_raw(
-                       SurrealDML.INSERT_RECORDS(TABLE_NAME), params={"records": formatted_rows}
-                    ))
-                except Exception as e:
-                    print (e)
-                    return
-                
-                pbar.update(1)
+        with RunManifest(file_run_key(f"insert_wiki:{TABLE_NAME}", input_file, *vector_columns)) as manifest:
+            if not resume:
+                manifest.reset()
 
-        
+                # Read and execute table DDL that recreates the tables and indexes
+                with open(constants.CORPUS_TABLE_DDL) as f: 
+                    surlql_to_execute = f.read()
+                    surlql_to_execute = surlql_to_execute.format(corpus_table = TABLE_NAME)
+                    SurrealParams.ParseResponseForErrors( connection.query_raw(surlql_to_execute))
+
+
+            logger.info(f"Inserting rows into SurrealDB with {concurrency} concurrent batches")
+            try:
+                asyncio.run(insert_wiki_records(logger, input_file, vector_columns, usecols, total_rows, concurrency, bulk_insert, batcher, manifest))
+            except Exception as e:
+                logger.error(f"Error inserting rows {e}")
+                logger.error("Run again with -rs True to carry on from the last written batch")
+                return
 
         # Update corpus table information
         logger.info(f"Updating corpus table info for {TABLE_NAME}")
@@ -0,0 +1,393 @@
+"""Match and merge the names of entities found in filings, scoring only candidates that share a block."""
+
+import os
+import pickle
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import Indel
+
+
+EXACT_MAX_NAMES = 500
+"""
+Up to this many distinct names every pair is scored. Above it only pairs that share a block
+(a token or the initials of the name) are scored.
+"""
+
+COMPANY_INDEX_MAX_KEY_FREQUENCY = 500
+"""
+Index keys shared by more company names than this (eg "inc", "corp") are not used to find candidates,
+unless all the keys of the name being matched are that common.
+"""
+
+COMPANY_INDEX_PREFIX_LENGTH = 3
+"""
+The length of the token prefixes the company index is keyed by as well as the whole tokens, so a
+misspelt name ("Appel Inc") still finds its company.
+"""
+
+COMPANY_INDEX_MAX_CANDIDATES = 2000
+"""
+The most companies scored for one name. Above it the companies sharing the most keys with the
+name are kept, the earlier company first on a tie.
+"""
+
+NON_WORD_CHARACTERS = re.compile(r"(?ui)\W")
+LATIN_1_CHARACTERS = dict.fromkeys(range(128, 256))
+
+
+def process_name(name:str) -> str:
+    """
+    Normalizes a name the way fuzzywuzzy's token_set_ratio does before scoring: drops the latin-1
+    characters, replaces the other non word characters with spaces, lower cases and strips it.
+
+    Args:
+        name (str): The name.
+
+    Returns:
+        str: The normalized name.
+    """
+    return NON_WORD_CHARACTERS.sub(" ", name.translate(LATIN_1_CHARACTERS)).lower().strip()
+
+
+def ratio(a:str, b:str) -> int:
+    """
+    The rounded Indel similarity of two strings, 0 if either is empty, computed like fuzzywuzzy.ratio.
+    """
+    if not a or not b:
+        return 0
+    length = len(a) + len(b)
+    return int(round(100 * ((length - Indel.distance(a, b)) / length)))
+
+
+def token_set_score(a:str, b:str) -> int:
+    """
+    The fuzzywuzzy token_set_ratio of two processed names, rounded the same way, so scores on
+    either side of a threshold agree with fuzzywuzzy exactly.
+
+    Args:
+        a (str): A processed name, see `process_name`.
+        b (str): A processed name.
+
+    Returns:
+        int: The score, 0 - 100.
+    """
+    tokens_a = set(a.split())
+    tokens_b = set(b.split())
+    if not tokens_a or not tokens_b:
+        return 0
+    intersection = " ".join(sorted(tokens_a & tokens_b))
+    combined_a = (intersection + " " + " ".join(sorted(tokens_a - tokens_b))).strip()
+    combined_b = (intersection + " " + " ".join(sorted(tokens_b - tokens_a))).strip()
+    return max(ratio(intersection, combined_a), ratio(intersection, combined_b), ratio(combined_a, combined_b))
+
+
+def fold_name(name:str) -> str:
+    """
+    Normalizes a name like `process_name`, but with its accented characters replaced by their ASCII
+    letters instead of dropped ("García" becomes "garcia" rather than "garca").
+
+    Args:
+        name (str): The name.
+
+    Returns:
+        str: The folded name.
+    """
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return NON_WORD_CHARACTERS.sub(" ", ascii_name).lower().strip()
+
+
+def blocking_keys(name:str, processed_name:str) -> set[str]:
+    """
+    The blocks a name is compared in: each of its tokens (so names sharing a surname meet), its
+    initials (so "jon smith" meets "john smyth") and the COMPANY_INDEX_PREFIX_LENGTH character
+    prefixes of its tokens and of each token joined to the next, of the processed and of the ASCII
+    folded name (so "cook" meets "cooke" and "garca" meets "garcia").
+
+    Args:
+        name (str): The name.
+        processed_name (str): The name processed with `process_name`.
+
+    Returns:
+        set[str]: The block keys.
+    """
+    tokens = processed_name.split()
+    keys = {f"t:{token}" for token in tokens}
+    if tokens:
+        keys.add("i:" + "".join(token[0] for token in tokens))
+    for name_tokens in (tokens, fold_name(name).split()):
+        # each token joined to the next as well, so "o brien" meets "obrien"
+        for token in name_tokens + [token + next_token for token, next_token in zip(name_tokens, name_tokens[1:])]:
+            keys.add("p:" + token[:COMPANY_INDEX_PREFIX_LENGTH])
+    return keys
+
+
+def match_names(names:list[str], threshold:int) -> dict[str, list[tuple[str, int]]]:
+    """
+    Finds, for each distinct name, the names whose token set score with it is at least the threshold.
+
+    Candidates are scored a block at a time with `rapidfuzz.process.cdist`, with every distinct name
+    in one block when there are at most EXACT_MAX_NAMES. Pairs that pass a cut-off one point below
+    the threshold are rescored with `token_set_score`, so the result is the same as scoring every
+    pair with fuzzywuzzy as long as matching names share a block.
+
+    Args:
+        names (list[str]): The names, duplicates allowed.
+        threshold (int): The lowest score of a match.
+
+    Returns:
+        dict: Maps each distinct name to its (matching name, score) pairs, including itself unless it
+              normalizes to an empty string.
+    """
+    unique_names = list(dict.fromkeys(names))
+    processed_names = [process_name(name) for name in unique_names]
+
+    if len(unique_names) <= EXACT_MAX_NAMES:
+        blocks = [list(range(len(unique_names)))]
+    else:
+        blocks_by_key = defaultdict(list)
+        for index, processed_name in enumerate(processed_names):
+            for key in blocking_keys(unique_names[index], processed_name):
+                blocks_by_key[key].append(index)
+        blocks = list(blocks_by_key.values())
+
+    matches = {name: {} for name in unique_names}
+    for block in blocks:
+        block_names = [processed_names[index] for index in block]
+        scores = process.cdist(block_names, block_names, scorer=fuzz.token_set_ratio, processor=None,
+                               score_cutoff=max(threshold - 1, 0), dtype=np.float32, workers=-1)
+        for row, column in zip(*np.nonzero(scores)):
+            name = unique_names[block[row]]
+            other_name = unique_names[block[column]]
+            if other_name in matches[name]:
+                continue
+            score = token_set_score(processed_names[block[row]], processed_names[block[column]])
+            if score >= threshold:
+                matches[name][other_name] = score
+    return {name: list(name_matches.items()) for name, name_matches in matches.items()}
+
+
+def merge_people_names(people_list:list[dict], threshold:int = 85) -> dict[str, dict]:
+    """
+    Merges people whose names match, keyed by the longest matching name.
+
+    Each person is merged into the longest name, among all the names found, that scores at least the
+    threshold against theirs, the same as comparing each name with every other one with
+    `fuzzywuzzy.process.extract`: ties go to the higher score, then to a name that is already a key,
+    then to the name found first. The aliases of a merged person gain the matches of each later
+    person merged into them.
+
+    Args:
+        people_list (list[dict]): The people found, each with a "name" and "contexts".
+        threshold (int, optional): The lowest token set score of a match. Defaults to 85.
+
+    Returns:
+        dict: Maps each primary name to {"aliases": [...], "contexts": [...]}.
+    """
+    names = [person["name"] for person in people_list]
+    name_matches = match_names(names, threshold)
+    name_positions = defaultdict(list)
+    for position, name in enumerate(names):
+        name_positions[name].append(position)
+
+    merged_people = {}  # Key: Primary Name, Value: {aliases: [], contexts: []}
+    key_positions = {}
+    for person in people_list:
+        name = person["name"]
+        contexts = person["contexts"]
+
+        # every copy of each match, at its place in the primary names followed by all the names
+        candidates = []
+        for match, score in name_matches[name]:
+            if match in key_positions:
+                candidates.append((match, score, key_positions[match]))
+            candidates.extend((match, score, len(key_positions) + position) for position in name_positions[match])
+        candidates.sort(key=lambda candidate: (-len(candidate[0]), -candidate[1], candidate[2]))
+        best_matches = [candidate[0] for candidate in candidates] or [name]
+
+        primary_name = best_matches[0]  # Longest name is the primary key
+
+        if primary_name not in merged_people:
+            key_positions[primary_name] = len(merged_people)
+            merged_people[primary_name] = {"aliases": [primary_name], "contexts": contexts.copy()}
+        else:
+            merged_people[primary_name]["aliases"].extend([m for m in best_matches if m not in merged_people[primary_name]["aliases"]])
+            for context in contexts:
+                if context not in merged_people[primary_name]["contexts"]:
+                    merged_people[primary_name]["contexts"].append(context)
+    return merged_people
+
+
+class CompanyNameIndex():
+    """
+    Finds the company whose name best matches an entity name, without scoring every company.
+
+    The normalized company names are indexed by their tokens and token prefixes. A lookup scores
+    only the companies sharing one of the name's less common keys, with rapidfuzz, and picks the
+    best match the same way a scan of every company with fuzzywuzzy's token_set_ratio does:
+    the highest score at or above the threshold, the earlier company on a tie.
+
+    A company whose tokens include every token of the name, or are all tokens of the name, scores
+    100. The earliest such company is found from the whole token postings, common tokens included,
+    and then only the companies before it are scored.
+
+    The index is built from the public companies metadata and pickled next to it, see `load`.
+
+    Usage:
+        company_name_index = CompanyNameIndex.load(index_path, companies_file, company_metadata_lookup)
+        cik = company_name_index.best_match("Apple Computer", threshold=80)
+    """
+
+    VERSION = 3
+    """
+    The version of the pickled index. An index pickled by another version is rebuilt by `load`.
+    """
+
+    def __init__(self, company_names:list[tuple[int, str]]):
+        """
+        Builds the index.
+
+        Args:
+            company_names (list[tuple[int, str]]): The (CIK, company name) pairs, in the order ties are broken in.
+        """
+        self.version = CompanyNameIndex.VERSION
+        self.ciks = [cik for cik, _ in company_names]
+        self.names = [process_name(name) for _, name in company_names]
+        # the names as an array, so a lookup's candidate names are one indexing operation
+        self.name_array = np.asarray(self.names, dtype=object)
+        self.token_counts = np.asarray([len(set(name.split())) for name in self.names], dtype=np.int32)
+        postings = defaultdict(list)
+        for position, name in enumerate(self.names):
+            for key in CompanyNameIndex.index_keys(name):
+                postings[key].append(position)
+        self.postings = {key: np.asarray(positions, dtype=np.int32) for key, positions in postings.items()}
+
+    @staticmethod
+    def index_keys(processed_name:str) -> set[str]:
+        """
+        Args:
+            processed_name (str): A name normalized with `process_name`.
+
+        Returns:
+            set[str]: Its tokens and token prefixes.
+        """
+        keys = set()
+        for token in processed_name.split():
+            keys.add(token)
+            keys.add(token[:COMPANY_INDEX_PREFIX_LENGTH] + "*")
+        return keys
+
+    def candidates(self, processed_name:str) -> np.ndarray:
+        """
+        Args:
+            processed_name (str): A name normalized with `process_name`.
+
+        Returns:
+            np.ndarray: The sorted positions of the companies sharing one of its keys, leaving out
+                        keys shared by more than COMPANY_INDEX_MAX_KEY_FREQUENCY companies unless
+                        they are all that common, in which case the rarest is used. Only the
+                        companies up to the first whose tokens include all of the name's, or are
+                        all among the name's, are kept, and at most COMPANY_INDEX_MAX_CANDIDATES.
+        """
+        postings = [self.postings[key] for key in CompanyNameIndex.index_keys(processed_name) if key in self.postings]
+        if not postings:
+            return np.zeros(0, dtype=np.int32)
+        selected = [positions for positions in postings if len(positions) <= COMPANY_INDEX_MAX_KEY_FREQUENCY]
+        if not selected:
+            selected = [min(postings, key=len)]
+        positions, key_counts = np.unique(np.concatenate(selected), return_counts=True)
+
+        # the companies with every token of the name or only tokens of the name, however common the tokens are
+        tokens = set(processed_name.split())
+        token_postings = [self.postings[token] for token in tokens if token in self.postings]
+        first_full_match = None
+        if token_postings:
+            matched, token_matches = np.unique(np.concatenate(token_postings), return_counts=True)
+            full_matches = matched[(token_matches == len(tokens)) | (token_matches == self.token_counts[matched])]
+            if len(full_matches):
+                first_full_match = full_matches[0]
+                before = positions < first_full_match
+                positions = positions[before]
+                key_counts = key_counts[before]
+
+        if len(positions) > COMPANY_INDEX_MAX_CANDIDATES:
+            positions = np.sort(positions[np.lexsort((positions, -key_counts))[:COMPANY_INDEX_MAX_CANDIDATES]])
+        if first_full_match is not None:
+            positions = np.append(positions, first_full_match)
+        return positions
+
+    def best_match(self, company_name:str, threshold:int = 80) -> int:
+        """
+        Finds the company whose name best matches company_name.
+
+        Args:
+            company_name (str): The entity name.
+            threshold (int, optional): The lowest token set score of a match. Defaults to 80.
+
+        Returns:
+            int: The CIK of the best match, or None if no company scores at least the threshold.
+        """
+        processed_name = process_name(company_name)
+        positions = self.candidates(processed_name)
+        if not len(positions):
+            return None
+        scores = process.cdist([processed_name], self.name_array[positions], scorer=fuzz.token_set_ratio,
+                               processor=None, score_cutoff=max(threshold - 1, 0), dtype=np.float32)[0]
+        top_score = scores.max()
+        if not top_score:
+            return None
+        best_cik = None
+        best_score = 0
+        # rescore the candidates within a point of the best exactly, in index order so the earlier company wins a tie
+        for index in np.nonzero(scores >= max(threshold - 1, top_score - 1))[0]:
+            score = token_set_score(processed_name, self.names[positions[index]])
+            if score > best_score:
+                best_score = score
+                best_cik = self.ciks[positions[index]]
+                if best_score == 100:
+                    break
+        return best_cik if best_score >= threshold else None
+
+    def save(self, index_path:str) -> None:
+        """
+        Pickles the index, writing to a temporary file first so a reader never sees a partial index.
+
+        Args:
+            index_path (str): The index file.
+        """
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+
+    @staticmethod
+    def load(index_path:str, companies_file:str, company_metadata_lookup:dict, logger = None) -> "CompanyNameIndex":
+        """
+        Loads the pickled index, or builds and saves it if it is missing, older than the companies file
+        or pickled by another version of the index.
+
+        Args:
+            index_path (str): The index file.
+            companies_file (str): The public companies metadata file the index is built from.
+            company_metadata_lookup (dict): Maps each CIK to its metadata, with a "company_name".
+            logger (logging.Logger, optional): Logger for a rebuild.
+
+        Returns:
+            CompanyNameIndex: The index.
+        """
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(companies_file):
+            with open(index_path, "rb") as f:
+                company_name_index = pickle.load(f)
+            if getattr(company_name_index, "version", None) == CompanyNameIndex.VERSION:
+                return company_name_index
+
+        if logger:
+            logger.info(f"Building the company name index {index_path}")
+        company_names = [(cik, metadata["company_name"]) for cik, metadata in company_metadata_lookup.items()
+                         if isinstance(metadata.get("company_name"), str)]
+        company_name_index = CompanyNameIndex(company_names)
+        company_name_index.save(index_path)
+        return company_name_index
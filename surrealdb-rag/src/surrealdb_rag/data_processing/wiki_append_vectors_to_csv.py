@@ -1,41 +1,101 @@
-
+import itertools
 import os
+import shutil
 
 from surrealdb_rag.helpers import loggers
 
 import surrealdb_rag.helpers.constants as constants
+from surrealdb_rag.helpers.constants import ArgsLoader
+from surrealdb_rag.helpers.params import DatabaseParams, ModelParams
 
-from surrealdb_rag.data_processing.embeddings import WordEmbeddingModel
+from surrealdb_rag.data_processing.embeddings import WordEmbeddingModel, WORKER_EMBEDDING_MODELS, map_with_embedding_workers
+from surrealdb_rag.helpers.corpus_file_handler import CorpusFileWriter, STRING, parse_vector_string
 
+import numpy as np
 import pandas as pd
 import tqdm
 
 
+# Initialize database and model parameters, and argument loader
+db_params = DatabaseParams()
+model_params = ModelParams()
+args_loader = ArgsLoader("Append vectors to wiki data",db_params,model_params)
+
+
+EMBED_BATCH_SIZE = 1000
+"""
+The number of articles a worker embeds per task.
+"""
+
+MODEL_SPECS = {
+    "GLOVE": (constants.DEFAULT_GLOVE_PATH, False),
+    "FASTTEXT": (constants.DEFAULT_FS_WIKI_PATH, True),
+}
+"""
+The embedding models opened by each worker: name -> (model path, unescape words).
+"""
+
+WIKI_SCHEMA = {
+    "url": STRING,
+    "title": STRING,
+    "text": STRING,
+}
+"""
+The non-vector columns of the Wikipedia vectors file.
+"""
+WIKI_VECTOR_COLUMNS = ["content_vector", "content_glove_vector", "content_fasttext_vector"]
+"""
+The vector columns of the Wikipedia vectors file: the OpenAI vectors from the download plus the calculated ones.
+"""
+
+
+def embed_wiki_batch(texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Embeds a batch of articles with both models. Runs in a worker process.
+
+    Args:
+        texts (list[str]): The article texts.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The GloVe and FastText matrices, one row per text.
+    """
+    return (WORKER_EMBEDDING_MODELS["GLOVE"].sentences_to_matrix(texts),
+            WORKER_EMBEDDING_MODELS["FASTTEXT"].sentences_to_matrix(texts))
+
+
 def append_wiki_vectors() -> None:
 
     """
-    Appends GloVe and FastText embedding vectors to the Wikipedia data CSV file.
+    Appends GloVe and FastText embedding vectors to the Wikipedia data.
 
-    This function loads Wikipedia data, computes sentence embeddings using GloVe and FastText models,
-    adds these embeddings as new columns to the DataFrame, backs up the original CSV, and saves the
-    updated DataFrame to a new CSV file.
+    This function reads the Wikipedia data a batch at a time, computes sentence embeddings using GloVe and
+    FastText models in a pool of worker processes that share the memory-mapped models, and writes each
+    batch of articles with the downloaded OpenAI vectors and the new vectors to a Parquet file with
+    float32 vector columns as it is embedded.
+    The downloaded CSV is left as is.
     """
 
-    
+    workers = os.cpu_count()
+    args_loader.AddArg("workers","w","workers","The number of embedding worker processes. (default{0})",workers)
+    args_loader.LoadArgs()
+    workers = int(args_loader.AdditionalArgs["workers"]["value"])
+
     logger = loggers.setup_logger("DownloadData")
+    logger.info(args_loader.string_to_print())
 
     if not os.path.exists(constants.DEFAULT_WIKI_PATH):
         raise FileNotFoundError(f"File not found: {constants.DEFAULT_WIKI_PATH}")
 
+    # Open the models once here so the binary caches exist before the workers memory-map them
     logger.info(f"Loading Glove embedding model {constants.DEFAULT_GLOVE_PATH}")
     try:
-        gloveEmbeddingModel = WordEmbeddingModel(constants.DEFAULT_GLOVE_PATH,False)
+        WordEmbeddingModel(*MODEL_SPECS["GLOVE"])
     except Exception as e:
         logger.error(f"Error opening embedding model. please check the model file was downloaded using download_glove_model {e}")
 
     logger.info(f"Loading custom FastText embedding model {constants.DEFAULT_FS_WIKI_PATH}")
     try:
-        fastTextEmbeddingModel = WordEmbeddingModel(constants.DEFAULT_FS_WIKI_PATH,True)
+        WordEmbeddingModel(*MODEL_SPECS["FASTTEXT"])
     except Exception as e:
         logger.error(f"Error opening embedding model. train the model using train_fastText {e}")
 
@@ -47,22 +107,28 @@ def append_wiki_vectors() -> None:
     ]
 
 
-    logger.info("Loading Wiki data to data frame")
-    wiki_records_df = pd.read_csv(constants.DEFAULT_WIKI_PATH,usecols=usecols)
-    
-    logger.info("Processing glove embeddings")
-    wiki_records_df['content_glove_vector'] = [gloveEmbeddingModel.sentence_to_vec(x) for x in tqdm.tqdm(wiki_records_df["text"], desc="Processing content glove embeddings")]
-    
-    logger.info("Processing fast text embeddings")
-    wiki_records_df['content_fasttext_vector'] = [fastTextEmbeddingModel.sentence_to_vec(x) for x in tqdm.tqdm(wiki_records_df["text"], desc="Processing content fast text embeddings")]
-    
-    logger.info(f"Backing up file {constants.DEFAULT_WIKI_PATH + ".bak"}")
-    
-    os.rename(constants.DEFAULT_WIKI_PATH, constants.DEFAULT_WIKI_PATH + ".bak")
-    logger.info(f"Saving file {constants.DEFAULT_WIKI_PATH}")
-    wiki_records_df.to_csv(constants.DEFAULT_WIKI_PATH, index=False)  # index=False prevents writing the index
+    logger.info(f"Processing glove and fast text embeddings with {workers} workers")
+    # the articles are read, embedded and written a batch at a time, so only the batches in flight are held
+    chunks_to_embed, chunks_to_write = itertools.tee(pd.read_csv(constants.DEFAULT_WIKI_PATH, usecols=usecols, chunksize=EMBED_BATCH_SIZE))
+    batches = (chunk["text"].astype(str).tolist() for chunk in chunks_to_embed)
+
+    if os.path.exists(constants.DEFAULT_WIKI_VECTORS_PATH):
+        # copied rather than moved, so a run that fails leaves the last file in place
+        logger.info(f"Backing up file {constants.DEFAULT_WIKI_VECTORS_PATH + ".bak"}")
+        shutil.copy2(constants.DEFAULT_WIKI_VECTORS_PATH, constants.DEFAULT_WIKI_VECTORS_PATH + ".bak")
+
+    logger.info(f"Saving file {constants.DEFAULT_WIKI_VECTORS_PATH}")
+    with CorpusFileWriter(constants.DEFAULT_WIKI_VECTORS_PATH, WIKI_SCHEMA, WIKI_VECTOR_COLUMNS) as writer:
+        with tqdm.tqdm(desc="Processing content embeddings", unit="articles") as pbar:
+            for chunk, (glove_matrix, fasttext_matrix) in zip(chunks_to_write, map_with_embedding_workers(embed_wiki_batch, batches, MODEL_SPECS, workers)):
+                chunk = chunk.assign(
+                    content_vector = [parse_vector_string(vector) for vector in chunk["content_vector"]],
+                    content_glove_vector = list(glove_matrix),
+                    content_fasttext_vector = list(fasttext_matrix))
+                writer.writerows(chunk.to_dict(orient='records'))
+                pbar.update(len(chunk))
 
     logger.info("Appended vectors successfully. Please check the data directory")
 
 if __name__ == "__main__":
-    append_wiki_vectors()
\ No newline at end of file
+    append_wiki_vectors()
@@ -0,0 +1,211 @@
+"""Size insert batches by payload bytes and tune the size from the observed round-trip latency."""
+
+import numpy as np
+from surrealdb import RecordID
+
+
+DEFAULT_TARGET_BATCH_BYTES = 1_000_000
+"""
+The payload size a batch starts at, about 50 Wikipedia rows with OpenAI, GloVe and FastText vectors
+or 1000 rows of a 100d embedding model.
+"""
+
+DEFAULT_TARGET_LATENCY = 1.0
+"""
+The round-trip time in seconds the batch size is tuned towards. 0 turns the tuning off and keeps
+the target batch bytes for the whole run.
+"""
+
+MIN_BATCH_BYTES = 32_000
+"""
+The lower limit of the tuned payload size of a batch.
+"""
+
+MAX_BATCH_BYTES = 16_000_000
+"""
+The upper limit of the tuned payload size of a batch, to stay well clear of request size limits and timeouts.
+"""
+
+MAX_BATCH_ROWS = 10_000
+"""
+The upper limit of the number of rows in a batch, however small the rows are.
+"""
+
+SMOOTHING = 0.3
+"""
+The weight of the latest observation when the byte budget is updated, the rest is the current budget.
+"""
+
+LOG_CHANGE_RATIO = 1.25
+"""
+The batch size is logged when the budget has moved by this factor since it was last logged.
+"""
+
+
+def estimate_payload_bytes(value) -> int:
+    """
+    Estimates the encoded size of a value sent as a query parameter. Numbers count as
+    9 bytes, the size of a CBOR float64, so a vector of n floats is about 9n bytes.
+
+    Args:
+        value: A row, or a value in a row.
+
+    Returns:
+        int: The estimated size in bytes.
+    """
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 9
+    if isinstance(value, str):
+        return len(value) + 5
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], float):
+            return 9 * len(value) + 5
+        return sum(estimate_payload_bytes(item) for item in value) + 5
+    if isinstance(value, dict):
+        return sum(estimate_payload_bytes(key) + estimate_payload_bytes(item) for key, item in value.items()) + 5
+    if isinstance(value, np.ndarray):
+        return 9 * value.size + 5
+    if isinstance(value, RecordID):
+        return estimate_payload_bytes(value.table_name) + estimate_payload_bytes(value.id) + 5
+    return len(str(value)) + 5
+
+
+class AdaptiveBatcher():
+    """
+    Groups rows into batches of about `batch_bytes` of payload instead of a fixed number of rows,
+    so wide rows (eg OpenAI vectors) make small batches and narrow rows make large ones.
+
+    After each batch is written, `observe` compares its round-trip time with the target latency and
+    moves the byte budget towards the size that would take the target time, smoothed and limited to
+    MIN_BATCH_BYTES - MAX_BATCH_BYTES. The budget and the rows per batch are logged when they move,
+    and `log_summary` logs the final values, which can be passed back as the target batch bytes with
+    a target latency of 0 to reproduce a run.
+
+    Usage:
+        batcher = AdaptiveBatcher(logger=logger)
+        async with SurrealBatchLoader(db_params.DB_PARAMS, batcher=batcher) as loader:
+            for batch, batch_bytes in batcher.batches(rows):
+                await loader.submit(surql, {"records": batch}, len(batch), batch_bytes)
+        batcher.log_summary()
+    """
+
+    def __init__(self, target_bytes:int = DEFAULT_TARGET_BATCH_BYTES, target_latency:float = DEFAULT_TARGET_LATENCY,
+                 max_rows:int = MAX_BATCH_ROWS, logger = None, name:str = "Batch"):
+        """
+        Initializes the AdaptiveBatcher.
+
+        Args:
+            target_bytes (int, optional): The payload size of the first batches. Defaults to DEFAULT_TARGET_BATCH_BYTES.
+            target_latency (float, optional): The round-trip seconds to tune towards, 0 for a fixed size. Defaults to DEFAULT_TARGET_LATENCY.
+            max_rows (int, optional): The most rows in a batch. Defaults to MAX_BATCH_ROWS.
+            logger (logging.Logger, optional): Logger for the chosen batch sizes.
+            name (str, optional): The name used in the log messages, eg the table. Defaults to "Batch".
+        """
+        self.batch_bytes = int(target_bytes)
+        self.target_latency = float(target_latency or 0)
+        self.max_rows = max(1, int(max_rows))
+        self.logger = logger
+        self.name = name
+        self.total_rows = 0
+        self.total_bytes = 0
+        self.total_batches = 0
+        self.logged_batch_bytes = None
+
+    @property
+    def average_row_bytes(self) -> float:
+        """
+        The average estimated size of the rows batched so far.
+        """
+        return self.total_bytes / self.total_rows if self.total_rows else 0
+
+    @property
+    def rows_per_batch(self) -> int:
+        """
+        The number of rows of average size that fit the current budget.
+        """
+        if not self.average_row_bytes:
+            return 0
+        return max(1, min(self.max_rows, int(self.batch_bytes / self.average_row_bytes)))
+
+    def log_batch_size(self, reason:str) -> None:
+        """
+        Logs the current byte budget and the rows per batch it gives.
+
+        Args:
+            reason (str): Why the size is logged, eg "starting".
+        """
+        self.logged_batch_bytes = self.batch_bytes
+        if self.logger:
+            self.logger.info(f"{self.name} size {reason}: {self.batch_bytes} bytes (~{self.rows_per_batch} rows of ~{self.average_row_bytes:.0f} bytes)")
+
+    def batches(self, rows, row_bytes = estimate_payload_bytes):
+        """
+        Groups rows into batches that fill the current byte budget.
+        The budget is read for every row, so changes from `observe` apply to the next batch.
+
+        Args:
+            rows (iterable): The rows, read lazily.
+            row_bytes (callable, optional): Estimates the size of a row. Defaults to estimate_payload_bytes.
+
+        Yields:
+            tuple: The list of rows and their estimated size in bytes.
+        """
+        batch = []
+        batch_bytes = 0
+        for row in rows:
+            size = row_bytes(row)
+            if batch and (batch_bytes + size > self.batch_bytes or len(batch) >= self.max_rows):
+                yield self.count_batch(batch, batch_bytes)
+                batch = []
+                batch_bytes = 0
+            batch.append(row)
+            batch_bytes += size
+        if batch:
+            yield self.count_batch(batch, batch_bytes)
+
+    def count_batch(self, batch:list, batch_bytes:int) -> tuple[list, int]:
+        """
+        Adds a batch to the totals, logging the size before the first batch.
+
+        Args:
+            batch (list): The rows of the batch.
+            batch_bytes (int): The estimated size of the batch.
+
+        Returns:
+            tuple: The batch and its size.
+        """
+        self.total_rows += len(batch)
+        self.total_bytes += batch_bytes
+        self.total_batches += 1
+        if self.logged_batch_bytes is None:
+            self.log_batch_size("starting")
+        return batch, batch_bytes
+
+    def observe(self, batch_bytes:int, seconds:float) -> None:
+        """
+        Moves the byte budget towards the size that would be written in the target latency,
+        going by the throughput of a batch that was just written.
+
+        Args:
+            batch_bytes (int): The estimated size of the batch.
+            seconds (float): The round-trip time of the batch.
+        """
+        if not self.target_latency or batch_bytes <= 0 or seconds <= 0:
+            return
+        ideal_bytes = batch_bytes / seconds * self.target_latency
+        # at most double or halve per batch so one slow round trip doesn't collapse the size
+        ideal_bytes = min(max(ideal_bytes, self.batch_bytes / 2), self.batch_bytes * 2)
+        batch_bytes = (1 - SMOOTHING) * self.batch_bytes + SMOOTHING * ideal_bytes
+        self.batch_bytes = int(min(max(batch_bytes, MIN_BATCH_BYTES), MAX_BATCH_BYTES))
+        if self.logged_batch_bytes and not (1 / LOG_CHANGE_RATIO < self.batch_bytes / self.logged_batch_bytes < LOG_CHANGE_RATIO):
+            self.log_batch_size(f"tuned to {seconds:.2f}s round trip")
+
+    def log_summary(self) -> None:
+        """
+        Logs the final batch size and the totals, the values to pass to reproduce the run.
+        """
+        if self.logger and self.total_batches:
+            self.logger.info(f"{self.name} sizes: {self.total_batches} batches, {self.total_rows} rows, "
+                             f"{self.total_rows / self.total_batches:.1f} rows/batch on average, final size {self.batch_bytes} bytes (~{self.rows_per_batch} rows)")
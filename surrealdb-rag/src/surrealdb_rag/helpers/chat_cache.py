@@ -0,0 +1,428 @@
+"""In-memory caches of the chat app, bounded by entry count and age and dropped for a corpus when it is reloaded."""
+
+import hashlib
+import re
+import time
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+from surrealdb import RecordID
+
+
+DEFAULT_RESPONSE_CACHE_SIZE = 1000
+"""
+The most LLM answers the response cache holds. 0 turns the cache off.
+"""
+
+DEFAULT_RESPONSE_CACHE_TTL = 3600
+"""
+The seconds an LLM answer is served from the response cache.
+"""
+
+DEFAULT_RESPONSE_CACHE_SIMILARITY = 0.97
+"""
+The lowest cosine similarity of two questions' embeddings for one's cached answer to be served for
+the other, when both retrieved the same documents into the same prompt. Above 1 only identical
+questions are served from the cache.
+"""
+
+DEFAULT_RETRIEVAL_CACHE_SIZE = 1000
+"""
+The most retrievals (a question's embedding, documents and knowledge graph) the retrieval cache holds.
+0 turns the cache off.
+"""
+
+DEFAULT_RETRIEVAL_CACHE_TTL = 3600
+"""
+The seconds a retrieval is served from the retrieval cache.
+"""
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_input(text:str) -> str:
+    """
+    Normalizes a question so that questions differing only in case, spacing or closing punctuation
+    share a cache key.
+
+    Args:
+        text (str): The question.
+
+    Returns:
+        str: The normalized question.
+    """
+    return WHITESPACE.sub(" ", text or "").strip().lower().rstrip("?!. ")
+
+
+def corpus_table_of(document_id) -> str:
+    """
+    Args:
+        document_id: The RecordID of a corpus document, or its string form "<table>:<id>".
+
+    Returns:
+        str: The corpus table the document is in.
+    """
+    if isinstance(document_id, RecordID):
+        return document_id.table_name
+    return str(document_id).split(":", 1)[0]
+
+
+class ExpiringLRUCache():
+    """
+    A dict bounded by the number of entries, dropping the least recently used entry first, whose
+    entries expire a number of seconds after they are written.
+
+    Subclasses override `removed` to keep their own indexes of the keys in step.
+    """
+
+    def __init__(self, max_entries:int, ttl_seconds:float):
+        """
+        Args:
+            max_entries (int): The most entries held. 0 or less holds none.
+            ttl_seconds (float): The seconds an entry lives.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (expires at, value), least recently used first
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def peek(self, key):
+        """
+        Returns:
+            The live value of key, or None, without marking it as used.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self.expirations += 1
+            self.remove(key)
+            return None
+        return entry[1]
+
+    def get(self, key):
+        """
+        Returns:
+            The live value of key, or None, and marks it as the most recently used.
+        """
+        value = self.peek(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value) -> None:
+        """
+        Writes key, dropping the least recently used entries over the size limit.
+        """
+        if self.max_entries <= 0:
+            return
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        while len(self.entries) > self.max_entries:
+            oldest_key, (_, oldest_value) = self.entries.popitem(last=False)
+            self.evictions += 1
+            self.removed(oldest_key, oldest_value)
+
+    def remove(self, key) -> None:
+        """
+        Drops key if it is cached.
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.removed(key, entry[1])
+
+    def invalidate(self, predicate) -> int:
+        """
+        Drops the entries a predicate holds for.
+
+        Args:
+            predicate: Called with each key and value.
+
+        Returns:
+            int: The number of entries dropped.
+        """
+        keys = [key for key, (_, value) in self.entries.items() if predicate(key, value)]
+        for key in keys:
+            self.remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def removed(self, key, value) -> None:
+        """
+        Called after an entry is dropped, for whatever reason.
+        """
+        pass
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: The number of entries and the entries evicted, expired and invalidated.
+        """
+        return {
+            "entries": len(self),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class LLMResponseCache(ExpiringLRUCache):
+    """
+    Caches the LLM's answers to the chat's user messages.
+
+    An answer is keyed by the LLM's model version, the prompt it was given (the prompt template with
+    the retrieved documents, chat history and knowledge graph filled in), the retrieved document ids
+    and the normalized question. A question that misses is also compared with the cached questions
+    under the same model, prompt and documents: the answer to the most similar one is served if the
+    cosine similarity of their embeddings reaches the similarity threshold.
+
+    Answers are dropped after the TTL, least recently used first over the size limit, and for a
+    corpus table when it is reloaded, see `invalidate_corpus`.
+
+    Usage:
+        response_cache = LLMResponseCache()
+        response = response_cache.get(model_version, prompt)
+        if response is None:
+            response = ...  # ask the LLM
+            response_cache.put(model_version, prompt, response, generate_seconds)
+    """
+
+    def __init__(self, max_entries:int = DEFAULT_RESPONSE_CACHE_SIZE, ttl_seconds:float = DEFAULT_RESPONSE_CACHE_TTL,
+                 similarity_threshold:float = DEFAULT_RESPONSE_CACHE_SIMILARITY):
+        """
+        Args:
+            max_entries (int, optional): The most answers held. Defaults to DEFAULT_RESPONSE_CACHE_SIZE.
+            ttl_seconds (float, optional): The seconds an answer is served. Defaults to DEFAULT_RESPONSE_CACHE_TTL.
+            similarity_threshold (float, optional): The lowest similarity of a near-identical question.
+                                                    Defaults to DEFAULT_RESPONSE_CACHE_SIMILARITY.
+        """
+        super().__init__(max_entries, ttl_seconds)
+        self.similarity_threshold = similarity_threshold
+        self.buckets = defaultdict(set)  # (model version, prompt digest, document ids, embedding model) -> keys
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    @staticmethod
+    def bucket_key(model_version:str, prompt:dict) -> tuple:
+        """
+        Args:
+            model_version (str): The LLM's model version.
+            prompt (dict): The 'prompt_text', 'document_ids' and 'embedding_model' of the user message,
+                           see ChatHandler.get_system_message_prompt.
+
+        Returns:
+            tuple: The key shared by the questions whose answers can stand in for one another.
+        """
+        prompt_digest = hashlib.sha256((prompt["prompt_text"] or "").encode("utf-8")).hexdigest()
+        document_ids = tuple(str(document_id) for document_id in prompt.get("document_ids") or [])
+        return (model_version, prompt_digest, document_ids, str(prompt.get("embedding_model")))
+
+    @staticmethod
+    def unit_vector(vector) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: The vector scaled to length 1, or None if it is missing or all zeros.
+        """
+        if not vector:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, model_version:str, prompt:dict) -> str:
+        """
+        Looks up the answer to the user message of a prompt.
+
+        Args:
+            model_version (str): The LLM's model version.
+            prompt (dict): The user message's 'content', 'prompt_text', 'document_ids', 'embedding_model'
+                           and 'query_vector', see ChatHandler.get_system_message_prompt.
+
+        Returns:
+            str: The cached answer, or None.
+        """
+        bucket_key = LLMResponseCache.bucket_key(model_version, prompt)
+        entry = super().get(bucket_key + (normalize_input(prompt["content"]),))
+        if entry is not None:
+            self.exact_hits += 1
+            self.seconds_saved += entry["generate_seconds"]
+            return entry["response"]
+
+        query_vector = LLMResponseCache.unit_vector(prompt.get("query_vector"))
+        if query_vector is not None and self.similarity_threshold <= 1:
+            best_key = None
+            best_similarity = self.similarity_threshold
+            for key in list(self.buckets.get(bucket_key, ())):
+                other = self.peek(key)
+                if other is None or other["query_vector"] is None or other["query_vector"].shape != query_vector.shape:
+                    continue
+                similarity = float(np.dot(query_vector, other["query_vector"]))
+                if similarity >= best_similarity:
+                    best_key = key
+                    best_similarity = similarity
+            if best_key is not None:
+                entry = super().get(best_key)
+                self.similar_hits += 1
+                self.seconds_saved += entry["generate_seconds"]
+                return entry["response"]
+
+        self.misses += 1
+        return None
+
+    def put(self, model_version:str, prompt:dict, response:str, generate_seconds:float) -> None:
+        """
+        Caches the answer to the user message of a prompt.
+
+        Args:
+            model_version (str): The LLM's model version.
+            prompt (dict): The user message's prompt, see `get`.
+            response (str): The LLM's answer.
+            generate_seconds (float): The seconds the LLM took, counted as saved on each hit.
+        """
+        if not response:
+            return
+        bucket_key = LLMResponseCache.bucket_key(model_version, prompt)
+        key = bucket_key + (normalize_input(prompt["content"]),)
+        super().put(key, {
+            "response": response,
+            "query_vector": LLMResponseCache.unit_vector(prompt.get("query_vector")),
+            "generate_seconds": generate_seconds,
+            "corpus_tables": {corpus_table_of(document_id) for document_id in prompt.get("document_ids") or []},
+        })
+        if key in self.entries:
+            self.buckets[bucket_key].add(key)
+
+    def removed(self, key, value) -> None:
+        bucket_key = key[:-1]
+        bucket = self.buckets.get(bucket_key)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self.buckets[bucket_key]
+
+    def invalidate_corpus(self, corpus_table:str) -> int:
+        """
+        Drops the answers built on documents of a corpus table.
+
+        Args:
+            corpus_table (str): The corpus table that was reloaded.
+
+        Returns:
+            int: The number of answers dropped.
+        """
+        return self.invalidate(lambda key, value: corpus_table in value["corpus_tables"])
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: The cache's size and counters, its hit rate and the LLM seconds its hits saved.
+        """
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return dict(super().stats(),
+            exact_hits = self.exact_hits,
+            similar_hits = self.similar_hits,
+            misses = self.misses,
+            hit_rate = (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            seconds_saved = round(self.seconds_saved, 3),
+        )
+
+
+class RetrievalCache(ExpiringLRUCache):
+    """
+    Caches what fn::retrieve_context_for_message retrieves for the chat's user messages: the query
+    vector, the documents of fn::search_for_documents and the knowledge graph of
+    fn::search_for_relevant_graph or fn::get_graph_detail_for_corpus_doc.
+
+    A retrieval is keyed by the corpus table, the embedding model, the normalized question, the
+    number of chunks and the graph mode. Retrievals are dropped after the TTL, least recently used
+    first over the size limit, and for a corpus table when it is reloaded, see `invalidate_corpus`.
+
+    Usage:
+        retrieval_cache = RetrievalCache()
+        retrieval = retrieval_cache.get(corpus_table, embed_model, content, number_of_chunks, graph_mode)
+        if retrieval is None:
+            retrieval = ...  # search the corpus
+            retrieval_cache.put(corpus_table, embed_model, content, number_of_chunks, graph_mode, retrieval)
+    """
+
+    def __init__(self, max_entries:int = DEFAULT_RETRIEVAL_CACHE_SIZE, ttl_seconds:float = DEFAULT_RETRIEVAL_CACHE_TTL):
+        """
+        Args:
+            max_entries (int, optional): The most retrievals held. Defaults to DEFAULT_RETRIEVAL_CACHE_SIZE.
+            ttl_seconds (float, optional): The seconds a retrieval is served. Defaults to DEFAULT_RETRIEVAL_CACHE_TTL.
+        """
+        super().__init__(max_entries, ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(corpus_table:str, embed_model, content:str, number_of_chunks:int, graph_mode:str) -> tuple:
+        """
+        Args:
+            corpus_table (str): The corpus table searched.
+            embed_model: The id of the embedding model definition, eg ['OPENAI','text-embedding-3-small'].
+            content (str): The user's question.
+            number_of_chunks (int): The number of documents retrieved.
+            graph_mode (str): The graph mode, "" for none.
+
+        Returns:
+            tuple: The key of the retrieval.
+        """
+        return (corpus_table, str(embed_model), normalize_input(content), int(number_of_chunks), graph_mode or "")
+
+    def get(self, corpus_table:str, embed_model, content:str, number_of_chunks:int, graph_mode:str) -> dict:
+        """
+        Looks up the retrieval for a user message, see `key` for the arguments.
+
+        Returns:
+            dict: The cached 'query_vector', 'documents' and 'knowledge_graph', or None.
+        """
+        retrieval = super().get(RetrievalCache.key(corpus_table, embed_model, content, number_of_chunks, graph_mode))
+        if retrieval is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return retrieval
+
+    def put(self, corpus_table:str, embed_model, content:str, number_of_chunks:int, graph_mode:str, retrieval:dict) -> None:
+        """
+        Caches the retrieval for a user message, see `key` for the other arguments.
+
+        Args:
+            retrieval (dict): The 'query_vector', 'documents' and 'knowledge_graph' fn::retrieve_context_for_message returned.
+        """
+        if retrieval is None:
+            return
+        super().put(RetrievalCache.key(corpus_table, embed_model, content, number_of_chunks, graph_mode), retrieval)
+
+    def invalidate_corpus(self, corpus_table:str) -> int:
+        """
+        Drops the retrievals from a corpus table.
+
+        Args:
+            corpus_table (str): The corpus table that was reloaded.
+
+        Returns:
+            int: The number of retrievals dropped.
+        """
+        return self.invalidate(lambda key, value: key[0] == corpus_table)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: The cache's size and counters and its hit rate.
+        """
+        lookups = self.hits + self.misses
+        return dict(super().stats(),
+            hits = self.hits,
+            misses = self.misses,
+            hit_rate = self.hits / lookups if lookups else 0.0,
+        )
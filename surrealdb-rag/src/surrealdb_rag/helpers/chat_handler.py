@@ -1,11 +1,13 @@
 
 """Handles chat-related operations in the application."""
 
+import time
 
 from surrealdb_rag.helpers.params import DatabaseParams, ModelParams, SurrealParams
 
 from surrealdb_rag.helpers.ux_helpers import *
 from surrealdb_rag.helpers.llm_handler import RAGChatHandler
+from surrealdb_rag.helpers.chat_cache import LLMResponseCache, RetrievalCache
 from surrealdb import AsyncSurreal
 
 
@@ -18,15 +20,19 @@ class ChatHandler():
     about chat conversations and individual messages. It also integrates with the LLM handler
     to generate system messages based on user input and chat history.
     """
-    def __init__(self, connection: AsyncSurreal):
+    def __init__(self, connection: AsyncSurreal, response_cache: LLMResponseCache = None, retrieval_cache: RetrievalCache = None):
         """
         Initializes the ChatHandler with a database connection.
 
         Args:
             connection: The SurrealDB connection object.
+            response_cache (LLMResponseCache, optional): The cache of LLM answers to reuse, if any.
+            retrieval_cache (RetrievalCache, optional): The cache of user messages' documents and knowledge graphs to reuse, if any.
         """
 
         self.connection = connection
+        self.response_cache = response_cache
+        self.retrieval_cache = retrieval_cache
     
 
     async def create_chat(self):
@@ -153,7 +159,8 @@ class ChatHandler():
         Creates a new user message in a chat session.
 
         This function saves a user's message to the database, along with information about the
-        corpus table, embedding model, and other relevant parameters.
+        corpus table, embedding model, and other relevant parameters. The documents and knowledge graph
+        of the message are taken from the retrieval cache if it has them, and cached otherwise.
 
         Args:
             chat_id (str): The ID of the chat the message belongs to.
@@ -167,9 +174,13 @@ class ChatHandler():
         Returns:
             dict: A dictionary containing the created 'message' details.
         """
+        retrieval = None
+        if self.retrieval_cache is not None:
+            retrieval = self.retrieval_cache.get(corpus_table, embed_model, content, number_of_chunks, graph_mode)
+
         outcome = SurrealParams.ParseResponseForErrors( await self.connection.query_raw(
                 """RETURN fn::create_user_message($chat_id,$corpus_table, $content,
-                type::thing('embedding_model_definition',$embedding_model),$number_of_chunks,$graph_mode,$openaitoken);""",
+                type::thing('embedding_model_definition',$embedding_model),$number_of_chunks,$graph_mode,$openaitoken,$retrieval);""",
                 params = {
                     "chat_id":chat_id,
                     "corpus_table":corpus_table,
@@ -177,69 +188,68 @@ class ChatHandler():
                     "embedding_model":embed_model,
                     "openaitoken":openai_token,
                     "number_of_chunks":number_of_chunks,
-                    "graph_mode":graph_mode
+                    "graph_mode":graph_mode,
+                    "retrieval":retrieval
                     }    
             ))
         
-        message = outcome["result"][0]["result"]
+        result = outcome["result"][0]["result"]
+        if self.retrieval_cache is not None and retrieval is None:
+            self.retrieval_cache.put(corpus_table, embed_model, content, number_of_chunks, graph_mode, result["retrieval"])
         return {
-                "message" : message
+                "message" : result["message"]
             }
         
 
-    async def create_system_message(
-            self,     
-    chat_id: str,
-    llm_model: str,
-    prompt_template: str,
-    number_of_chats: int,
-    llm_handler: RAGChatHandler):
+    async def get_system_message_prompt(self, chat_id: str, prompt_template: str, number_of_chats: int):
         """
-        Creates a system message in a chat session, generated by the LLM.
-
-        This function retrieves the last user message and prompt, calls the LLM to generate a response,
-        saves the LLM's response as a system message in the database, and optionally updates the chat's title
-        if it's the first message.
+        Retrieves the last user message of a chat and the prompt to answer it with.
 
         Args:
-            chat_id (str): The ID of the chat the message belongs to.
-            llm_model (str): The LLM model used to generate the response.
+            chat_id (str): The ID of the chat.
             prompt_template (str): The template used to generate the prompt for the LLM.
             number_of_chats (int): The number of previous messages to include in the prompt.
-            llm_handler (RAGChatHandler): The LLM handler object.
 
         Returns:
-            dict: A dictionary containing the newly generated 'message' and optionally the 'new_title' of the chat.
+            dict: A dictionary containing the 'prompt_text', the user's 'content', and the
+                  'document_ids', 'embedding_model' and 'query_vector' of their message.
         """
         outcome = SurrealParams.ParseResponseForErrors( await self.connection.query_raw(
             """RETURN fn::get_last_user_message_input_and_prompt($chat_id,$prompt,$message_memory_length);""",params = {"chat_id":chat_id,"prompt":prompt_template,"message_memory_length":number_of_chats}
         ))
         result =  outcome["result"][0]["result"]
-        prompt_text = result["prompt_text"]
-        content = result["content"]
-        #call the LLM
-       
-        llm_response = await llm_handler.get_chat_response(prompt_text,content)
-        
+        return {
+                "prompt_text": result["prompt_text"],
+                "content": result["content"],
+                "document_ids": result.get("document_ids") or [],
+                "embedding_model": result.get("embedding_model"),
+                "query_vector": result.get("query_vector")
+            }
+
+    async def save_system_message(
+            self,
+    chat_id: str,
+    llm_model: str,
+    prompt_text: str,
+    llm_response: str):
+        """
+        Saves the LLM's response as a system message in the database.
+
+        The chat's title is not touched, see `generate_chat_title`.
+
+        Args:
+            chat_id (str): The ID of the chat the message belongs to.
+            llm_model (str): The LLM model used to generate the response.
+            prompt_text (str): The prompt the LLM was given.
+            llm_response (str): The LLM's response.
+
+        Returns:
+            dict: A dictionary containing the saved 'message'.
+        """
         #save the response in the DB
         outcome = SurrealParams.ParseResponseForErrors(await self.connection.query_raw(
             """RETURN fn::create_system_message($chat_id,$llm_response,$llm_model,$prompt_text);""",params = {"chat_id":chat_id,"llm_response":llm_response,"llm_model":llm_model,"prompt_text":prompt_text}
             ))
-        
-        title = await self.connection.query(
-            """RETURN fn::get_chat_title($chat_id);""",params = {"chat_id":chat_id}
-        )
-        new_title = ""
-        if title == "Untitled chat":
-            first_message_text = await self.connection.query(
-                "RETURN fn::get_first_message($chat_id);",params={"chat_id":chat_id}
-            )
-            system_prompt = "You are a conversation title generator for a ChatGPT type app. Respond only with a simple title using the user input."
-            new_title = await llm_handler.get_short_plain_text_response(system_prompt,first_message_text)
-            #update chat title in database
-            SurrealParams.ParseResponseForErrors(await self.connection.query_raw(
-                """UPDATE type::record($chat_id) SET title=$title;""",params = {"chat_id":chat_id,"title":new_title}    
-            ))
 
         message = outcome["result"][0]["result"]
         
@@ -248,7 +258,82 @@ class ChatHandler():
         if message_think["think"]:
             message["think"] = message_think["think"]
         return {
-                "new_title": new_title.strip(),
                 "message": message
             }
+
+    async def get_chat_title(self, chat_id: str) -> str:
+        """
+        Args:
+            chat_id (str): The ID of the chat.
+
+        Returns:
+            str: The chat's title, "Untitled chat" until one is generated.
+        """
+        return await self.connection.query(
+            """RETURN fn::get_chat_title($chat_id);""",params = {"chat_id":chat_id}
+        )
+
+    async def generate_chat_title(self, chat_id: str, llm_handler: RAGChatHandler) -> str:
+        """
+        Titles an untitled chat from its first user message with the LLM, and saves the title.
+
+        The app runs this in the background once the first answer of a chat is saved, so the
+        answer doesn't wait for the title's round trips and LLM call.
+
+        Args:
+            chat_id (str): The ID of the chat.
+            llm_handler (RAGChatHandler): The LLM handler object, used to generate the title.
+
+        Returns:
+            str: The new title, or "" if the chat already had one.
+        """
+        title = await self.get_chat_title(chat_id)
+        if title != "Untitled chat":
+            return ""
+
+        first_message_text = await self.connection.query(
+            "RETURN fn::get_first_message($chat_id);",params={"chat_id":chat_id}
+        )
+        system_prompt = "You are a conversation title generator for a ChatGPT type app. Respond only with a simple title using the user input."
+        new_title = (await llm_handler.get_short_plain_text_response(system_prompt,first_message_text)).strip()
+        #update chat title in database
+        SurrealParams.ParseResponseForErrors(await self.connection.query_raw(
+            """UPDATE type::record($chat_id) SET title=$title;""",params = {"chat_id":chat_id,"title":new_title}    
+        ))
+        return new_title
+
+    async def create_system_message(
+            self,     
+    chat_id: str,
+    llm_model: str,
+    prompt_template: str,
+    number_of_chats: int,
+    llm_handler: RAGChatHandler):
+        """
+        Creates a system message in a chat session, generated by the LLM.
+
+        This function retrieves the last user message and prompt, calls the LLM to generate a response
+        unless the response cache has one, and saves the LLM's response as a system message in the database.
+        The chat's title is generated separately, see `generate_chat_title`.
+
+        Args:
+            chat_id (str): The ID of the chat the message belongs to.
+            llm_model (str): The LLM model used to generate the response.
+            prompt_template (str): The template used to generate the prompt for the LLM.
+            number_of_chats (int): The number of previous messages to include in the prompt.
+            llm_handler (RAGChatHandler): The LLM handler object.
+
+        Returns:
+            dict: A dictionary containing the newly generated 'message'.
+        """
+        prompt = await self.get_system_message_prompt(chat_id, prompt_template, number_of_chats)
+        model_version = llm_handler.model_data["model_version"]
+        llm_response = self.response_cache.get(model_version, prompt) if self.response_cache is not None else None
+        if llm_response is None:
+            #call the LLM
+            start = time.perf_counter()
+            llm_response = await llm_handler.get_chat_response(prompt["prompt_text"],prompt["content"])
+            if self.response_cache is not None:
+                self.response_cache.put(model_version, prompt, llm_response, time.perf_counter() - start)
         
+        return await self.save_system_message(chat_id, llm_model, prompt["prompt_text"], llm_response)
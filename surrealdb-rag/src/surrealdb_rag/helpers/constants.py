@@ -20,6 +20,10 @@ DEFAULT_WIKI_PATH = "data/vector_database_wikipedia_articles_embedded.csv"
 """
 The default path to the extracted CSV file containing the Wikipedia articles.
 """
+DEFAULT_WIKI_VECTORS_PATH = "data/vector_database_wikipedia_articles_embedded.parquet"
+"""
+The default path to the Parquet file containing the Wikipedia articles with GloVe and FastText vectors.
+"""
 
 DEFAULT_GLOVE_URL = "https://nlp.stanford.edu/data/glove.6B.zip"
 """
@@ -47,13 +51,13 @@ DEFAULT_EDGAR_FOLDER_FILE_INDEX = "data/edgar/index.csv"
 """
 The default path to the CSV file that indexes the downloaded EDGAR filings.
 """
-DEFAULT_EDGAR_PATH = "data/vector_database_edgar_data_embedded.csv"
+DEFAULT_EDGAR_PATH = "data/vector_database_edgar_data_embedded.parquet"
 """
-The default path to the CSV file containing EDGAR data with embeddings.
+The default path to the Parquet file containing EDGAR data with embeddings.
 """
-DEFAULT_EDGAR_GRAPH_PATH = "data/graph_database_edgar_data.csv"
+DEFAULT_EDGAR_GRAPH_PATH = "data/graph_database_edgar_data.parquet"
 """
-The default path to the CSV file containing EDGAR graph data (entities and relationships).
+The default path to the Parquet file containing EDGAR graph data (entities and relationships).
 """
 FS_EDGAR_PATH = "data/custom_fast_edgar_text.txt"
 """
@@ -67,6 +71,18 @@ EDGAR_PUBLIC_COMPANIES_LIST = "data/public_companies.csv"
 """
 The default path to the CSV file containing metadata about public companies.
 """
+EDGAR_PUBLIC_COMPANIES_INDEX = "data/public_companies.index.pkl"
+"""
+The company name index built from the public companies file for fuzzy company matching. It is rebuilt when the companies file is newer.
+"""
+DEAD_LETTER_FOLDER = "data/dead_letter/"
+"""
+The folder the insert scripts write batches that failed after retrying to, one json lines file per table.
+"""
+RUN_MANIFEST_PATH = "data/run_manifest.sqlite"
+"""
+The SQLite file the insert scripts and the graph extractor record their progress in, so a failed run can be resumed with -rs.
+"""
 
 # --- Schema Definition Files ---
 
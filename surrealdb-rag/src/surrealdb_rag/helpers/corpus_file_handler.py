@@ -0,0 +1,467 @@
+"""Read and write the intermediate corpus files that carry embedding vectors."""
+
+import ast
+import csv
+import glob
+import math
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+PARQUET_EXTENSION = ".parquet"
+"""
+Corpus files with this extension are stored as Parquet, anything else is treated as a legacy CSV.
+"""
+
+PARQUET_ROW_GROUP_SIZE = 1000
+"""
+The number of rows `CorpusFileWriter` buffers before writing a Parquet row group.
+"""
+
+STRING = pa.string()
+INT = pa.int64()
+FLOAT = pa.float64()
+STRING_LIST = pa.list_(pa.string())
+"""
+Column types for the non-vector columns of a corpus file schema.
+"""
+
+
+def is_parquet_file(file_path:str) -> bool:
+    """
+    Checks if a corpus file path refers to a Parquet file.
+
+    Args:
+        file_path (str): The path of the corpus file.
+
+    Returns:
+        bool: True for a Parquet file, False for a legacy CSV.
+    """
+    return os.path.splitext(file_path)[1].lower() == PARQUET_EXTENSION
+
+
+def is_missing(value) -> bool:
+    """
+    Checks if a cell value is empty (None or a NaN read by pandas).
+
+    Args:
+        value: The cell value.
+
+    Returns:
+        bool: True if the value is missing.
+    """
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def parse_vector_string(value) -> np.ndarray:
+    """
+    Parses a vector stored as a list literal in a legacy CSV cell, eg "[0.1, 0.2]".
+
+    Args:
+        value (str): The cell value.
+
+    Returns:
+        np.ndarray: The float32 vector, or None if the cell is empty.
+    """
+    if is_missing(value):
+        return None
+    return np.fromstring(str(value).strip()[1:-1], sep=",", dtype=np.float32)
+
+
+def vectors_to_arrow(vectors, dimensions:int) -> pa.FixedSizeListArray:
+    """
+    Converts vectors to an Arrow fixed size list array of float32.
+
+    Args:
+        vectors: A 2D numpy array, or a list of vectors (arrays or lists) where None marks a missing vector.
+        dimensions (int): The number of dimensions of each vector.
+
+    Returns:
+        pa.FixedSizeListArray: The vectors as a single contiguous float32 buffer.
+    """
+    if isinstance(vectors, np.ndarray) and vectors.ndim == 2:
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        mask = None
+    else:
+        matrix = np.zeros((len(vectors), dimensions), dtype=np.float32)
+        missing = np.zeros(len(vectors), dtype=bool)
+        for i, vector in enumerate(vectors):
+            if is_missing(vector):
+                missing[i] = True
+            else:
+                matrix[i] = vector
+        mask = pa.array(missing) if missing.any() else None
+    return pa.FixedSizeListArray.from_arrays(pa.array(matrix.reshape(-1)), dimensions, mask=mask)
+
+
+def arrow_to_vectors(column: pa.ChunkedArray) -> list[np.ndarray]:
+    """
+    Converts an Arrow fixed size list column to numpy vectors without copying the values.
+
+    Args:
+        column (pa.ChunkedArray): The vector column.
+
+    Returns:
+        list[np.ndarray]: One read-only float32 row view per record, None where the vector is missing.
+    """
+    vectors = []
+    for chunk in column.chunks:
+        dimensions = chunk.type.list_size
+        # values ignores the slice offset of the chunk, so apply it here
+        values = chunk.values.to_numpy(zero_copy_only=False)
+        matrix = values[chunk.offset * dimensions:(chunk.offset + len(chunk)) * dimensions].reshape(len(chunk), dimensions)
+        if chunk.null_count:
+            missing = chunk.is_null().to_numpy(zero_copy_only=False)
+            vectors.extend(None if is_null else vector for vector, is_null in zip(matrix, missing))
+        else:
+            vectors.extend(matrix)
+    return vectors
+
+
+def coerce_value(value, data_type: pa.DataType):
+    """
+    Converts a cell value to the python type Arrow expects for a column.
+
+    Args:
+        value: The cell value.
+        data_type (pa.DataType): The type of the column.
+
+    Returns:
+        The converted value, or None if the value is missing.
+    """
+    if pa.types.is_list(data_type):
+        if not isinstance(value, (list, tuple, np.ndarray)):
+            return None
+        return [str(item) for item in value]
+    if is_missing(value) or (isinstance(value, str) and value == "" and data_type != STRING):
+        return None
+    if pa.types.is_integer(data_type):
+        return int(float(value))
+    if pa.types.is_floating(data_type):
+        return float(value)
+    return str(value)
+
+
+class CorpusFileWriter():
+    """
+    Writes corpus rows with embedding vectors to a Parquet file, or to a CSV for legacy consumers.
+
+    Rows are written like csv.DictWriter rows. For Parquet the vectors are stored as fixed size
+    float32 list columns; the dimensions are taken from the first vector written to each column.
+    The Parquet file is written to a temporary path and moved into place on close. Leaving a
+    `with` block on an exception calls `discard` instead, so an interrupted run leaves the
+    previous file untouched. CSV files are written in place.
+    """
+
+    def __init__(self, file_path:str, schema:dict, vector_columns:list[str], append:bool = False,
+                 row_group_size:int = PARQUET_ROW_GROUP_SIZE):
+        """
+        Initializes the CorpusFileWriter.
+
+        Args:
+            file_path (str): The path of the output file. The format is chosen by the extension.
+            schema (dict): Maps each non-vector column name to its type (STRING, INT, FLOAT or STRING_LIST).
+            vector_columns (list[str]): The names of the vector columns.
+            append (bool, optional): Keep the rows of an existing file. Defaults to False.
+            row_group_size (int, optional): Rows per Parquet row group. Defaults to PARQUET_ROW_GROUP_SIZE.
+        """
+        self.file_path = file_path
+        self.schema = schema
+        self.vector_columns = vector_columns
+        self.fieldnames = list(schema.keys()) + list(vector_columns)
+        self.row_group_size = row_group_size
+        self.append = append and os.path.exists(file_path)
+        self.rows = []
+        self.writer = None
+        self.file = None
+
+        if not is_parquet_file(file_path):
+            self.file = open(file_path, "a" if self.append else "w", newline='')
+            self.writer = csv.DictWriter(self.file, self.fieldnames)
+            if not self.append:
+                self.writer.writeheader()
+
+    def writerow(self, row:dict) -> None:
+        """
+        Writes a row. Missing columns are written as empty values.
+
+        Args:
+            row (dict): The row keyed by column name. Vectors may be numpy arrays or lists.
+        """
+        if self.file:
+            row = row.copy()
+            for column in self.vector_columns:
+                if not is_missing(row.get(column)):
+                    row[column] = np.asarray(row[column]).tolist()
+            self.writer.writerow(row)
+            return
+
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def writerows(self, rows:list[dict]) -> None:
+        """
+        Writes a list of rows.
+
+        Args:
+            rows (list[dict]): The rows keyed by column name.
+        """
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self) -> None:
+        """
+        Writes the buffered rows to the Parquet file as a row group.
+        """
+        if not self.rows:
+            return
+        if not self.writer:
+            self.open_parquet_writer()
+
+        arrays = []
+        for field in self.writer.schema:
+            if field.name in self.vector_columns:
+                arrays.append(vectors_to_arrow([row.get(field.name) for row in self.rows], field.type.list_size))
+            else:
+                arrays.append(pa.array([coerce_value(row.get(field.name), field.type) for row in self.rows], type=field.type))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.writer.schema))
+        self.rows = []
+
+    def open_parquet_writer(self) -> None:
+        """
+        Creates the Parquet writer, working out the vector dimensions from the buffered rows
+        and copying across the rows of the existing file when appending.
+
+        Raises:
+            ValueError: If a vector column has no vectors to take the dimensions from.
+        """
+        existing_file = pq.ParquetFile(self.file_path) if self.append else None
+        if existing_file:
+            schema = existing_file.schema_arrow
+        else:
+            fields = [pa.field(name, data_type) for name, data_type in self.schema.items()]
+            for column in self.vector_columns:
+                vector = next((row.get(column) for row in self.rows if not is_missing(row.get(column))), None)
+                if vector is None:
+                    raise ValueError(f"Cannot work out the dimensions of vector column '{column}' as the first rows have no vectors")
+                fields.append(pa.field(column, pa.list_(pa.float32(), len(vector))))
+            schema = pa.schema(fields)
+
+        self.writer = pq.ParquetWriter(self.file_path + ".tmp", schema)
+        if existing_file:
+            for batch in existing_file.iter_batches():
+                self.writer.write_batch(batch)
+
+    def close(self) -> None:
+        """
+        Writes any buffered rows and closes the file.
+        """
+        if self.file:
+            self.file.close()
+            return
+
+        self.flush()
+        if self.writer:
+            self.writer.close()
+            os.replace(self.file_path + ".tmp", self.file_path)
+
+    def discard(self) -> None:
+        """
+        Drops the buffered rows and closes the file without moving the Parquet file into place,
+        leaving the previous file, if any, as it was.
+        """
+        self.rows = []
+        if self.file:
+            self.file.close()
+            return
+
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+            if os.path.exists(self.file_path + ".tmp"):
+                os.remove(self.file_path + ".tmp")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def part_file_path(file_path:str, part_number:int) -> str:
+    """
+    Args:
+        file_path (str): The path of the corpus file.
+        part_number (int): The number of the part.
+
+    Returns:
+        str: The path of a part file of the corpus file, with the same extension, eg "graph.part-0003.parquet".
+    """
+    root, extension = os.path.splitext(file_path)
+    return f"{root}.part-{part_number:04d}{extension}"
+
+
+def list_part_files(file_path:str) -> list[str]:
+    """
+    Args:
+        file_path (str): The path of the corpus file.
+
+    Returns:
+        list[str]: The paths of the part files written for the corpus file, in part order.
+    """
+    root, extension = os.path.splitext(file_path)
+    return sorted(glob.glob(f"{glob.escape(root)}.part-[0-9][0-9][0-9][0-9]{extension}"))
+
+
+def merge_part_files(file_path:str, part_paths:list[str], append:bool = True) -> None:
+    """
+    Appends the rows of part files to a corpus file, creating it if needed, and deletes the parts.
+
+    Each row is copied once, so a run that checkpoints into part files and merges them at the end
+    writes its rows twice whatever the number of checkpoints. The Parquet file is written to a
+    temporary path and moved into place, so an interrupted merge leaves the file and parts as they were.
+
+    Args:
+        file_path (str): The path of the corpus file.
+        part_paths (list[str]): The part files, see `list_part_files`.
+        append (bool, optional): Keep the rows of an existing file, else it is replaced. Defaults to True.
+    """
+    if not part_paths:
+        return
+
+    append = append and os.path.exists(file_path)
+    if is_parquet_file(file_path):
+        source_paths = ([file_path] if append else []) + part_paths
+        schema = pq.ParquetFile(source_paths[0]).schema_arrow
+        with pq.ParquetWriter(file_path + ".tmp", schema) as writer:
+            for source_path in source_paths:
+                for batch in pq.ParquetFile(source_path).iter_batches():
+                    writer.write_batch(batch)
+        os.replace(file_path + ".tmp", file_path)
+    else:
+        has_header = append
+        with open(file_path, "a" if append else "w", newline='') as f:
+            for part_path in part_paths:
+                with open(part_path, newline='') as part:
+                    if has_header:
+                        part.readline()
+                    shutil.copyfileobj(part, f)
+                has_header = True
+
+    for part_path in part_paths:
+        os.remove(part_path)
+
+
+def table_to_dataframe(table: pa.Table, vector_columns:list[str], list_columns:list[str] = []) -> pd.DataFrame:
+    """
+    Converts an Arrow table read from a Parquet corpus file to a DataFrame with numpy vector cells.
+
+    Args:
+        table (pa.Table): The table.
+        vector_columns (list[str]): The names of the vector columns.
+        list_columns (list[str], optional): The names of list of string columns. Defaults to [].
+
+    Returns:
+        pd.DataFrame: The rows, with each vector a float32 numpy array and each list a python list.
+    """
+    vector_columns = [column for column in vector_columns if column in table.column_names]
+    list_columns = [column for column in list_columns if column in table.column_names]
+    df = table.drop_columns(vector_columns + list_columns).to_pandas()
+    for column in list_columns:
+        df[column] = pd.Series(table[column].to_pylist(), index=df.index, dtype=object)
+    for column in vector_columns:
+        df[column] = pd.Series(arrow_to_vectors(table[column]), index=df.index, dtype=object)
+    return df[table.column_names]
+
+
+def parse_csv_dataframe(df: pd.DataFrame, vector_columns:list[str], list_columns:list[str] = []) -> pd.DataFrame:
+    """
+    Parses the vector and list cells of a DataFrame read from a legacy CSV corpus file.
+
+    Args:
+        df (pd.DataFrame): The rows read from the CSV.
+        vector_columns (list[str]): The names of the vector columns.
+        list_columns (list[str], optional): The names of list of string columns. Defaults to [].
+
+    Returns:
+        pd.DataFrame: The rows, with each vector a float32 numpy array and each list a python list.
+    """
+    for column in list_columns:
+        if column in df.columns:
+            df[column] = pd.Series([ast.literal_eval(value) if isinstance(value, str) else [] for value in df[column]],
+                                   index=df.index, dtype=object)
+    for column in vector_columns:
+        if column in df.columns:
+            df[column] = pd.Series([parse_vector_string(value) for value in df[column]], index=df.index, dtype=object)
+    return df
+
+
+def read_corpus_file(file_path:str, vector_columns:list[str], columns:list[str] = None, list_columns:list[str] = []) -> pd.DataFrame:
+    """
+    Reads a Parquet or legacy CSV corpus file into a DataFrame.
+
+    Args:
+        file_path (str): The path of the corpus file.
+        vector_columns (list[str]): The names of the vector columns.
+        columns (list[str], optional): The columns to read. Defaults to all columns.
+        list_columns (list[str], optional): The names of list of string columns. Defaults to [].
+
+    Returns:
+        pd.DataFrame: The rows, with each vector a float32 numpy array and each list a python list.
+    """
+    if is_parquet_file(file_path):
+        return table_to_dataframe(pq.read_table(file_path, columns=columns), vector_columns, list_columns)
+    return parse_csv_dataframe(pd.read_csv(file_path, usecols=columns), vector_columns, list_columns)
+
+
+def iter_corpus_file(file_path:str, batch_size:int, vector_columns:list[str], columns:list[str] = None, list_columns:list[str] = []):
+    """
+    Reads a Parquet or legacy CSV corpus file in batches.
+
+    Args:
+        file_path (str): The path of the corpus file.
+        batch_size (int): The number of rows in each batch.
+        vector_columns (list[str]): The names of the vector columns.
+        columns (list[str], optional): The columns to read. Defaults to all columns.
+        list_columns (list[str], optional): The names of list of string columns. Defaults to [].
+
+    Yields:
+        pd.DataFrame: Each batch of rows, with each vector a float32 numpy array and each list a python list.
+    """
+    if is_parquet_file(file_path):
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=batch_size, columns=columns):
+            yield table_to_dataframe(pa.Table.from_batches([batch]), vector_columns, list_columns)
+    else:
+        with pd.read_csv(file_path, usecols=columns, chunksize=batch_size) as csv_chunk_iterator:
+            for chunk_df in csv_chunk_iterator:
+                yield parse_csv_dataframe(chunk_df, vector_columns, list_columns)
+
+
+def count_corpus_file_rows(file_path:str, chunk_size:int = 1000) -> int:
+    """
+    Counts the rows of a corpus file. Parquet files are counted from their metadata; CSV files
+    are read in chunks with pandas so newlines embedded in fields are handled.
+
+    Args:
+        file_path (str): The path of the corpus file.
+        chunk_size (int, optional): The number of CSV rows to read in each chunk. Defaults to 1000.
+
+    Returns:
+        int: The number of rows in the file.
+    """
+    if is_parquet_file(file_path):
+        return pq.ParquetFile(file_path).metadata.num_rows
+    total_rows = 0
+    with pd.read_csv(file_path, chunksize=chunk_size) as csv_chunk_iterator:
+        for chunk_df in csv_chunk_iterator:
+            total_rows += len(chunk_df)
+    return total_rows
@@ -1,6 +1,8 @@
+import asyncio
+
 import openai
 import ollama
-from ollama import generate,GenerateResponse
+from ollama import GenerateResponse
 
 
 import google.generativeai as genai 
@@ -32,6 +34,63 @@ A dictionary mapping embedding model names to their corresponding field names
 in the database and their model definitions (trainer and version).
 """
 
+LLM_PROVIDER_LIMITS = {
+    "OPENAI": {"max_concurrency": 8, "timeout": 120},
+    "GOOGLE": {"max_concurrency": 8, "timeout": 120},
+    "OLLAMA": {"max_concurrency": 2, "timeout": 300},
+}
+"""
+The most chat requests the app sends to each LLM platform at once, and the seconds one may take.
+Requests over the limit wait for a running one to finish. A streamed OpenAI or Ollama response may
+take as long as it needs as long as each chunk arrives within the timeout. SurrealDB hosted ("SQL")
+models count against the limit of their platform.
+"""
+
+
+EVENT_LOOP_RESOURCES = {}
+"""
+The shared LLM clients and provider semaphores of each event loop, by loop. Their connections and
+waiters belong to the loop they are first used on, so each loop (the app's, or each asyncio.run of
+a script) gets its own, see `loop_resources`.
+"""
+
+
+def loop_resources() -> dict:
+    """
+    Returns:
+        dict: The shared clients and semaphores of the running event loop, dropping those of closed loops
+              when a new loop first asks for them.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in EVENT_LOOP_RESOURCES:
+        for closed_loop in [other_loop for other_loop in EVENT_LOOP_RESOURCES if other_loop.is_closed()]:
+            del EVENT_LOOP_RESOURCES[closed_loop]
+        EVENT_LOOP_RESOURCES[loop] = {}
+    return EVENT_LOOP_RESOURCES[loop]
+
+
+def openai_async_client(api_key:str) -> openai.AsyncOpenAI:
+    """
+    Returns:
+        openai.AsyncOpenAI: The running loop's shared client for an API key, so requests reuse its connections.
+    """
+    resources = loop_resources()
+    key = ("OPENAI", api_key)
+    if key not in resources:
+        resources[key] = openai.AsyncOpenAI(api_key=api_key, timeout=LLM_PROVIDER_LIMITS["OPENAI"]["timeout"])
+    return resources[key]
+
+
+def ollama_async_client() -> ollama.AsyncClient:
+    """
+    Returns:
+        ollama.AsyncClient: The running loop's shared client for the Ollama host (OLLAMA_HOST, or the local default).
+    """
+    resources = loop_resources()
+    if "OLLAMA" not in resources:
+        resources["OLLAMA"] = ollama.AsyncClient(timeout=LLM_PROVIDER_LIMITS["OLLAMA"]["timeout"])
+    return resources["OLLAMA"]
+
 
 class ModelListHandler():
     
@@ -127,6 +186,28 @@ class RAGChatHandler():
         self.model_params = model_params
         self.connection = connection
 
+    """
+        Returns the semaphore that limits the concurrent requests to the model's platform.
+        There is one per platform and event loop, created on first use, see LLM_PROVIDER_LIMITS.
+
+        Returns:
+            asyncio.Semaphore: The platform's semaphore.
+        """
+    def provider_semaphore(self):
+        platform = self.model_data["platform"]
+        resources = loop_resources()
+        key = ("semaphore", platform)
+        if key not in resources:
+            resources[key] = asyncio.Semaphore(LLM_PROVIDER_LIMITS[platform]["max_concurrency"])
+        return resources[key]
+
+    """
+        Returns:
+            float: The seconds a request to the model's platform may take.
+        """
+    def provider_timeout(self):
+        return LLM_PROVIDER_LIMITS[self.model_data["platform"]]["timeout"]
+
 
     """
     Parses a string containing <think> tags and extracts the content.
@@ -239,6 +320,9 @@ class RAGChatHandler():
     """
         Gets a chat response based on the model's host.
 
+        The request waits its turn under the platform's concurrency limit and is cancelled with a
+        TimeoutError after the platform's timeout, see LLM_PROVIDER_LIMITS.
+
         Args:
             prompt_with_context (str): The prompt with context.
             input (str): The user input.
@@ -252,15 +336,49 @@ class RAGChatHandler():
         match self.model_data["host"]:
             case "SQL":
                 # Gets response from SurrealDB.
-                return await self.get_chat_response_from_surreal(prompt_with_context,input)
+                response = self.get_chat_response_from_surreal(prompt_with_context,input)
             case "API":
                 # Gets response from API.
-                return self.get_chat_response_from_api(prompt_with_context,input)
+                response = self.get_chat_response_from_api(prompt_with_context,input)
             case "OLLAMA":
                 # Gets response from Ollama.
-                return self.get_chat_response_from_ollama(prompt_with_context,input)
+                response = self.get_chat_response_from_ollama(prompt_with_context,input)
             case _:
                 raise SystemError(f"Invalid host method {self.model_data["host"]}") 
+        async with self.provider_semaphore():
+            return await asyncio.wait_for(response, self.provider_timeout())
+
+    """
+        Streams a chat response based on the model's host, yielding the text as the provider generates it.
+
+        SurrealDB's fn::openai_chat_complete and fn::gemini_chat_complete return the whole completion
+        from their http::post, so the "SQL" host yields it as a single chunk.
+
+        The stream holds a place under the platform's concurrency limit until it ends, see
+        LLM_PROVIDER_LIMITS for its timeout.
+
+        Args:
+            prompt_with_context (str): The prompt with context.
+            input (str): The user input.
+
+        Yields:
+            str: The chunks of the chat response, in order.
+        """
+    async def stream_chat_response(self,prompt_with_context:str,input:str):
+
+        # Matches the model's host and streams from the appropriate method.
+        async with self.provider_semaphore():
+            match self.model_data["host"]:
+                case "SQL":
+                    yield await asyncio.wait_for(self.get_chat_response_from_surreal(prompt_with_context,input), self.provider_timeout())
+                case "API":
+                    async for chunk in self.stream_chat_response_from_api(prompt_with_context,input):
+                        yield chunk
+                case "OLLAMA":
+                    async for chunk in self.stream_chat_response_from_ollama(prompt_with_context,input):
+                        yield chunk
+                case _:
+                    raise SystemError(f"Invalid host method {self.model_data["host"]}") 
 
     """
         Gets a chat response from an API based on the model's platform.
@@ -272,19 +390,40 @@ class RAGChatHandler():
         Returns:
             str: The chat response from the API.
         """
-    def get_chat_response_from_api(self,prompt_with_context:str,input:str):
+    async def get_chat_response_from_api(self,prompt_with_context:str,input:str):
         # Matches the model's platform and calls the appropriate method.
         match self.model_data["platform"]:
             case "OPENAI":
                 # Gets response from OpenAI API.
-                return self.get_chat_openai_response_from_api(prompt_with_context,input)
+                return await self.get_chat_openai_response_from_api(prompt_with_context,input)
             case "GOOGLE":
                 # Gets response from Google Gemini API.
-                return self.get_chat_gemini_response_from_api(prompt_with_context,input)
+                return await self.get_chat_gemini_response_from_api(prompt_with_context,input)
             case _:
                 raise SystemError(f"Error in outcome: Invalid model for API execution {self.model_data["platform"]}") 
      
      
+    """
+        Streams a chat response from an API based on the model's platform.
+
+        Args:
+            prompt_with_context (str): The prompt with context.
+            input (str): The user input.
+
+        Returns:
+            AsyncIterator[str]: The chunks of the chat response from the API.
+        """
+    def stream_chat_response_from_api(self,prompt_with_context:str,input:str):
+        # Matches the model's platform and calls the appropriate method.
+        match self.model_data["platform"]:
+            case "OPENAI":
+                return self.stream_chat_openai_response_from_api(prompt_with_context,input)
+            case "GOOGLE":
+                return self.stream_chat_gemini_response_from_api(prompt_with_context,input)
+            case _:
+                raise SystemError(f"Error in outcome: Invalid model for API execution {self.model_data["platform"]}") 
+
+
     """
         Gets a chat response from SurrealDB based on the model's platform.
 
@@ -369,7 +508,7 @@ class RAGChatHandler():
         Returns:
             str: The OpenAI chat response.
         """
-    def get_chat_openai_response_from_api(self,prompt_with_context:str,input:str):
+    async def get_chat_openai_response_from_api(self,prompt_with_context:str,input:str):
         
         # Constructs the messages for the OpenAI API.
         messages = [
@@ -382,26 +521,61 @@ class RAGChatHandler():
                 "content": input
             }
         ]
-        # Sets the OpenAI API key.
-        openai.api_key = self.model_params.openai_token
-        if openai.api_key is None:
+        if self.model_params.openai_token is None:
             raise ValueError("OPENAI_API_KEY environment variable not set.")
         try:
             # Calls the OpenAI chat completions API.
-            response = openai.chat.completions.create(
+            response = await openai_async_client(self.model_params.openai_token).chat.completions.create(
                 model=self.model_data["model_version"],
                 messages=messages,
                 temperature=self.model_data["temperature"]
             )
             # Returns the content of the response.
             return response.choices[0].message.content
-        except openai.error.OpenAIError as e:
+        except openai.OpenAIError as e:
             print(f"An error occurred: {e}")
             return None
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
             return None
 
+    """
+        Streams a chat response from the OpenAI API.
+
+        Args:
+            prompt_with_context (str): The prompt with context.
+            input (str): The user input.
+
+        Yields:
+            str: The content of each chunk of the OpenAI chat response.
+        """
+    async def stream_chat_openai_response_from_api(self,prompt_with_context:str,input:str):
+
+        # Constructs the messages for the OpenAI API.
+        messages = [
+            {
+                "role": "system",
+                "content": prompt_with_context
+            },
+            {
+                "role": "user",
+                "content": input
+            }
+        ]
+        if self.model_params.openai_token is None:
+            raise ValueError("OPENAI_API_KEY environment variable not set.")
+        # Calls the OpenAI chat completions API, which sends the completion as it is generated.
+        response = await openai_async_client(self.model_params.openai_token).chat.completions.create(
+            model=self.model_data["model_version"],
+            messages=messages,
+            temperature=self.model_data["temperature"],
+            stream=True
+        )
+        async for chunk in response:
+            # The last chunk has an empty delta.
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
     """
         Gets a chat response from the Google Gemini API.
 
@@ -412,7 +586,7 @@ class RAGChatHandler():
         Returns:
             str: The Gemini chat response.
         """
-    def get_chat_gemini_response_from_api(self,prompt_with_context:str,input:str):
+    async def get_chat_gemini_response_from_api(self,prompt_with_context:str,input:str):
         
         # Constructs the messages for the Gemini API.
         messages = [
@@ -427,10 +601,39 @@ class RAGChatHandler():
         # Initializes the GenerativeModel with the model version.
         model = genai.GenerativeModel(self.model_data["model_version"])
         # Generates the content from the model.
-        response = model.generate_content(messages)
+        response = await model.generate_content_async(messages, request_options={"timeout": self.provider_timeout()})
         # Returns the text content of the response.
         return response.text
 
+    """
+        Streams a chat response from the Google Gemini API.
+
+        Args:
+            prompt_with_context (str): The prompt with context.
+            input (str): The user input.
+
+        Yields:
+            str: The text of each chunk of the Gemini chat response.
+        """
+    async def stream_chat_gemini_response_from_api(self,prompt_with_context:str,input:str):
+
+        # Constructs the messages for the Gemini API.
+        messages = [
+            {
+                "text": prompt_with_context
+            },
+            {
+                "text": input
+            }
+        ]
+        genai.configure(api_key=self.model_params.gemini_token)
+        # Initializes the GenerativeModel with the model version.
+        model = genai.GenerativeModel(self.model_data["model_version"])
+        # Generates the content from the model, a chunk at a time.
+        response = await model.generate_content_async(messages, stream=True, request_options={"timeout": self.provider_timeout()})
+        async for chunk in response:
+            yield chunk.text
+
     """
         Gets a chat response from Ollama.
 
@@ -441,7 +644,7 @@ class RAGChatHandler():
         Returns:
             str: The Ollama chat response.
         """
-    def get_chat_response_from_ollama(self,prompt_with_context:str,input:str):
+    async def get_chat_response_from_ollama(self,prompt_with_context:str,input:str):
         
         # Constructs the messages for Ollama.
         messages = [
@@ -455,9 +658,35 @@ class RAGChatHandler():
             }
         ]
         # Generates the response from Ollama.
-        response: GenerateResponse = generate(model=self.model_data["model_version"], prompt=str(messages))
+        response: GenerateResponse = await ollama_async_client().generate(model=self.model_data["model_version"], prompt=str(messages))
         # Optional: Parse DeepSeek response if needed.
         #parsed_response = parse_deepseek_response(response.response)
         #return {"response":response, "think": parsed_response["think"],"content":parsed_response["content"]}
         return response.response
-    
+
+    """
+        Streams a chat response from Ollama.
+
+        Args:
+            prompt_with_context (str): The prompt with context.
+            input (str): The user input.
+
+        Yields:
+            str: The text of each chunk of the Ollama chat response.
+        """
+    async def stream_chat_response_from_ollama(self,prompt_with_context:str,input:str):
+
+        # Constructs the messages for Ollama.
+        messages = [
+            {
+                "role": "system",
+                "content": prompt_with_context
+            },
+            {
+                "role": "user",
+                "content": input
+            }
+        ]
+        # Generates the response from Ollama, a chunk at a time.
+        async for chunk in await ollama_async_client().generate(model=self.model_data["model_version"], prompt=str(messages), stream=True):
+            yield chunk.response
@@ -0,0 +1,155 @@
+"""Record the progress of an ingest run so a failed run can carry on where it stopped."""
+
+import os
+import sqlite3
+
+import surrealdb_rag.helpers.constants as constants
+
+
+def file_run_key(name:str, file_path:str, *parts) -> str:
+    """
+    Builds a run key for an ingest of a file. The key includes the size and modification time of
+    the file, so progress recorded for an older version of the file is never resumed.
+
+    Args:
+        name (str): The name of the ingest, eg the script and table.
+        file_path (str): The input file.
+        *parts: Any other settings that change which rows are read, eg date filters.
+
+    Returns:
+        str: The run key.
+    """
+    stat = os.stat(file_path)
+    return ":".join([name, os.path.abspath(file_path), str(stat.st_size), str(stat.st_mtime_ns)] + [str(part) for part in parts])
+
+
+class RunManifest():
+    """
+    Records the rows and items (eg file urls) an ingest run has completed in a small SQLite file.
+
+    Progress is kept per run key, so several scripts and tables can share the manifest file. On
+    opening, the completed rows of the run are loaded into a bitmap and the processed items into a
+    set, so resume checks are O(1) lookups. Completed rows are stored as (start, stop) ranges, one
+    per batch, so the manifest stays small for millions of rows.
+
+    Usage:
+        with RunManifest(file_run_key("insert_edgar", input_file)) as manifest:
+            if not resume:
+                manifest.reset()
+            for row_index, row in enumerate(rows):
+                if manifest.is_row_done(row_index):
+                    continue
+                ...
+            manifest.mark_rows_done(batch_row_indexes)
+    """
+
+    def __init__(self, run_key:str, manifest_file:str = constants.RUN_MANIFEST_PATH):
+        """
+        Opens the manifest file, creating it if missing, and loads the progress of the run.
+
+        Args:
+            run_key (str): Identifies the run, see `file_run_key`.
+            manifest_file (str, optional): The SQLite file. Defaults to constants.RUN_MANIFEST_PATH.
+        """
+        self.run_key = run_key
+        self.manifest_file = manifest_file
+        folder = os.path.dirname(manifest_file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(manifest_file)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS completed_rows (run_key TEXT, start INTEGER, stop INTEGER)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS completed_rows_run_key ON completed_rows (run_key)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS processed_items (run_key TEXT, item TEXT, PRIMARY KEY (run_key, item))")
+        self.connection.commit()
+
+        self.completed_rows = bytearray()
+        self.completed_row_count = 0
+        for start, stop in self.connection.execute("SELECT start, stop FROM completed_rows WHERE run_key = ?", (run_key,)):
+            self.set_rows_done(start, stop)
+        self.processed_items = {item for (item,) in self.connection.execute("SELECT item FROM processed_items WHERE run_key = ?", (run_key,))}
+
+    def reset(self) -> None:
+        """
+        Forgets the progress of the run, for a run that starts over.
+        """
+        self.connection.execute("DELETE FROM completed_rows WHERE run_key = ?", (self.run_key,))
+        self.connection.execute("DELETE FROM processed_items WHERE run_key = ?", (self.run_key,))
+        self.connection.commit()
+        self.completed_rows = bytearray()
+        self.completed_row_count = 0
+        self.processed_items = set()
+
+    def set_rows_done(self, start:int, stop:int) -> None:
+        """
+        Sets a range of rows in the in-memory bitmap.
+
+        Args:
+            start (int): The first row.
+            stop (int): The row after the last row.
+        """
+        if stop > len(self.completed_rows):
+            self.completed_rows.extend(bytes(stop - len(self.completed_rows)))
+        self.completed_row_count += (stop - start) - self.completed_rows[start:stop].count(1)
+        self.completed_rows[start:stop] = b"\x01" * (stop - start)
+
+    def is_row_done(self, row:int) -> bool:
+        """
+        Args:
+            row (int): The index of the row in the input.
+
+        Returns:
+            bool: True if the row was written by an earlier attempt of the run.
+        """
+        return row < len(self.completed_rows) and self.completed_rows[row] == 1
+
+    def mark_rows_done(self, rows:list[int]) -> None:
+        """
+        Records rows as written. Consecutive rows are stored as one range.
+
+        Args:
+            rows (list[int]): The indexes of the rows, in ascending order.
+        """
+        ranges = []
+        for row in rows:
+            if ranges and ranges[-1][1] == row:
+                ranges[-1][1] = row + 1
+            else:
+                ranges.append([row, row + 1])
+        self.connection.executemany("INSERT INTO completed_rows (run_key, start, stop) VALUES (?, ?, ?)",
+                                    [(self.run_key, start, stop) for start, stop in ranges])
+        self.connection.commit()
+        for start, stop in ranges:
+            self.set_rows_done(start, stop)
+
+    def is_processed(self, item:str) -> bool:
+        """
+        Args:
+            item (str): The item, eg a file url.
+
+        Returns:
+            bool: True if the item was processed by an earlier attempt of the run.
+        """
+        return item in self.processed_items
+
+    def mark_processed(self, items:list[str]) -> None:
+        """
+        Records items as processed.
+
+        Args:
+            items (list[str]): The items, eg file urls.
+        """
+        self.connection.executemany("INSERT OR IGNORE INTO processed_items (run_key, item) VALUES (?, ?)",
+                                    [(self.run_key, item) for item in items])
+        self.connection.commit()
+        self.processed_items.update(items)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,277 @@
+"""Load batches of records into SurrealDB over a pool of concurrent connections."""
+
+import asyncio
+import datetime
+import json
+import os
+import random
+import time
+
+import numpy as np
+from surrealdb import AsyncSurreal
+
+from surrealdb_rag.helpers.params import SurrealParams
+from surrealdb_rag.helpers.adaptive_batcher import AdaptiveBatcher
+
+
+DEFAULT_CONCURRENCY = 4
+"""
+The default number of batches in flight at once, one connection each.
+"""
+
+MAX_RETRY_COUNT = 3
+"""
+The number of times a failed batch is retried before it is written to the dead letter file.
+"""
+
+RETRY_BASE_DELAY = 0.5
+"""
+The delay in seconds before the first retry; it doubles with each further retry.
+"""
+
+RETRY_MAX_DELAY = 30
+"""
+The upper limit in seconds of the retry delay.
+"""
+
+
+def dead_letter_default(value):
+    """
+    json.dumps fallback for the values found in batch parameters (numpy types, record ids).
+
+    Args:
+        value: A value json can't serialize.
+
+    Returns:
+        A serializable version of the value.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class SurrealBatchLoader():
+    """
+    Executes batches of SurrealQL against SurrealDB with several batches in flight at once.
+
+    One AsyncSurreal connection is opened per concurrent writer and kept open for the whole load.
+    Batches wait in a bounded queue, so a producer that reads faster than the database writes
+    waits in `submit` instead of holding the whole corpus in memory.
+
+    If an AdaptiveBatcher is given, the round-trip time of each written batch is passed to it so it
+    can tune the size of the batches still being read.
+
+    A batch is a list of (surql, params) steps run in order on one connection. A failed step is
+    retried on a fresh connection with exponential backoff and jitter, carrying on from the step
+    that failed. If it still fails and a dead letter file is set, the remaining steps are appended
+    to it as a json line and the load carries on; otherwise the load stops with the error.
+
+    Usage:
+        async with SurrealBatchLoader(db_params.DB_PARAMS, concurrency=4) as loader:
+            for batch in batches:
+                await loader.submit(surql, {"records": batch}, len(batch))
+    """
+
+    def __init__(self, connection_params:SurrealParams, concurrency:int = DEFAULT_CONCURRENCY,
+                 queue_size:int = None, on_batch_written = None, dead_letter_file:str = None,
+                 max_retries:int = MAX_RETRY_COUNT, logger = None, batcher:AdaptiveBatcher = None):
+        """
+        Initializes the SurrealBatchLoader.
+
+        Args:
+            connection_params (SurrealParams): The SurrealDB connection parameters.
+            concurrency (int, optional): The number of connections writing batches at once. Defaults to DEFAULT_CONCURRENCY.
+            queue_size (int, optional): The number of batches that can wait for a writer. Defaults to twice the concurrency.
+            on_batch_written (callable, optional): Called with the row count of each batch after it is done (written or dead lettered), eg to update a progress bar.
+            dead_letter_file (str, optional): The json lines file failed batches are appended to. Defaults to None, stop on the first failed batch.
+            max_retries (int, optional): The number of retries of a failed batch. Defaults to MAX_RETRY_COUNT.
+            logger (logging.Logger, optional): Logger for retries and dead lettered batches.
+            batcher (AdaptiveBatcher, optional): Told the round-trip time of each batch written first time. Defaults to None.
+        """
+        self.connection_params = connection_params
+        self.concurrency = max(1, int(concurrency))
+        self.queue_size = queue_size or self.concurrency * 2
+        self.on_batch_written = on_batch_written
+        self.dead_letter_file = dead_letter_file
+        self.max_retries = max_retries
+        self.logger = logger
+        self.batcher = batcher
+        self.connections = []
+        self.writers = []
+        self.queue = None
+        self.error = None
+        self.failed_batches = 0
+
+    async def connect(self):
+        """
+        Opens a connection, signs in and selects the namespace and database.
+
+        Returns:
+            The AsyncSurreal connection.
+        """
+        connection = AsyncSurreal(self.connection_params.url)
+        if self.connection_params.username:
+            await connection.signin({"username": self.connection_params.username, "password": self.connection_params.password})
+        await connection.use(self.connection_params.namespace, self.connection_params.database)
+        return connection
+
+    async def reconnect(self, writer_index:int):
+        """
+        Replaces a writer's connection after a failure, in case the connection itself was the problem.
+
+        Args:
+            writer_index (int): The index of the writer's connection.
+
+        Returns:
+            The new AsyncSurreal connection.
+        """
+        try:
+            await self.connections[writer_index].close()
+        except Exception:
+            pass
+        self.connections[writer_index] = await self.connect()
+        return self.connections[writer_index]
+
+    async def __aenter__(self):
+        connections = await asyncio.gather(*[self.connect() for _ in range(self.concurrency)], return_exceptions=True)
+        errors = [connection for connection in connections if isinstance(connection, BaseException)]
+        if errors:
+            # __aexit__ does not run when __aenter__ raises, so the connections that did open are closed here
+            for connection in connections:
+                if not isinstance(connection, BaseException):
+                    await connection.close()
+            raise errors[0]
+        self.connections = list(connections)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.writers = [asyncio.create_task(self.write_batches(writer_index)) for writer_index in range(self.concurrency)]
+        return self
+
+    async def write_batches(self, writer_index:int) -> None:
+        """
+        Writer task: executes batches from the queue on its own connection until it gets the stop marker.
+        After a batch fails with no dead letter file the remaining batches are drained without being written.
+
+        Args:
+            writer_index (int): The index of the connection owned by this writer.
+        """
+        while True:
+            item = await self.queue.get()
+            try:
+                if item is None:
+                    return
+                steps, row_count, batch_bytes, on_written = item
+                if self.error is None:
+                    if await self.write_batch(writer_index, steps, batch_bytes) and on_written:
+                        on_written()
+                    if self.on_batch_written:
+                        self.on_batch_written(row_count)
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+            finally:
+                self.queue.task_done()
+
+    async def write_batch(self, writer_index:int, steps:list[tuple], batch_bytes:int = 0) -> bool:
+        """
+        Runs the steps of a batch in order, retrying from the failed step with exponential backoff and jitter.
+        The round-trip time of a batch written at the first attempt is passed to the batcher.
+
+        Args:
+            writer_index (int): The index of the writer's connection.
+            steps (list[tuple]): The (surql, params) steps of the batch.
+            batch_bytes (int, optional): The estimated payload size of the batch. Defaults to 0.
+
+        Returns:
+            bool: True if the batch was written, False if it was written to the dead letter file.
+
+        Raises:
+            Exception: If the batch still fails after the retries and there is no dead letter file.
+        """
+        completed_steps = 0
+        for attempt in range(self.max_retries + 1):
+            try:
+                if attempt > 0:
+                    # full jitter: spread the retries of concurrent writers over the backoff window
+                    await asyncio.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))))
+                    await self.reconnect(writer_index)
+                start = time.perf_counter()
+                for surql, params in steps[completed_steps:]:
+                    SurrealParams.ParseResponseForErrors(await self.connections[writer_index].query_raw(surql, params=params))
+                    completed_steps += 1
+                if self.batcher and attempt == 0:
+                    self.batcher.observe(batch_bytes, time.perf_counter() - start)
+                return True
+            except Exception as e:
+                error = e
+                if self.logger and attempt < self.max_retries:
+                    self.logger.warning(f"Batch failed, retry {attempt + 1} of {self.max_retries}: {e}")
+
+        if not self.dead_letter_file:
+            raise Exception(f"Failed to insert batch after multiple retries {error}")
+        self.write_dead_letter(steps[completed_steps:], error)
+        return False
+
+    def write_dead_letter(self, steps:list[tuple], error:Exception) -> None:
+        """
+        Appends the failed steps of a batch to the dead letter file as a json line so they can be replayed.
+
+        Args:
+            steps (list[tuple]): The (surql, params) steps that were not written.
+            error (Exception): The last error.
+        """
+        self.failed_batches += 1
+        folder = os.path.dirname(self.dead_letter_file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.dead_letter_file, "a") as f:
+            f.write(json.dumps({
+                "time": datetime.datetime.now().isoformat(),
+                "error": str(error),
+                "steps": [{"surql": surql, "params": params} for surql, params in steps],
+            }, default=dead_letter_default) + "\n")
+        if self.logger:
+            self.logger.error(f"Batch failed after {self.max_retries} retries, written to {self.dead_letter_file}: {error}")
+
+    async def submit(self, surql:str, params:dict = None, row_count:int = 1, batch_bytes:int = 0, on_written = None) -> None:
+        """
+        Queues a batch of a single query, waiting while the queue is full.
+
+        Args:
+            surql (str): The SurrealQL to execute.
+            params (dict, optional): The query parameters, eg {"records": rows}.
+            row_count (int, optional): The number of rows in the batch, passed to on_batch_written. Defaults to 1.
+            batch_bytes (int, optional): The estimated payload size, passed to the batcher. Defaults to 0.
+            on_written (callable, optional): Called with no arguments once the batch is written, not if it is dead lettered, eg to record it in a RunManifest.
+
+        Raises:
+            Exception: The error of an earlier batch that failed.
+        """
+        await self.submit_steps([(surql, params)], row_count, batch_bytes, on_written)
+
+    async def submit_steps(self, steps:list[tuple], row_count:int = 1, batch_bytes:int = 0, on_written = None) -> None:
+        """
+        Queues a batch of queries that run in order on one connection, waiting while the queue is full.
+
+        Args:
+            steps (list[tuple]): The (surql, params) steps of the batch.
+            row_count (int, optional): The number of rows in the batch, passed to on_batch_written. Defaults to 1.
+            batch_bytes (int, optional): The estimated payload size, passed to the batcher. Defaults to 0.
+            on_written (callable, optional): Called with no arguments once the batch is written, not if it is dead lettered.
+
+        Raises:
+            Exception: The error of an earlier batch that failed.
+        """
+        if self.error:
+            raise self.error
+        await self.queue.put((steps, row_count, batch_bytes, on_written))
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        for _ in self.writers:
+            await self.queue.put(None)
+        await asyncio.gather(*self.writers)
+        for connection in self.connections:
+            await connection.close()
+        if self.error and exc_type is None:
+            raise self.error
@@ -1,3 +1,4 @@
+from surrealdb import RecordID
 
 
 class SurrealDML():
@@ -63,7 +64,8 @@ class SurrealDML():
                     UPSERT corpus_table_model:[corpus_table:{TABLE_NAME},$model_definition] SET model = $model_definition,field_name = $model.field_name, corpus_table=corpus_table:{TABLE_NAME};
                 }};
                 UPSERT corpus_table:{TABLE_NAME} SET table_name = '{TABLE_NAME}', display_name = '{DISPLAY_NAME}', chunk_size = $chunk_size,
-                    embed_models = (SELECT value id FROM corpus_table_model WHERE corpus_table = corpus_table:{TABLE_NAME}) RETURN NONE;
+                    embed_models = (SELECT value id FROM corpus_table_model WHERE corpus_table = corpus_table:{TABLE_NAME}),
+                    loaded_at = time::now() RETURN NONE;
                     
             """
     
@@ -101,6 +103,23 @@ class SurrealDML():
                 relation_date_field = $relation_date_field,
                 entity_date_field = $entity_date_field
                   RETURN NONE;
+
+                UPDATE corpus_table:{TABLE_NAME} SET loaded_at = time::now() RETURN NONE;
+            """
+
+    def MARK_CORPUS_TABLE_LOADED(TABLE_NAME:str):
+        """
+        SurrealQL query to record that rows were loaded into a corpus table, or its graph tables,
+        without rewriting its info. The app drops what it has cached for the corpus when `loaded_at` changes.
+
+        Args:
+            TABLE_NAME (str): The name of the corpus table.
+
+        Returns:
+            str: The SurrealQL query string.
+        """
+        return f"""
+                UPDATE corpus_table:{TABLE_NAME} SET loaded_at = time::now() RETURN NONE;
             """
     
 
@@ -285,6 +304,9 @@ class SurrealDML():
         """
         SurrealQL query to upsert records in a corpus graph relation table.
 
+        Each relation has the id `graph_relation_key` builds, and a relation with that id is deleted
+        before it is related again, so writing the same rows twice leaves one edge for each.
+
         Args:
             ENTITY_TABLE_NAME (str): The name of the entity table.
             RELATE_TABLE_NAME (str): The name of the relation table.
@@ -300,9 +322,11 @@ class SurrealDML():
         FOR $row IN $records {{
             LET $ent1 = type::thing("{ENTITY_TABLE_NAME}",$row.entity1);
             LET $ent2 = type::thing("{ENTITY_TABLE_NAME}",$row.entity2);
+            LET $relation = type::thing("{RELATE_TABLE_NAME}",[$row.entity1,$row.entity2,$row.relationship]);
+            DELETE $relation;
             RELATE 
             $ent1
-                -> {RELATE_TABLE_NAME} -> 
+                -> $relation -> 
             $ent2
                   CONTENT {{
                 source_document : type::thing("{SOURCE_DOCUMENT_TABLE_NAME}",$row.url),
@@ -316,3 +340,293 @@ class SurrealDML():
         }};
     """
 
+
+
+
+    def BULK_INSERT_RECORDS(TABLE_NAME:str):
+        """
+        SurrealQL query to insert records into a corpus table with one array INSERT.
+
+        The records must be built with `bulk_corpus_records`, so the ids are set and missing
+        values are left out client-side instead of per row on the server.
+
+        Args:
+            TABLE_NAME (str): The name of the corpus table to insert into.
+
+        Returns:
+            str: The SurrealQL query string.
+        """
+        return f"""
+        INSERT INTO {TABLE_NAME} $records RETURN NONE;
+    """
+
+
+    def BULK_UPSERT_RECORDS(TABLE_NAME:str):
+        """
+        SurrealQL query to upsert records in a corpus table with one array INSERT.
+
+        Existing records have all their fields replaced, like the CONTENT of `UPSERT_RECORDS`.
+        The records must be built with `bulk_corpus_records`.
+
+        Args:
+            TABLE_NAME (str): The name of the corpus table to upsert into.
+
+        Returns:
+            str: The SurrealQL query string.
+        """
+        return f"""
+        INSERT INTO {TABLE_NAME} $records ON DUPLICATE KEY UPDATE
+            url = $input.url,
+            title = $input.title,
+            text = $input.text,
+            content_glove_vector = $input.content_glove_vector,
+            content_openai_vector = $input.content_openai_vector,
+            content_fasttext_vector = $input.content_fasttext_vector,
+            additional_data = $input.additional_data
+        RETURN NONE;
+    """
+
+
+    def BULK_UPSERT_SOURCE_DOCUMENTS(TABLE_NAME:str):
+        """
+        SurrealQL query to upsert records in a source document table with one array INSERT.
+        The records must be built with `bulk_source_document_records`.
+
+        Args:
+            TABLE_NAME (str): The name of the source document table to upsert into.
+
+        Returns:
+            str: The SurrealQL query string.
+        """
+        return f"""
+        INSERT INTO {TABLE_NAME} $records ON DUPLICATE KEY UPDATE
+            url = $input.url,
+            title = $input.title,
+            additional_data = $input.additional_data
+        RETURN NONE;
+    """
+
+
+    def BULK_INSERT_GRAPH_ENTITY_RECORDS(TABLE_NAME:str):
+        """
+        SurrealQL query to insert records into a corpus graph entity table with one array INSERT.
+        The records must be built with `bulk_graph_entity_records`.
+
+        Args:
+            TABLE_NAME (str): The name of the entity table to insert into.
+
+        Returns:
+            str: The SurrealQL query string.
+        """
+        return f"""
+        INSERT INTO {TABLE_NAME} $records RETURN NONE;
+    """
+
+
+    def BULK_UPSERT_GRAPH_ENTITY_RECORDS(TABLE_NAME:str):
+        """
+        SurrealQL query to upsert records in a corpus graph entity table with one array INSERT.
+        The records must be built with `bulk_graph_entity_records`.
+
+        Args:
+            TABLE_NAME (str): The name of the entity table to upsert into.
+
+        Returns:
+            str: The SurrealQL query string.
+        """
+        return f"""
+        INSERT INTO {TABLE_NAME} $records ON DUPLICATE KEY UPDATE
+            source_document = $input.source_document,
+            entity_type = $input.entity_type,
+            identifier = $input.identifier,
+            name = $input.name,
+            contexts = $input.contexts,
+            context_glove_vector = $input.context_glove_vector,
+            context_openai_vector = $input.context_openai_vector,
+            context_fasttext_vector = $input.context_fasttext_vector,
+            additional_data = $input.additional_data
+        RETURN NONE;
+    """
+
+
+    def BULK_INSERT_GRAPH_RELATION_RECORDS(RELATE_TABLE_NAME:str):
+        """
+        SurrealQL query to insert records into a corpus graph relation table with one INSERT RELATION.
+
+        Like RELATE, each record gets a generated id.
+        The records must be built with `bulk_graph_relation_records`.
+
+        Args:
+            RELATE_TABLE_NAME (str): The name of the relation table.
+
+        Returns:
+            str: The SurrealQL query string.
+        """
+        return f"""
+        INSERT RELATION INTO {RELATE_TABLE_NAME} $records RETURN NONE;
+    """
+
+
+    def BULK_UPSERT_GRAPH_RELATION_RECORDS(RELATE_TABLE_NAME:str):
+        """
+        SurrealQL query to upsert records in a corpus graph relation table with one INSERT RELATION.
+
+        Like `UPSERT_GRAPH_RELATION_RECORDS`, writing the same rows twice leaves one edge for each.
+        The records must be built with `bulk_graph_relation_records` with `with_ids`.
+
+        Args:
+            RELATE_TABLE_NAME (str): The name of the relation table.
+
+        Returns:
+            str: The SurrealQL query string.
+        """
+        return f"""
+        INSERT RELATION INTO {RELATE_TABLE_NAME} $records ON DUPLICATE KEY UPDATE
+            source_document = $input.source_document,
+            confidence = $input.confidence,
+            relationship = $input.relationship,
+            contexts = $input.contexts,
+            context_glove_vector = $input.context_glove_vector,
+            context_openai_vector = $input.context_openai_vector,
+            context_fasttext_vector = $input.context_fasttext_vector
+        RETURN NONE;
+    """
+
+
+def graph_relation_key(row:dict) -> list:
+    """
+    The id of a relation in the relation table for the upsert queries: the ids of its two entities
+    and the relationship. The entity ids include the source document, so a relation is only
+    merged with the same relation from the same filing.
+
+    Args:
+        row (dict): The row with entity1, entity2 and relationship.
+
+    Returns:
+        list: The record id.
+    """
+    return [row["entity1"], row["entity2"], row["relationship"]]
+
+
+def without_missing(record:dict) -> dict:
+    """
+    Removes the None values from a record, so the fields are NONE in SurrealDB.
+    This is the client-side version of the `IF $row.field = NULL THEN None` expressions of the FOR queries.
+
+    Args:
+        record (dict): The record.
+
+    Returns:
+        dict: The record without the None values.
+    """
+    return {key: value for key, value in record.items() if value is not None}
+
+
+def bulk_corpus_records(TABLE_NAME:str, rows:list[dict]) -> list[dict]:
+    """
+    Builds the records for `BULK_INSERT_RECORDS` and `BULK_UPSERT_RECORDS` from the rows used by
+    `INSERT_RECORDS`, with the id set from the url.
+
+    Args:
+        TABLE_NAME (str): The name of the corpus table.
+        rows (list[dict]): The rows with url, title, text, content_*_vector and additional_data.
+
+    Returns:
+        list[dict]: The records.
+    """
+    return [
+        without_missing({
+            "id": RecordID(TABLE_NAME, row["url"]),
+            "url": row["url"],
+            "title": row["title"],
+            "text": row["text"],
+            "content_glove_vector": row.get("content_glove_vector"),
+            "content_openai_vector": row.get("content_openai_vector"),
+            "content_fasttext_vector": row.get("content_fasttext_vector"),
+            "additional_data": row.get("additional_data"),
+        })
+        for row in rows
+    ]
+
+
+def bulk_source_document_records(TABLE_NAME:str, rows:list[dict]) -> list[dict]:
+    """
+    Builds the records for `BULK_UPSERT_SOURCE_DOCUMENTS` from the rows used by `UPSERT_SOURCE_DOCUMENTS`.
+
+    Args:
+        TABLE_NAME (str): The name of the source document table.
+        rows (list[dict]): The rows with url, title and additional_data.
+
+    Returns:
+        list[dict]: The records.
+    """
+    return [
+        without_missing({
+            "id": RecordID(TABLE_NAME, row["url"]),
+            "url": row["url"],
+            "title": row["title"],
+            "additional_data": row.get("additional_data"),
+        })
+        for row in rows
+    ]
+
+
+def bulk_graph_entity_records(TABLE_NAME:str, SOURCE_DOCUMENT_TABLE_NAME:str, rows:list[dict]) -> list[dict]:
+    """
+    Builds the records for the bulk graph entity queries from the rows used by `INSERT_GRAPH_ENTITY_RECORDS`.
+
+    Args:
+        TABLE_NAME (str): The name of the entity table.
+        SOURCE_DOCUMENT_TABLE_NAME (str): The name of the source document table.
+        rows (list[dict]): The rows with full_id, url, entity_type, identifier, name, contexts, content_*_vector and additional_data.
+
+    Returns:
+        list[dict]: The records.
+    """
+    return [
+        without_missing({
+            "id": RecordID(TABLE_NAME, row["full_id"]),
+            "source_document": RecordID(SOURCE_DOCUMENT_TABLE_NAME, row["url"]),
+            "entity_type": row["entity_type"],
+            "identifier": row["identifier"],
+            "name": row["name"],
+            "contexts": row.get("contexts"),
+            "context_glove_vector": row.get("content_glove_vector"),
+            "context_openai_vector": row.get("content_openai_vector"),
+            "context_fasttext_vector": row.get("content_fasttext_vector"),
+            "additional_data": row.get("additional_data"),
+        })
+        for row in rows
+    ]
+
+
+def bulk_graph_relation_records(ENTITY_TABLE_NAME:str, SOURCE_DOCUMENT_TABLE_NAME:str, rows:list[dict], with_ids:bool = False, RELATE_TABLE_NAME:str = None) -> list[dict]:
+    """
+    Builds the records for `BULK_INSERT_GRAPH_RELATION_RECORDS` and `BULK_UPSERT_GRAPH_RELATION_RECORDS`
+    from the rows used by `INSERT_GRAPH_RELATION_RECORDS`.
+
+    Args:
+        ENTITY_TABLE_NAME (str): The name of the entity table.
+        SOURCE_DOCUMENT_TABLE_NAME (str): The name of the source document table.
+        rows (list[dict]): The rows with entity1, entity2, url, confidence, relationship, contexts and content_*_vector.
+        with_ids (bool, optional): Set the ids from `graph_relation_key`, for `BULK_UPSERT_GRAPH_RELATION_RECORDS`. Defaults to False.
+        RELATE_TABLE_NAME (str, optional): The name of the relation table, required with `with_ids`. Defaults to None.
+
+    Returns:
+        list[dict]: The records.
+    """
+    return [
+        without_missing({
+            "id": RecordID(RELATE_TABLE_NAME, graph_relation_key(row)) if with_ids else None,
+            "in": RecordID(ENTITY_TABLE_NAME, row["entity1"]),
+            "out": RecordID(ENTITY_TABLE_NAME, row["entity2"]),
+            "source_document": RecordID(SOURCE_DOCUMENT_TABLE_NAME, row["url"]),
+            "confidence": row["confidence"],
+            "relationship": row["relationship"],
+            "contexts": row.get("contexts"),
+            "context_glove_vector": row.get("content_glove_vector"),
+            "context_openai_vector": row.get("content_openai_vector"),
+            "context_fasttext_vector": row.get("content_fasttext_vector"),
+        })
+        for row in rows
+    ]
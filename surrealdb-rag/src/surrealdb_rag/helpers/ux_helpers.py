@@ -1,4 +1,5 @@
 
+import json
 from urllib.parse import quote
 from surrealdb import RecordID
 
@@ -68,6 +69,21 @@ def convert_timestamp_to_date(timestamp: str) -> str:
     return timestamp
 
 
+"""Format a server-sent event for a streamed response.
+
+    The data is JSON encoded so text with new lines stays on the one `data:` line.
+
+    Args:
+        event: The event name, eg "token".
+        data: The event's data.
+
+    Returns:
+        The event, ending with the blank line that dispatches it.
+    """
+def format_server_sent_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 def convert_prompt_graph_to_ux_data(data):
     """
     Converts your specific JSON-like data structure to Sigma.js format.
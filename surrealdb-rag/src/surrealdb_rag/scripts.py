@@ -1,11 +1,16 @@
 
 import subprocess
+import sys
 import surrealdb_rag.helpers.constants as constants
 import datetime
 
 
 URL = ""
 
+def resume_args() -> list:
+    """Passes -rs True to an ingest script when the script alias was run with --resume, eg `uv run insert_wiki --resume`."""
+    return ["-rs", "True"] if "--resume" in sys.argv[1:] else []
+
 def run_process(command: list):
     print(f"Running \n{command}")
     subprocess.run(command, check=True)
@@ -42,7 +47,7 @@ def insert_glove(): # Alias definition IN this file
         "-url",
         URL
     ]
-    run_process(command)
+    run_process(command + resume_args())
 
 
 # python ./src/surrealdb_rag/download_wiki_data.py
@@ -73,7 +78,7 @@ def insert_wiki_fs(): # Alias definition IN this file
         "-url",
         URL
     ]
-    run_process(command)
+    run_process(command + resume_args())
 
 
 # python ./src/surrealdb_rag/wiki_append_vectors_to_csv.py
@@ -93,7 +98,7 @@ def insert_wiki(): # Alias definition IN this file
         "-url",
         URL
     ]
-    run_process(command)
+    run_process(command + resume_args())
 
 
 
@@ -122,7 +127,7 @@ def setup_edgar_graph():
 
 
 def edgar_graph_extraction():
-    run_process(["python", "./src/surrealdb_rag/data_processing/edgar_graph_extractor.py"])
+    run_process(["python", "./src/surrealdb_rag/data_processing/edgar_graph_extractor.py"] + resume_args())
 
 def insert_edgar_graph(il=True,delta_days=5):
     end_date = datetime.date.today()
@@ -137,7 +142,7 @@ def insert_edgar_graph(il=True,delta_days=5):
         "-tn","embedded_edgar",
         "-il", str(il)
     ]
-    run_process(command)
+    run_process(command + resume_args())
 
 
 def incriment_latest_edgar():
@@ -190,7 +195,7 @@ def insert_edgar_fs(): # Alias definition IN this file
         "-url",
         URL
     ]
-    run_process(command)
+    run_process(command + resume_args())
 
 
 # python ./src/surrealdb_rag/edgar_build_csv_append_vectors.py
@@ -218,10 +223,10 @@ def insert_edgar(il=True): # Alias definition IN this file
         "-url", URL,
         "-il", str(il)
     ]
-    run_process(command)
+    run_process(command + resume_args())
 
 
-AI_EDGAR_FILE = constants.DEFAULT_EDGAR_PATH.replace(".csv", "_ai.csv")
+AI_EDGAR_FILE = constants.DEFAULT_EDGAR_PATH.replace(".parquet", "_ai.parquet")
 def add_vectors_to_ai_industry_edgar():
     ai_related_sic = [
         "3674",  # Semiconductors and Related Devices (e.g., Nvidia)
@@ -249,7 +254,7 @@ def insert_ai_industry_edgar():
         URL,
         "-il", False
     ]
-    run_process(command)
+    run_process(command + resume_args())
 
 
 def add_ai_edgar_data():
@@ -257,7 +262,7 @@ def add_ai_edgar_data():
     insert_ai_industry_edgar()
 
 
-LARGE_CHUNK_EDGAR_FILE = constants.DEFAULT_EDGAR_PATH.replace(".csv", "_lc.csv")
+LARGE_CHUNK_EDGAR_FILE = constants.DEFAULT_EDGAR_PATH.replace(".parquet", "_lc.parquet")
 def add_vectors_to_large_chunk_edgar():
     run_process(["python", "./src/surrealdb_rag/data_processing/edgar_build_csv_append_vectors.py"
                  "-of", LARGE_CHUNK_EDGAR_FILE,
@@ -278,7 +283,7 @@ def insert_large_chunk_edgar():
         "-if", LARGE_CHUNK_EDGAR_FILE,
         "-il", False
     ]
-    run_process(command)  
+    run_process(command + resume_args())  
 
 
 def add_large_chunk_edgar_data():
@@ -0,0 +1,60 @@
+"""Parity of the blocked name merge with the fuzzywuzzy merge it replaced."""
+
+import random
+
+import pytest
+
+import surrealdb_rag.data_processing.name_matching as name_matching
+from surrealdb_rag.data_processing.name_matching import merge_people_names
+from surrealdb_rag.benchmarks.benchmark_name_matching import legacy_merge_people_names
+
+
+FIRST_NAMES = ["John", "Jon", "Marie", "María", "Robert", "R.", "José", "Jose", "Zoë", "Zoe", "Tim", "Timothy"]
+LAST_NAMES = ["Cook", "Cooke", "Smith", "Smyth", "Garcia", "García", "Muller", "Müller", "Peña", "Pena",
+              "Nuñez", "Nunez", "Lee", "Li", "O'Brien", "OBrien"]
+
+
+def proxy_people(seed:int, person_count:int = 120) -> list[dict]:
+    """
+    The PERSON mentions of a proxy statement like filing, as full names, with a middle initial,
+    with a title, as the surname alone or with an initial, including accented and near-miss surnames.
+    """
+    rng = random.Random(seed)
+    people = [(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice("ABCDEFGHJKLMNPRSTW")) for _ in range(25)]
+    mentions = []
+    for i in range(person_count):
+        first, last, initial = rng.choice(people)
+        name = rng.choice([f"{first} {last}", f"{first} {initial}. {last}", f"Mr. {last}", f"Ms. {last}",
+                           last, f"{first[0]}. {last}", f"{last}, {first}"])
+        mentions.append({"name": name, "contexts": [f"Sentence {i} about {name}."]})
+    return mentions
+
+
+def assert_same_merge(people:list[dict]) -> None:
+    legacy = legacy_merge_people_names(people)
+    merged = merge_people_names(people)
+    assert list(merged.keys()) == list(legacy.keys())
+    assert merged == legacy
+
+
+@pytest.fixture(params=["exact", "blocked"])
+def matching_path(request, monkeypatch):
+    """Runs a test on the path scoring every pair and on the blocked path used above EXACT_MAX_NAMES."""
+    if request.param == "blocked":
+        monkeypatch.setattr(name_matching, "EXACT_MAX_NAMES", 0)
+    return request.param
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_merge_matches_fuzzywuzzy(matching_path, seed):
+    assert_same_merge(proxy_people(seed))
+
+
+@pytest.mark.parametrize("names", [
+    ["Marie E. Garcia", "Mr. García", "Garcia"],
+    ["Mr. Cooke", "R. Cook", "Cook", "Tim Cook"],
+    ["John Smith", "Jon Smyth", "Mr. Smyth", "Smith"],
+    ["Zoë Müller", "Zoe Muller", "Ms. Müller"],
+])
+def test_accented_and_near_miss_names(matching_path, names):
+    assert_same_merge([{"name": name, "contexts": [f"About {name}."]} for name in names])